@@ -0,0 +1,253 @@
+# broker.py
+"""
+Minimal in-process MQTT 3.1.1 broker for benchmarks.
+
+Implements just what the backend and the Pis use: CONNECT (with last will), SUBSCRIBE
+and UNSUBSCRIBE with + and # wildcards, PUBLISH at QoS 0/1 with retained messages,
+PINGREQ and DISCONNECT. QoS 1 publishes are acknowledged to the sender but delivered
+at QoS 0, since nothing is lost on localhost. No authentication, no persistence.
+"""
+import asyncio
+import logging
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT topic filter matching with single-level (+) and multi-level (#) wildcards."""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for idx, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if idx >= len(topic_parts) or (part != "+" and part != topic_parts[idx]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+def _publish_packet(topic: str, payload: bytes, retain: bool = False) -> bytes:
+    return _packet(PUBLISH, 1 if retain else 0, _encode_string(topic) + payload)
+
+
+class _Reader:
+    """Cursor over a packet body."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def uint16(self) -> int:
+        value = struct.unpack_from("!H", self.data, self.pos)[0]
+        self.pos += 2
+        return value
+
+    def byte(self) -> int:
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def binary(self) -> bytes:
+        length = self.uint16()
+        value = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return value
+
+    def string(self) -> str:
+        return self.binary().decode("utf-8")
+
+    def rest(self) -> bytes:
+        return self.data[self.pos:]
+
+    def remaining(self) -> int:
+        return len(self.data) - self.pos
+
+
+class _Session:
+    def __init__(self, client_id: str, writer: asyncio.StreamWriter):
+        self.client_id = client_id
+        self.writer = writer
+        self.subscriptions: Dict[str, int] = {}
+        self.will: Optional[Tuple[str, bytes, bool]] = None
+
+    def send(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+
+class MiniBroker:
+    """Asyncio MQTT broker stand-in; run it on a loop with start() or in a thread with start_in_thread()."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 1883):
+        self.host = host
+        self.port = port
+        self.sessions: Dict[str, _Session] = {}
+        self.retained: Dict[str, bytes] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.published = 0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"[MiniBroker] Listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            for session in list(self.sessions.values()):
+                session.writer.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def start_in_thread(self):
+        """Run the broker on its own event loop in a daemon thread; returns once it is listening."""
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="mini-broker", daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def stop_thread(self):
+        if self.loop is not None and self.thread is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result(5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+
+    async def _read_packet(self, reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+        header = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await reader.readexactly(length) if length else b""
+        return header >> 4, header & 0x0F, body
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session: Optional[_Session] = None
+        clean_disconnect = False
+        try:
+            packet_type, _, body = await self._read_packet(reader)
+            if packet_type != CONNECT:
+                return
+            session = self._connect(_Reader(body), writer)
+            session.send(_packet(CONNACK, 0, b"\x00\x00"))
+
+            while True:
+                packet_type, flags, body = await self._read_packet(reader)
+                if packet_type == PUBLISH:
+                    self._publish(session, flags, _Reader(body))
+                elif packet_type == SUBSCRIBE:
+                    self._subscribe(session, _Reader(body))
+                elif packet_type == UNSUBSCRIBE:
+                    packet = _Reader(body)
+                    packet_id = packet.uint16()
+                    while packet.remaining():
+                        session.subscriptions.pop(packet.string(), None)
+                    session.send(_packet(UNSUBACK, 0, struct.pack("!H", packet_id)))
+                elif packet_type == PINGREQ:
+                    session.send(_packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    clean_disconnect = True
+                    return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if session is not None and self.sessions.get(session.client_id) is session:
+                del self.sessions[session.client_id]
+                if not clean_disconnect and session.will is not None:
+                    self._route(*session.will)
+            writer.close()
+
+    def _connect(self, packet: _Reader, writer: asyncio.StreamWriter) -> _Session:
+        packet.string()  # protocol name
+        packet.byte()  # protocol level
+        flags = packet.byte()
+        packet.uint16()  # keepalive
+        client_id = packet.string() or f"anonymous-{id(writer)}"
+
+        session = _Session(client_id, writer)
+        if flags & 0x04:
+            will_topic = packet.string()
+            will_payload = packet.binary()
+            session.will = (will_topic, will_payload, bool(flags & 0x20))
+        # Username and password, if any, are accepted as-is
+
+        previous = self.sessions.get(client_id)
+        if previous is not None:
+            previous.writer.close()
+        self.sessions[client_id] = session
+        return session
+
+    def _publish(self, session: _Session, flags: int, packet: _Reader):
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        topic = packet.string()
+        if qos:
+            session.send(_packet(PUBACK, 0, struct.pack("!H", packet.uint16())))
+        self._route(topic, packet.rest(), retain)
+
+    def _route(self, topic: str, payload: bytes, retain: bool):
+        self.published += 1
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        data = _publish_packet(topic, payload)
+        for session in list(self.sessions.values()):
+            if any(topic_matches(topic_filter, topic) for topic_filter in session.subscriptions):
+                session.send(data)
+
+    def _subscribe(self, session: _Session, packet: _Reader):
+        packet_id = packet.uint16()
+        granted: List[int] = []
+        new_filters = []
+        while packet.remaining():
+            topic_filter = packet.string()
+            qos = packet.byte() & 0x03
+            session.subscriptions[topic_filter] = qos
+            new_filters.append(topic_filter)
+            granted.append(min(qos, 1))
+        session.send(_packet(SUBACK, 0, struct.pack("!H", packet_id) + bytes(granted)))
+
+        for topic, payload in self.retained.items():
+            if any(topic_matches(topic_filter, topic) for topic_filter in new_filters):
+                session.send(_publish_packet(topic, payload, retain=True))
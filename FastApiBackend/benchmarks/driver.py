@@ -0,0 +1,120 @@
+# driver.py
+"""
+Closed-loop load driver for POST /network/data-transfer-rate.
+
+`concurrency` workers each send one request at a time until `total_requests` have been sent.
+Every request picks a random source, destination, optional forwarders and channel from the
+virtual fleet. The report covers throughput, end-to-end latency percentiles, errors, and
+(when a sampler is given) threadpool saturation and scheduler backlog over the run.
+"""
+import asyncio
+import math
+import random
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import httpx
+
+
+Sampler = Callable[[], Awaitable[Dict[str, float]]]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in [0, 100]); 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def build_request(ips: List[str], channels: List[int], hops: int, allow_cache: bool) -> Dict[str, Any]:
+    nodes = random.sample(ips, hops + 2)
+    request = {
+        "source": nodes[0],
+        "destination": nodes[-1],
+        "path": nodes[1:-1],
+        "wireless_channel": random.choice(channels)
+    }
+    if not allow_cache:
+        request["max_age"] = 0
+    return request
+
+
+async def _sample_loop(sampler: Sampler, samples: List[Dict[str, float]], interval: float, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            samples.append(await sampler())
+        except Exception:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(base_url: str, ips: List[str], total_requests: int = 200, concurrency: int = 20,
+                   channels: Optional[List[int]] = None, hops: int = 0, allow_cache: bool = False,
+                   timeout: float = 120.0, sampler: Optional[Sampler] = None,
+                   sample_interval: float = 0.1) -> Dict[str, Any]:
+    """Drive the endpoint and return the benchmark report."""
+    channels = channels or [1, 6, 11, 36, 40, 44, 48]
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    issued = 0
+    samples: List[Dict[str, float]] = []
+    stop_sampling = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal issued
+            while issued < total_requests:
+                issued += 1
+                body = build_request(ips, channels, hops, allow_cache)
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/network/data-transfer-rate", json=body)
+                    statuses[response.status_code] += 1
+                    if response.status_code == 200:
+                        latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+
+        sampling = asyncio.create_task(_sample_loop(sampler, samples, sample_interval, stop_sampling)) if sampler else None
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+        stop_sampling.set()
+        if sampling is not None:
+            await sampling
+
+    report: Dict[str, Any] = {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "hops": hops,
+        "completed": len(latencies),
+        "errors": {str(status): count for status, count in statuses.items() if status != 200},
+        "duration_s": round(duration, 2),
+        "measurements_per_s": round(len(latencies) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            "max": round(max(latencies) * 1000, 1) if latencies else 0.0
+        }
+    }
+    if samples:
+        busy = [sample["threadpool_busy"] for sample in samples]
+        total = samples[-1]["threadpool_total"]
+        report["threadpool"] = {
+            "size": int(total),
+            "max_busy": int(max(busy)),
+            "mean_utilisation": round(sum(busy) / len(busy) / total, 3) if total else 0.0,
+            "saturated_fraction": round(sum(1 for b in busy if b >= total) / len(busy), 3)
+        }
+        report["scheduler"] = {
+            "max_running": int(max(sample["scheduler_running"] for sample in samples)),
+            "max_pending": int(max(sample["scheduler_pending"] for sample in samples))
+        }
+    return report
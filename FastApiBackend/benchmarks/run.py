@@ -0,0 +1,168 @@
+# run.py
+"""
+Hardware-free throughput benchmark of the backend.
+
+Starts the MiniBroker, a fleet of virtual Pis and the FastAPI app (uvicorn, in-process),
+drives /network/data-transfer-rate and prints measurements/s, p50/p99 latency and
+threadpool saturation. Run from FastApiBackend/:
+
+    python -m benchmarks.run --devices 20 --requests 300 --concurrency 30
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from benchmarks.broker import MiniBroker
+from benchmarks.driver import run_load
+from benchmarks.virtual_pi import VirtualFleet
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load-test the backend against a virtual Pi fleet")
+    parser.add_argument("--devices", type=int, default=20, help="Number of virtual Pis")
+    parser.add_argument("--requests", type=int, default=200, help="Total measurements to request")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight at once")
+    parser.add_argument("--hops", type=int, default=0, help="Forwarders per measurement path")
+    parser.add_argument("--channels", default="1,6,11,36,40,44,48", help="Comma-separated channels to pick from")
+    parser.add_argument("--setup-latency", type=float, default=0.2, help="Seconds a Pi takes to configure a role")
+    parser.add_argument("--iperf-latency", type=float, default=1.0, help="Seconds a client's iperf run takes")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Relative +/- jitter on both latencies")
+    parser.add_argument("--workers", type=int, default=None, help="MEASUREMENT_WORKERS for the backend")
+    parser.add_argument("--allow-cache", action="store_true", help="Let the backend answer from its result cache")
+    parser.add_argument("--broker-port", type=int, default=18830)
+    parser.add_argument("--port", type=int, default=18000, help="Port for the in-process backend")
+    parser.add_argument("--backend-url", default=None,
+                        help="Benchmark an already running backend (connected to --broker-port) instead")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args()
+
+
+def configure_backend_environment(args: argparse.Namespace):
+    """Point the backend at the local broker and keep its logs out of ./logs. Must run before importing main."""
+    log_dir = tempfile.mkdtemp(prefix="dtr-bench-")
+    os.environ["MQTT_BROKER_HOST"] = "127.0.0.1"
+    os.environ["MQTT_BROKER_PORT"] = str(args.broker_port)
+    os.environ["MEASUREMENT_LOG_PATH"] = os.path.join(log_dir, "data_transfer_log.csv")
+    os.environ["MEASUREMENT_HISTORY_PATH"] = os.path.join(log_dir, "measurement_history.db")
+    os.environ["TRACE_LOG_PATH"] = os.path.join(log_dir, "traces.jsonl")
+    if args.workers is not None:
+        os.environ["MEASUREMENT_WORKERS"] = str(args.workers)
+
+
+def start_backend(port: int, log_level: str):
+    """Run the app with uvicorn on its own thread and event loop; returns once it serves requests."""
+    import uvicorn
+    import main
+
+    logging.getLogger().setLevel(log_level)
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level=log_level.lower()))
+    thread = threading.Thread(target=server.run, name="backend", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def sample_backend() -> Dict[str, float]:
+    """Threadpool and scheduler occupancy, read on the backend's own event loop."""
+    import anyio.to_thread
+    from services.scheduler import measurement_scheduler
+
+    async def read():
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        status = measurement_scheduler.get_status()
+        return {
+            "threadpool_busy": limiter.borrowed_tokens,
+            "threadpool_total": limiter.total_tokens,
+            "scheduler_running": status["running"],
+            "scheduler_pending": status["pending"]
+        }
+
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(read(), measurement_scheduler.loop))
+
+
+async def wait_for_fleet(base_url: str, device_ids: List[str], timeout: float = 30.0):
+    """Wait until the backend has registered every virtual Pi as online."""
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                devices = (await client.get("/network/devices")).json()
+                online = {device["device_id"] for device in devices if device["online"]}
+                if online.issuperset(device_ids):
+                    return
+            except Exception:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError("Virtual fleet did not register with the backend in time")
+
+
+def print_report(report: Dict):
+    print(f"\nmeasurements:  {report['completed']}/{report['requests']} in {report['duration_s']} s "
+          f"(concurrency {report['concurrency']}, {report['hops']} hop(s))")
+    print(f"throughput:    {report['measurements_per_s']} measurements/s")
+    latency = report["latency_ms"]
+    print(f"latency (ms):  p50 {latency['p50']}  p99 {latency['p99']}  mean {latency['mean']}  max {latency['max']}")
+    if report["errors"]:
+        print(f"errors:        {report['errors']}")
+    if "threadpool" in report:
+        pool = report["threadpool"]
+        print(f"threadpool:    {pool['max_busy']}/{pool['size']} max busy, "
+              f"{pool['mean_utilisation']:.1%} mean utilisation, saturated {pool['saturated_fraction']:.1%} of the time")
+        print(f"scheduler:     max {report['scheduler']['max_running']} running, "
+              f"max {report['scheduler']['max_pending']} pending")
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=args.log_level)
+    configure_backend_environment(args)
+
+    broker = MiniBroker(port=args.broker_port)
+    broker.start_in_thread()
+
+    fleet = VirtualFleet(args.devices, broker_port=args.broker_port, setup_latency=args.setup_latency,
+                         iperf_latency=args.iperf_latency, jitter=args.jitter)
+    fleet.start()
+
+    server = None
+    base_url = args.backend_url
+    if base_url is None:
+        server, backend_thread = start_backend(args.port, args.log_level)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        asyncio.run(wait_for_fleet(base_url, [device.device_id for device in fleet.devices]))
+        report = asyncio.run(run_load(
+            base_url,
+            fleet.ips,
+            total_requests=args.requests,
+            concurrency=args.concurrency,
+            channels=[int(channel) for channel in args.channels.split(",")],
+            hops=args.hops,
+            allow_cache=args.allow_cache,
+            sampler=sample_backend if server is not None else None
+        ))
+        print_report(report)
+        if args.json_path:
+            with open(args.json_path, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2)
+    finally:
+        if server is not None:
+            server.should_exit = True
+            backend_thread.join(10)
+        fleet.stop()
+        broker.stop_thread()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# virtual_pi.py
+"""
+Virtual Raspberry Pis speaking the same MQTT protocol as Raspberry_pi_script/pi_script.py.
+
+Each device announces itself on devices/<id>/announce, sends heartbeats, takes commands on
+command/<id>/req/start, acks server/forwarder setup on command/<id>/res/<request_id> and,
+as a client, publishes the result on telemetry/<request_id>. Setup and iperf are replaced
+by sleeps of configurable length, run on the device's MQTT thread like the real script.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from typing import List
+import paho.mqtt.client as mqtt
+
+
+logger = logging.getLogger(__name__)
+
+
+class VirtualPi:
+    def __init__(self, device_id: str, ip: str, broker_host: str = "127.0.0.1", broker_port: int = 1883,
+                 setup_latency: float = 0.2, iperf_latency: float = 1.0, jitter: float = 0.1,
+                 rate_mbps: float = 50.0, heartbeat_interval: float = 5.0):
+        self.device_id = device_id
+        self.ip = ip
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.setup_latency = setup_latency
+        self.iperf_latency = iperf_latency
+        self.jitter = jitter
+        self.rate_mbps = rate_mbps
+        self.heartbeat_interval = heartbeat_interval
+        self.commands_handled = 0
+        self.stopped = threading.Event()
+
+        self.client = mqtt.Client(client_id=f"virtual-{device_id}")
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.will_set(
+            f"devices/{device_id}/status",
+            json.dumps({"device_id": device_id, "status": "offline"}),
+            qos=1,
+            retain=True
+        )
+
+    def _sleep(self, seconds: float):
+        time.sleep(max(0.0, seconds * random.uniform(1 - self.jitter, 1 + self.jitter)))
+
+    def _on_connect(self, client, userdata, flags, rc):
+        client.subscribe(f"command/{self.device_id}/req/#", 1)
+        client.publish(f"devices/{self.device_id}/announce",
+                       json.dumps({"device_id": self.device_id, "ip": self.ip}), qos=1, retain=True)
+        client.publish(f"devices/{self.device_id}/status",
+                       json.dumps({"device_id": self.device_id, "status": "online"}), qos=1, retain=True)
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            message = json.loads(msg.payload).get("value", {})
+        except json.JSONDecodeError:
+            return
+        role = message.get("role")
+        request_id = message.get("request_id")
+        self.commands_handled += 1
+
+        self._sleep(self.setup_latency)
+        if role in ("server", "forwarder") and request_id:
+            client.publish(f"command/{self.device_id}/res/{request_id}", json.dumps({
+                "device_id": self.device_id,
+                "request_id": request_id,
+                "role": role,
+                "status": "configured"
+            }), qos=1)
+        elif role == "client":
+            self._sleep(self.iperf_latency)
+            topic = f"telemetry/{request_id}" if request_id else "telemetry"
+            client.publish(topic, json.dumps({
+                "device_id": self.device_id,
+                "role": "client",
+                "wireless_channel": message.get("wireless_channel"),
+                "sent_rate_mbps": round(self.rate_mbps * random.uniform(0.8, 1.2), 2),
+                "request_id": request_id
+            }))
+
+    def _heartbeat_loop(self):
+        while not self.stopped.wait(self.heartbeat_interval):
+            self.client.publish(f"devices/{self.device_id}/heartbeat",
+                                json.dumps({"device_id": self.device_id, "ip": self.ip,
+                                            "timestamp": int(time.time() * 1000)}))
+
+    def start(self):
+        self.client.connect(self.broker_host, self.broker_port)
+        self.client.loop_start()
+        threading.Thread(target=self._heartbeat_loop, name=f"heartbeat-{self.device_id}", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+class VirtualFleet:
+    """N virtual Pis named vpi-1..vpi-N with IPs in 10.77.x.y, so they never collide with the real testbed."""
+
+    def __init__(self, size: int, broker_host: str = "127.0.0.1", broker_port: int = 1883,
+                 setup_latency: float = 0.2, iperf_latency: float = 1.0, jitter: float = 0.1,
+                 rate_mbps: float = 50.0):
+        self.devices: List[VirtualPi] = [
+            VirtualPi(f"vpi-{idx}", f"10.77.{idx // 250}.{idx % 250 + 1}", broker_host, broker_port,
+                      setup_latency, iperf_latency, jitter, rate_mbps)
+            for idx in range(1, size + 1)
+        ]
+
+    @property
+    def ips(self) -> List[str]:
+        return [device.ip for device in self.devices]
+
+    def start(self):
+        for device in self.devices:
+            device.start()
+
+    def stop(self):
+        for device in self.devices:
+            device.stop()
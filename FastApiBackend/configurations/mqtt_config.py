@@ -10,4 +10,12 @@ MQTT_USERNAME = os.getenv("MQTT_USERNAME")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
 
 MQTT_COMMAND_TOPIC = os.getenv("MQTT_COMMAND_TOPIC")
-MQTT_STATUS_TOPIC = os.getenv("MQTT_STATUS_TOPIC")
\ No newline at end of file
+MQTT_STATUS_TOPIC = os.getenv("MQTT_STATUS_TOPIC")
+
+# Background reconnect (exponential backoff between these bounds, seconds)
+MQTT_RECONNECT_MIN_DELAY = int(os.getenv("MQTT_RECONNECT_MIN_DELAY", 1))
+MQTT_RECONNECT_MAX_DELAY = int(os.getenv("MQTT_RECONNECT_MAX_DELAY", 60))
+# Commands published while the broker is unreachable are buffered up to this many
+MQTT_OUTBOUND_BUFFER_SIZE = int(os.getenv("MQTT_OUTBOUND_BUFFER_SIZE", 100))
+# Buffered commands older than this are dropped instead of replayed (seconds, defaults to the ack timeout)
+MQTT_OUTBOUND_TTL_SECONDS = float(os.getenv("MQTT_OUTBOUND_TTL_SECONDS", os.getenv("ACK_TIMEOUT_SECONDS", 30)))
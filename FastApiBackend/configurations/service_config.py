@@ -0,0 +1,44 @@
+# service_config.py
+from dotenv import load_dotenv
+import os
+
+load_dotenv()  # Load variables from .env
+
+# Background measurement execution (MEASUREMENT_WORKERS = max measurements running at once)
+MEASUREMENT_WORKERS = int(os.getenv("MEASUREMENT_WORKERS", 4))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 3600))
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", 60))
+# Admission control: measurements allowed to wait for the testbed before new ones get a 429,
+# and the assumed measurement duration until the first one has been timed
+MEASUREMENT_QUEUE_DEPTH = int(os.getenv("MEASUREMENT_QUEUE_DEPTH", 64))
+MEASUREMENT_DURATION_ESTIMATE_SECONDS = float(os.getenv("MEASUREMENT_DURATION_ESTIMATE_SECONDS", 10))
+
+# How long to wait for server/forwarder "configured" acks before triggering the client
+ACK_TIMEOUT_SECONDS = float(os.getenv("ACK_TIMEOUT_SECONDS", 30))
+
+# Devices that haven't sent a heartbeat for this long are treated as offline
+DEVICE_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("DEVICE_HEARTBEAT_TIMEOUT_SECONDS", 30))
+
+# Result cache in front of get_data_transfer_rate
+MEASUREMENT_CACHE_TTL_SECONDS = float(os.getenv("MEASUREMENT_CACHE_TTL_SECONDS", 30))
+MEASUREMENT_CACHE_MAX_ENTRIES = int(os.getenv("MEASUREMENT_CACHE_MAX_ENTRIES", 256))
+
+MEASUREMENT_LOG_PATH = os.getenv("MEASUREMENT_LOG_PATH", "./logs/data_transfer_log.csv")
+# Measurement log: batched background writes, rotated by size ("size") or calendar day ("daily")
+MEASUREMENT_LOG_BATCH_SIZE = int(os.getenv("MEASUREMENT_LOG_BATCH_SIZE", 100))
+MEASUREMENT_LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("MEASUREMENT_LOG_FLUSH_INTERVAL_SECONDS", 1.0))
+MEASUREMENT_LOG_ROTATION = os.getenv("MEASUREMENT_LOG_ROTATION", "daily")
+MEASUREMENT_LOG_MAX_BYTES = int(os.getenv("MEASUREMENT_LOG_MAX_BYTES", 10 * 1024 * 1024))
+
+
+# SQLite history of every measurement, queried by /network/measurements
+MEASUREMENT_HISTORY_PATH = os.getenv("MEASUREMENT_HISTORY_PATH", "./logs/measurement_history.db")
+
+# Measurement timelines: kept in memory for /network/traces and appended to a JSON-lines file when done
+TRACE_STORE_MAX_TRACES = int(os.getenv("TRACE_STORE_MAX_TRACES", 1000))
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "./logs/traces.jsonl")
+
+# Route suggestions: weight of the newest measurement in each link's moving average,
+# and how many past measurements seed the link graph on startup
+ROUTE_EWMA_ALPHA = float(os.getenv("ROUTE_EWMA_ALPHA", 0.3))
+ROUTE_GRAPH_SEED_LIMIT = int(os.getenv("ROUTE_GRAPH_SEED_LIMIT", 10000))
@@ -1,25 +1,25 @@
 CHANNEL_INFO = {
     # 2.4GHz channels
-    1: {"frequency": 2412, "regions": ("GR")},
-    2: {"frequency": 2417, "regions": ("GR")},
-    3: {"frequency": 2422, "regions": ("GR")},
-    4: {"frequency": 2427, "regions": ("GR")},
-    5: {"frequency": 2432, "regions": ("GR")},
-    6: {"frequency": 2437, "regions": ("GR")},
-    7: {"frequency": 2442, "regions": ("GR")},
-    8: {"frequency": 2447, "regions": ("GR")},
-    9: {"frequency": 2452, "regions": ("GR")},
-    10: {"frequency": 2457, "regions": ("GR")},
-    11: {"frequency": 2462, "regions": ("GR")},
-    12: {"frequency": 2467, "regions": ("GR")},
-    13: {"frequency": 2472, "regions": ("GR")},
+    1: {"frequency": 2412, "regions": ("GR",)},
+    2: {"frequency": 2417, "regions": ("GR",)},
+    3: {"frequency": 2422, "regions": ("GR",)},
+    4: {"frequency": 2427, "regions": ("GR",)},
+    5: {"frequency": 2432, "regions": ("GR",)},
+    6: {"frequency": 2437, "regions": ("GR",)},
+    7: {"frequency": 2442, "regions": ("GR",)},
+    8: {"frequency": 2447, "regions": ("GR",)},
+    9: {"frequency": 2452, "regions": ("GR",)},
+    10: {"frequency": 2457, "regions": ("GR",)},
+    11: {"frequency": 2462, "regions": ("GR",)},
+    12: {"frequency": 2467, "regions": ("GR",)},
+    13: {"frequency": 2472, "regions": ("GR",)},
     14: {"frequency": 2484, "regions": ()},
     
     # 5GHz channels
-    36: {"frequency": 5180, "regions": ("GR")},
-    40: {"frequency": 5200, "regions": ("GR")},
-    44: {"frequency": 5220, "regions": ("GR")},
-    48: {"frequency": 5240, "regions": ("GR")},
+    36: {"frequency": 5180, "regions": ("GR",)},
+    40: {"frequency": 5200, "regions": ("GR",)},
+    44: {"frequency": 5220, "regions": ("GR",)},
+    48: {"frequency": 5240, "regions": ("GR",)},
     52: {"frequency": 5260, "regions": ()},
     56: {"frequency": 5280, "regions": ()},
     60: {"frequency": 5300, "regions": ()},
@@ -36,11 +36,11 @@ CHANNEL_INFO = {
     136: {"frequency": 5680, "regions": ()},
     140: {"frequency": 5700, "regions": ()},
     144: {"frequency": 5720, "regions": ()},
-    149: {"frequency": 5745, "regions": ("BR")},
-    153: {"frequency": 5765, "regions": ("BR")},
-    157: {"frequency": 5785, "regions": ("BR")},
-    161: {"frequency": 5805, "regions": ("BR")},
-    165: {"frequency": 5825, "regions": ("BR")}
+    149: {"frequency": 5745, "regions": ("BR",)},
+    153: {"frequency": 5765, "regions": ("BR",)},
+    157: {"frequency": 5785, "regions": ("BR",)},
+    161: {"frequency": 5805, "regions": ("BR",)},
+    165: {"frequency": 5825, "regions": ("BR",)}
 }
 
   
@@ -1,9 +1,16 @@
+import asyncio
 import logging
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from fastapi.middleware.cors import CORSMiddleware
 from routers.router import router
 from mqtt_core.mqtt_dependencies import startup_mqtt, shutdown_mqtt
+from services.job_service import job_manager
+from services.scheduler import measurement_scheduler
+from services.service import measurement_history, measurement_log
+from services.route_planner import seed_route_graph
+from services.trace_store import trace_store
 
 # ✅ Configure logging once here
 logging.basicConfig(
@@ -21,11 +28,23 @@ app.include_router(router)
 
 @app.on_event("startup")
 async def startup():
+    measurement_scheduler.attach_loop(asyncio.get_running_loop())
+    seed_route_graph(measurement_history)
     await startup_mqtt()
 
 @app.on_event("shutdown") 
 async def shutdown():
+    job_manager.shutdown()
     await shutdown_mqtt()
+    # Flush whatever is still queued for the measurement log
+    measurement_log.close()
+    trace_store.close()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint for the measurement pipeline."""
+    # Served on the event loop, the same thread that owns the waiter registry it reads
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.exception_handler(Exception)
 async def all_exception_handler(request: Request, exc: Exception):
@@ -1,5 +1,23 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional 
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, List, Literal, Optional 
+
+
+class IperfProfile(BaseModel):
+    # Frozen so it can be part of the cache and single-flight key
+    model_config = ConfigDict(frozen=True)
+
+    duration: int = Field(10, ge=1, le=60, description="Test length in seconds (iperf3 -t), an upper bound with ci_width_mbps")
+    parallel: int = Field(1, ge=1, le=16, description="Parallel streams (iperf3 -P)")
+    direction: Literal["forward", "reverse", "bidirectional"] = Field(
+        "forward", description="forward: client to server, reverse: server to client (-R), bidirectional: both at once (--bidir)"
+    )
+    protocol: Literal["tcp", "udp"] = "tcp"
+    bitrate_mbps: Optional[float] = Field(None, gt=0, description="Target rate (iperf3 -b), required for UDP")
+
+    @property
+    def measures_capacity(self) -> bool:
+        """Only unthrottled TCP tests from source to destination estimate a route's rate."""
+        return self.protocol == "tcp" and self.direction == "forward" and self.bitrate_mbps is None
 
 
 class DataTransferRateRequest(BaseModel):
@@ -7,14 +25,153 @@ class DataTransferRateRequest(BaseModel):
     destination: str = Field(..., description="Destination IP address")
     path: List[str] = Field(..., description="List of IP addresses in the path")
     wireless_channel: Optional[int] =Field ( None, description="Wireless channel used in the ad hoc network")
+    max_age: Optional[float] = Field(
+        None, ge=0,
+        description="Accept a cached result up to this many seconds old (defaults to the cache TTL, 0 forces a new measurement)"
+    )
+    ci_width_mbps: Optional[float] = Field(
+        None, gt=0,
+        description="Stop the test early once the 95% confidence interval of the mean rate is narrower than this (Mbit/s)"
+    )
+    profile: IperfProfile = Field(default_factory=IperfProfile, description="How the client runs iperf3")
+
+
+class DirectionRate(BaseModel):
+    sent_mbps: float
+    received_mbps: float
+    retransmits: Optional[int] = Field(None, description="TCP only")
+    jitter_ms: Optional[float] = Field(None, description="UDP only")
+    lost_percent: Optional[float] = Field(None, description="UDP only")
 
 
 class DataTransferRateResponse(BaseModel):
     source: str
     destination: str
+    path: List[str] = Field(default_factory=list, description="Forwarding path the measurement took")
     rate_mbps: float
     wireless_channel: int
     timestamp: int
+    setup_ms: Optional[float] = Field(None, description="Time from publishing the setup commands until every node was ready")
+    request_id: Optional[str] = Field(None, description="Id of the measurement, also its trace id")
+    intervals: Optional[int] = Field(None, description="1 s iperf3 intervals the test ran")
+    ci_width_mbps: Optional[float] = Field(None, description="Width of the 95% confidence interval of the interval rates")
+    stopped_early: bool = Field(False, description="Test ended once its confidence interval was narrow enough")
+    profile: IperfProfile = Field(default_factory=IperfProfile)
+    directions: Dict[str, DirectionRate] = Field(
+        default_factory=dict,
+        description="Figures per direction: uplink (client to server) and/or downlink (server to client)"
+    )
+
+
+class MeasurementJobResponse(BaseModel):
+    job_id: str
+    status: str = Field(..., description="pending, running, completed, failed or cancelled")
+    submitted_at: int
+    finished_at: Optional[int] = None
+    result: Optional[DataTransferRateResponse] = None
+    error: Optional[str] = None
+    queue_position: Optional[int] = Field(None, description="1-based position while pending, 0 while running")
+
+
+class QueuedMeasurement(BaseModel):
+    position: int
+    source: str
+    destination: str
+    path: List[str]
+    wireless_channel: Optional[int] = None
+    estimated_wait_seconds: float = Field(..., description="Rough time until the measurement can start")
+
+
+class BatchMeasurementResult(BaseModel):
+    index: int = Field(..., description="Position of the request in the submitted batch")
+    result: Optional[DataTransferRateResponse] = None
+    error: Optional[str] = None
+
+
+class CacheStatsResponse(BaseModel):
+    size: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
+
+
+class DeviceInfo(BaseModel):
+    device_id: str
+    ip: str
+    online: bool
+    static: bool = Field(..., description="Seeded from the hardcoded testbed list rather than announced")
+    last_seen: Optional[int] = None
+
+
+class MeasurementStatsResponse(BaseModel):
+    profile: IperfProfile = Field(..., description="Test profile of the grouped measurements, never mixed")
+    wireless_channel: Optional[int] = Field(None, description="Set when grouped by channel")
+    source: Optional[str] = Field(None, description="Set when grouped by path")
+    destination: Optional[str] = Field(None, description="Set when grouped by path")
+    path: Optional[List[str]] = Field(None, description="Set when grouped by path")
+    count: int
+    mean_mbps: float
+    p50_mbps: float
+    p95_mbps: float
+
+
+class RouteSuggestion(BaseModel):
+    path: List[str] = Field(..., description="Forwarders between source and destination, empty for a direct link")
+    predicted_mbps: float
+    bottleneck_mbps: Optional[float] = Field(None, description="Slowest link on the route, None if a link was never measured")
+    basis: str = Field(..., description="measured (this route's own history) or links (combined link estimates)")
+    samples: int = Field(0, description="Past measurements of exactly this route")
+
+
+class TraceSpan(BaseModel):
+    name: str
+    start_ms: int
+    end_ms: int
+    device_id: Optional[str] = Field(None, description="Pi the step ran on, None for backend steps")
+    role: Optional[str] = None
+    ok: bool = True
+    skipped: bool = Field(False, description="Step not run because the Pi was already configured that way")
+
+
+class ThroughputInterval(BaseModel):
+    index: int
+    start: Optional[float] = Field(None, description="Seconds since the start of the test")
+    end: Optional[float] = None
+    rate_mbps: float
+    mean_mbps: float = Field(..., description="Running mean over the intervals so far")
+    ci_width_mbps: Optional[float] = Field(None, description="Running width of the 95% confidence interval")
+    received_at: int
+
+
+class MeasurementTraceResponse(BaseModel):
+    trace_id: str
+    source: str
+    destination: str
+    path: List[str]
+    wireless_channel: Optional[int] = None
+    status: str = Field(..., description="running, completed or failed")
+    error: Optional[str] = None
+    started_at: int
+    finished_at: Optional[int] = None
+    duration_ms: Optional[int] = None
+    spans: List[TraceSpan] = Field(default_factory=list, description="Backend and Pi steps ordered by start time")
+    intervals: List[ThroughputInterval] = Field(default_factory=list, description="iperf3 intervals streamed by the client")
+
+
+class WirelessChannelInfo(BaseModel):
+    channel: int
+    frequency_mhz: int
+    width_mhz: int
+    regions: List[str] = Field(..., description="Regions the channel is allowed in, empty if none")
+    overlapping: List[int] = Field(..., description="Channels whose spectrum overlaps this one, itself included")
+
+
+class ChannelCatalogResponse(BaseModel):
+    channels: List[WirelessChannelInfo]
+    regions: Dict[str, List[int]] = Field(..., description="Allowed channels per region")
 
 
 class HealthCheckResponse(BaseModel):
@@ -1,17 +1,23 @@
 from pydantic import BaseModel
 from typing import Optional, Union, List, Literal
+from models.api_model import IperfProfile
 
 
 class BaseCommand(BaseModel):
     device_id: str
     wireless_channel: int
     region: str
+    request_id: Optional[str] = None
 
 
 class ClientCommand(BaseCommand):
     role: Literal["client"] = "client"
     ip_server: str
     ip_routing: Optional[str]
+    ci_width_mbps: Optional[float] = None
+    profile: Optional[IperfProfile] = None
+    # Port the server leased for this measurement, taken from its ack; None uses the Pi's first port
+    iperf_port: Optional[int] = None
 
 
 class ForwarderCommand(BaseCommand):
@@ -3,31 +3,57 @@ import logging
 import json
 import threading
 import time
-from typing import Optional, Dict, Any, Callable
+from collections import deque
+from enum import Enum
+from typing import Optional, Dict, Any, Callable, Deque, Tuple
 from datetime import datetime
 import paho.mqtt.client as mqtt
+from utils.metrics import MQTT_RECONNECTS, MQTT_PUBLISH_FAILURES
 from configurations.mqtt_config import (
     MQTT_BROKER_HOST,
     MQTT_BROKER_PORT,
     MQTT_USERNAME,
     MQTT_PASSWORD,
     MQTT_COMMAND_TOPIC,
-    MQTT_STATUS_TOPIC
+    MQTT_STATUS_TOPIC,
+    MQTT_RECONNECT_MIN_DELAY,
+    MQTT_RECONNECT_MAX_DELAY,
+    MQTT_OUTBOUND_BUFFER_SIZE,
+    MQTT_OUTBOUND_TTL_SECONDS
 )
 
 logger = logging.getLogger(__name__)
 
+
+class PublishResult(Enum):
+    """Outcome of send_command_to_pi: handed to the broker, buffered until reconnect, or failed."""
+    SENT = "sent"
+    BUFFERED = "buffered"
+    FAILED = "failed"
+
+
 class MQTTClient:
     def __init__(self):
         self.client: Optional[mqtt.Client] = None
         self.is_connected = False
         self.connection_lock = threading.Lock()
+        self.connected_event = threading.Event()
         self.message_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None
 
+        # Topics to (re)subscribe on every connect: topic -> qos
+        self.subscriptions: Dict[str, int] = {}
+        # Commands published while offline, flushed on reconnect unless older than the TTL:
+        # (topic, payload, monotonic time buffered)
+        self.outbound_buffer: Deque[Tuple[str, str, float]] = deque(maxlen=MQTT_OUTBOUND_BUFFER_SIZE)
+        self.buffer_lock = threading.Lock()
+        self.reconnect_count = 0
+        self.dropped_messages = 0
+
     def _on_connect(self, client, userdata, flags, rc):
         """Callback when client connects to MQTT broker."""
         if rc == 0:
             self.is_connected = True
+            self.connected_event.set()
             logger.info(f"Connected to MQTT broker at {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
 
             # Subscribe to topics where Raspberry Pis send their state updates
@@ -35,7 +61,12 @@ class MQTTClient:
                 client.subscribe(MQTT_STATUS_TOPIC)
                 logger.info(f"Subscribed to status topic: {MQTT_STATUS_TOPIC}")
 
-      
+            # Restore every subscription, a new session starts with none
+            for topic, qos in list(self.subscriptions.items()):
+                client.subscribe(topic, qos)
+                logger.info(f"Resubscribed to Pi topic: {topic}")
+
+            self._flush_outbound_buffer()
 
         else:
             self.is_connected = False
@@ -44,11 +75,36 @@ class MQTTClient:
     def _on_disconnect(self, client, userdata, rc):
         """Callback when client disconnects from broker."""
         self.is_connected = False
+        self.connected_event.clear()
         if rc != 0:
-            logger.warning("Unexpected MQTT disconnection. Will attempt to reconnect.")
+            self.reconnect_count += 1
+            MQTT_RECONNECTS.inc()
+            logger.warning("Unexpected MQTT disconnection. Reconnecting in the background.")
         else:
             logger.info("MQTT client disconnected")
 
+    def _flush_outbound_buffer(self):
+        """
+        Publish commands that were buffered while the broker was unreachable. Commands older
+        than MQTT_OUTBOUND_TTL_SECONDS are dropped: their measurement has given up waiting, and
+        replaying them would reconfigure a Pi for nothing.
+        """
+        with self.buffer_lock:
+            buffered = list(self.outbound_buffer)
+            self.outbound_buffer.clear()
+        now = time.monotonic()
+        fresh = [(topic, json_payload) for topic, json_payload, buffered_at in buffered
+                 if now - buffered_at <= MQTT_OUTBOUND_TTL_SECONDS]
+        expired = len(buffered) - len(fresh)
+        if expired:
+            self.dropped_messages += expired
+            MQTT_PUBLISH_FAILURES.inc(expired)
+            logger.warning(f"Dropped {expired} buffered command(s) older than {MQTT_OUTBOUND_TTL_SECONDS}s")
+        for topic, json_payload in fresh:
+            self.client.publish(topic, json_payload, qos=1)
+        if fresh:
+            logger.info(f"Flushed {len(fresh)} buffered command(s) after reconnect")
+
     def _on_message(self, client, userdata, msg):
         """Callback when message is received from Raspberry Pi."""
         try:
@@ -71,72 +127,83 @@ class MQTTClient:
         except Exception as e:
             logger.error(f"Error processing Pi message: {e}")
 
-    def connect(self) -> bool:
-        """Connect to MQTT broker."""
-        with self.connection_lock:
-            if self.is_connected:
-                return True
+    def _create_client(self) -> mqtt.Client:
+        client = mqtt.Client()
 
-            try:
-                # Create MQTT client
-                self.client = mqtt.Client()
+        # Set credentials 
+        if MQTT_USERNAME and MQTT_PASSWORD:
+            client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
 
-                # Set credentials 
-                if MQTT_USERNAME and MQTT_PASSWORD:
-                    self.client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        # Set callbacks
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
 
-                # Set callbacks
-                self.client.on_connect = self._on_connect
-                self.client.on_disconnect = self._on_disconnect
-                self.client.on_message = self._on_message
+        # paho's network loop reconnects on its own, backing off exponentially between these bounds
+        client.reconnect_delay_set(min_delay=MQTT_RECONNECT_MIN_DELAY, max_delay=MQTT_RECONNECT_MAX_DELAY)
+        return client
 
-                # Connect to broker
-                logger.info(f"Connecting to MQTT broker at {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
-                self.client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
+    def start(self):
+        """
+        Start the connection lifecycle without blocking.
 
-                # Start network loop
-                self.client.loop_start()
+        The network loop runs in paho's background thread: it keeps retrying the first
+        connection and every later reconnection with exponential backoff, resubscribes
+        on each connect and flushes commands buffered while offline.
+        """
+        with self.connection_lock:
+            if self.client is not None:
+                return
 
-                # Wait for connection
-                timeout = 10
-                start_time = time.time()
-                while not self.is_connected and (time.time() - start_time) < timeout:
-                    time.sleep(0.1)
+            self.client = self._create_client()
+            logger.info(f"Connecting to MQTT broker at {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT} in the background")
+            self.client.connect_async(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
+            self.client.loop_start()
 
-                if not self.is_connected:
-                    logger.error("Failed to connect to MQTT broker within timeout")
-                    return False
+    def connect(self, timeout: float = 10.0) -> bool:
+        """Start the connection lifecycle and wait until connected or the timeout passes."""
+        try:
+            self.start()
+        except Exception as e:
+            logger.error(f"Error connecting to MQTT broker: {e}")
+            return False
 
-                return True
+        # Wait for connection, without holding the connection lock
+        if not self.connected_event.wait(timeout):
+            logger.error("Failed to connect to MQTT broker within timeout")
+            return False
 
-            except Exception as e:
-                logger.error(f"Error connecting to MQTT broker: {e}")
-                self.is_connected = False
-                return False
+        return True
 
     def disconnect(self):
         """Disconnect from MQTT broker."""
         with self.connection_lock:
             if self.client:
-                self.client.loop_stop()
                 self.client.disconnect()
+                self.client.loop_stop()
+                self.client = None
                 self.is_connected = False
+                self.connected_event.clear()
                 logger.info("Disconnected from MQTT broker")
 
-    def send_command_to_pi(self, device_id: str, command_payload: Dict[str, Any]) -> bool:
+    def send_command_to_pi(self, device_id: str, command_payload: Dict[str, Any],
+                           buffer_if_offline: bool = True) -> PublishResult:
         """
         Send command to a specific Raspberry Pi.
 
         Args:
             device_id: ID of the target Raspberry Pi
             command_payload: Command data to send
+            buffer_if_offline: Buffer the command until the broker is back instead of failing
 
         Returns:
-            bool: True if sent successfully, False otherwise
+            PublishResult: SENT if handed to the broker, BUFFERED if it waits for a reconnect
+            (and may expire there), FAILED otherwise
         """
-        if not self.is_connected:
-            logger.error("Cannot send command: not connected to MQTT broker")
-            return False
+        if self.client is None:
+            logger.error("Cannot send command: MQTT client not started")
+            MQTT_PUBLISH_FAILURES.inc()
+            return PublishResult.FAILED
 
         try:
             # Build topic based on device ID and role
@@ -148,18 +215,35 @@ class MQTTClient:
 
             json_payload = json.dumps(command_payload)
             logger.info(f"And json payload: {json_payload}") 
+
+            if not self.is_connected:
+                if not buffer_if_offline:
+                    logger.error(f"Broker unreachable, not sending command to Pi {device_id}")
+                    MQTT_PUBLISH_FAILURES.inc()
+                    return PublishResult.FAILED
+                with self.buffer_lock:
+                    if len(self.outbound_buffer) == self.outbound_buffer.maxlen:
+                        self.dropped_messages += 1
+                        MQTT_PUBLISH_FAILURES.inc()
+                        logger.warning("Outbound buffer full, dropping the oldest buffered command")
+                    self.outbound_buffer.append((topic, json_payload, time.monotonic()))
+                logger.warning(f"Broker unreachable, buffered command for Pi {device_id} on '{topic}'")
+                return PublishResult.BUFFERED
+
             result = self.client.publish(topic, json_payload, qos=1)
 
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
                 logger.info(f"Command sent to Pi {device_id} on '{topic}': {json_payload}")
-                return True
+                return PublishResult.SENT
             else:
                 logger.error(f"Failed to send command to Pi {device_id}, error code: {result.rc}")
-                return False
+                MQTT_PUBLISH_FAILURES.inc()
+                return PublishResult.FAILED
 
         except Exception as e:
             logger.error(f"Error sending command to Pi {device_id}: {e}")
-            return False
+            MQTT_PUBLISH_FAILURES.inc()
+            return PublishResult.FAILED
 
     def set_message_callback(self, callback: Callable[[str, Dict[str, Any]], None]):
         """
@@ -172,10 +256,15 @@ class MQTTClient:
         logger.info("Message callback registered for Pi responses")
 
     def subscribe_to_pi_topic(self, topic: str) -> bool:
-        """Subscribe to additional Pi topic if needed."""
+        """
+        Subscribe to additional Pi topic if needed.
+        The subscription is remembered and restored on every reconnect; while offline it is
+        only recorded and applied once the connection comes up.
+        """
+        self.subscriptions[topic] = 1
         if not self.is_connected:
-            logger.error("Cannot subscribe: not connected to MQTT broker")
-            return False
+            logger.info(f"Not connected yet, will subscribe to '{topic}' on connect")
+            return True
 
         try:
             result, _ = self.client.subscribe(topic, 1)
@@ -191,11 +280,13 @@ class MQTTClient:
             return False
 
     def ensure_connection(self) -> bool:
-        """Ensure connection is active, reconnect if needed."""
-        if not self.is_connected:
-            logger.info("Connection lost, attempting to reconnect...")
-            return self.connect()
-        return True
+        """
+        Check the connection without blocking. Reconnecting is left to the background
+        loop, so callers fail fast instead of queueing behind a broker outage.
+        """
+        if self.client is None:
+            self.start()
+        return self.is_connected
 
     def get_status(self) -> Dict[str, Any]:
         """Get current MQTT client status for monitoring."""
@@ -203,5 +294,9 @@ class MQTTClient:
             "connected": self.is_connected,
             "broker_host": MQTT_BROKER_HOST,
             "broker_port": MQTT_BROKER_PORT,
-            "has_message_callback": self.message_callback is not None
+            "has_message_callback": self.message_callback is not None,
+            "subscriptions": list(self.subscriptions),
+            "buffered_commands": len(self.outbound_buffer),
+            "dropped_commands": self.dropped_messages,
+            "reconnects": self.reconnect_count
         }
@@ -1,4 +1,5 @@
 # mqtt_dependencies.py
+import asyncio
 import logging
 from typing import Dict
 from fastapi import Depends, HTTPException
@@ -15,10 +16,11 @@ mqtt_service = MQTTService(mqtt_client)
 def get_mqtt_client() -> MQTTClient:
     """
     FastAPI dependency function to get the MQTT client.
-    Ensures connection is active before returning client.
+    Fails immediately with 503 while the broker is unreachable; the client
+    reconnects in the background instead of blocking the request.
     """
     if not mqtt_client.ensure_connection():
-        logger.error("MQTT client connection failed")
+        logger.error("MQTT client not connected")
         raise HTTPException(
             status_code=503, 
             detail="MQTT service unavailable - cannot connect to broker"
@@ -26,17 +28,27 @@ def get_mqtt_client() -> MQTTClient:
     return mqtt_client
 
 async def startup_mqtt():
-    connected = mqtt_client.connect()
-    if not connected:
-        raise RuntimeError("Could not connect to MQTT broker")
-    
-    # Subscribe to telemetry topic
+    # Waiters are resolved from the paho thread onto the application's event loop
+    mqtt_service.waiting_for_messages.attach_loop(asyncio.get_running_loop())
+
+    # Register callback for incoming messages
+    mqtt_client.set_message_callback(mqtt_service.receive_results)
+
+    # Subscribe to telemetry topic (restored automatically on every reconnect)
     subscribed = mqtt_service.subscribe_to_telemetry()
     if not subscribed:
         raise RuntimeError("Could not subscribe to telemetry topic")
 
-    # Register callback for incoming messages
-    mqtt_client.set_message_callback(mqtt_service.receive_results)
+    # Subscribe to the per-device ack topics
+    if not mqtt_service.subscribe_to_acks():
+        raise RuntimeError("Could not subscribe to ack topics")
+
+    # Subscribe to device announcements and heartbeats
+    if not mqtt_service.subscribe_to_devices():
+        raise RuntimeError("Could not subscribe to device topics")
+
+    # Connect in the background, the app starts even if the broker is down
+    mqtt_client.start()
 
 async def shutdown_mqtt():
     """
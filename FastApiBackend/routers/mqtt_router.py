@@ -71,7 +71,7 @@ async def send_network_setup(
     - `client_command`: Details for the client device.
     """
     logger.info(f"Received request to send network setup.")
-    result = mqtt_service.send_network_setup(
+    result = await mqtt_service.send_network_setup(
         setup_request.server_command,
         setup_request.forwarder_commands,
         setup_request.client_command
@@ -1,49 +1,272 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional
-from models.api_model import DataTransferRateResponse, DataTransferRateRequest, HealthCheckResponse
-from services.service import get_data_transfer_rate
+from typing import Dict, List, Literal, Optional
+from models.api_model import DataTransferRateResponse, DataTransferRateRequest, HealthCheckResponse, MeasurementJobResponse, QueuedMeasurement, CacheStatsResponse, BatchMeasurementResult, DeviceInfo, MeasurementStatsResponse, MeasurementTraceResponse, ChannelCatalogResponse, WirelessChannelInfo, RouteSuggestion
+from services.service import measurement_cache, measurement_history, submit_measurement
+from services.job_service import job_manager
+from services.scheduler import QueueFullError, measurement_scheduler
+from services.device_registry import device_registry
+from services.trace_store import trace_store
+from services.route_planner import route_graph
 from services.mqtt_service import MQTTService
-from mqtt_core.mqtt_dependencies import get_mqtt_client
+from utils.wireless_channels import channel_catalog
+from mqtt_core.mqtt_dependencies import get_mqtt_client, mqtt_service as shared_mqtt_service
 from mqtt_core.mqtt_client import MQTTClient
+from configurations.service_config import JOB_MAX_WAIT_SECONDS
+import asyncio
+import logging
 import time
+from collections import deque
 import random
 from datetime import datetime
-from utils.io import save_data_transfer_rate_to_file
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/network", tags=["network"])
 
 def get_mqtt_service(mqtt_client: MQTTClient = Depends(get_mqtt_client)) -> MQTTService:
-    return MQTTService(mqtt_client)
+    # Every request shares one service: it owns the client's message callback,
+    # so a per-request instance would steal telemetry from measurements in flight
+    return shared_mqtt_service
+
+
+def queue_full_exception(e: QueueFullError) -> HTTPException:
+    """429 telling the caller when the testbed is expected to have room again."""
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 @router.post("/data-transfer-rate", response_model=DataTransferRateResponse)
-def get_data_transfer_rate_endpoint(
+async def get_data_transfer_rate_endpoint(
     request: DataTransferRateRequest,
+    response: Response,
     mqtt_service: MQTTService = Depends(get_mqtt_service)
  ):
     """
     Get data transfer rate measurements between source and destination through specified path.
     All nodes in the path use the same wireless channel if specified.
+    The measurement runs as a background job; the job id is returned in the X-Job-Id header
+    so the result can still be polled if this call times out.
+    Returns 429 with a Retry-After header when the measurement queue is full.
     """
 
     try:
-        data = get_data_transfer_rate(
-            source=request.source,
-            destination=request.destination,
-            path=request.path,
-            wireless_channel=request.wireless_channel,
-            mqtt_service=mqtt_service
-        )
-        # Save to file
-        save_data_transfer_rate_to_file(data, "./logs/data_transfer_log.csv")
-        return data
+        job = job_manager.submit(request, mqtt_service)
+        response.headers["X-Job-Id"] = job.job_id
+        return await asyncio.shield(asyncio.wrap_future(job.future))
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        raise queue_full_exception(e)
     except Exception as e:
-         print("ERROR:", e)  # this prints to your docker logs immediately
-         raise HTTPException(status_code=500, detail=str(e))
+        logger.exception(f"Measurement {request.source} -> {request.destination} failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/data-transfer-rate/batch")
+async def get_data_transfer_rate_batch_endpoint(
+    requests: List[DataTransferRateRequest],
+    mqtt_service: MQTTService = Depends(get_mqtt_service)
+):
+    """
+    Run a list of measurements and stream each result back as NDJSON as soon as it finishes.
+    Every line is a BatchMeasurementResult whose `index` points at the request it answers;
+    the scheduler decides the execution order, so lines arrive in completion order.
+    Requests are fed to the scheduler as queue slots free up, so a batch longer than the
+    measurement queue waits for room instead of failing its tail with 429s.
+    """
+    async def stream_results():
+        backlog = deque(enumerate(requests))
+        in_flight: Dict[asyncio.Future, int] = {}
+        while backlog or in_flight:
+            retry_after = None
+            while backlog:
+                index, request = backlog[0]
+                try:
+                    in_flight[asyncio.wrap_future(submit_measurement(request, mqtt_service))] = index
+                except QueueFullError as e:
+                    retry_after = e.retry_after
+                    break
+                except ValueError as e:
+                    yield BatchMeasurementResult(index=index, error=str(e)).model_dump_json() + "\n"
+                backlog.popleft()
+
+            if not in_flight:
+                # The queue is full of other callers' measurements, wait for the hinted slot;
+                # without a hint every remaining request was rejected and the backlog is empty
+                if retry_after is not None:
+                    await asyncio.sleep(retry_after)
+                continue
+            done, _ = await asyncio.wait(in_flight, timeout=retry_after, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                index = in_flight.pop(future)
+                if future.cancelled():
+                    line = BatchMeasurementResult(index=index, error="Measurement was cancelled")
+                elif future.exception() is not None:
+                    line = BatchMeasurementResult(index=index, error=str(future.exception()))
+                else:
+                    line = BatchMeasurementResult(index=index, result=future.result())
+                yield line.model_dump_json() + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@router.post("/data-transfer-rate/jobs", response_model=MeasurementJobResponse, status_code=202)
+async def submit_data_transfer_rate_job(
+    request: DataTransferRateRequest,
+    response: Response,
+    mqtt_service: MQTTService = Depends(get_mqtt_service)
+):
+    """
+    Submit a data transfer rate measurement without waiting for it.
+    Returns 202 with a job id; poll the job endpoint for the result and queue position.
+    Returns 429 with a Retry-After header when the measurement queue is full.
+    """
+    try:
+        job = job_manager.submit(request, mqtt_service)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        raise queue_full_exception(e)
+    response.headers["Location"] = f"{router.prefix}/data-transfer-rate/jobs/{job.job_id}"
+    return job_manager.get_response(job)
+
+
+@router.get("/data-transfer-rate/jobs/{job_id}", response_model=MeasurementJobResponse)
+async def get_data_transfer_rate_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=JOB_MAX_WAIT_SECONDS, description="Seconds to long-poll for the job to finish")
+):
+    """
+    Get the status of a measurement job, including its DataTransferRateResponse once completed.
+    With `wait` set, the call returns as soon as the job finishes or the wait expires.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    if wait > 0 and not job.future.done():
+        # asyncio.wait never cancels the job, it only stops waiting for it
+        await asyncio.wait([asyncio.wrap_future(job.future)], timeout=wait)
+
+    return job_manager.get_response(job)
+
+
+@router.get("/scheduler")
+async def get_scheduler_status():
+    """Number of measurements running on the testbed and waiting for free nodes or channels."""
+    return measurement_scheduler.get_status()
+
+
+@router.get("/queue", response_model=List[QueuedMeasurement])
+async def get_measurement_queue():
+    """Measurements waiting for the testbed, in dispatch order, with a rough estimate of their wait."""
+    return measurement_scheduler.get_queue()
+
+
+@router.get("/devices", response_model=List[DeviceInfo])
+async def list_devices():
+    """Devices known to the backend, whether announced over MQTT or seeded from the static testbed list."""
+    return device_registry.list_devices()
+
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+async def get_cache_stats():
+    """Hit/miss statistics of the measurement result cache."""
+    return measurement_cache.get_stats()
+
+
+def _parse_path(path: Optional[str]) -> Optional[List[str]]:
+    """Comma-separated path query parameter; an empty value means a direct (single hop) measurement."""
+    if path is None:
+        return None
+    return [ip.strip() for ip in path.split(",") if ip.strip()]
+
+
+@router.get("/measurements", response_model=List[DataTransferRateResponse])
+def get_measurements(
+    source: Optional[str] = None,
+    destination: Optional[str] = None,
+    channel: Optional[int] = Query(None, description="Wireless channel"),
+    path: Optional[str] = Query(None, description="Comma-separated forwarding path, empty for direct measurements"),
+    since: Optional[int] = Query(None, description="Only measurements at or after this epoch timestamp (ms)"),
+    until: Optional[int] = Query(None, description="Only measurements before this epoch timestamp (ms)"),
+    limit: int = Query(1000, ge=1, le=10000),
+    protocol: Optional[Literal["tcp", "udp"]] = Query(None, description="Test profile protocol"),
+    direction: Optional[Literal["forward", "reverse", "bidirectional"]] = Query(None, description="Test profile direction")
+):
+    """Past measurements from the history store, newest first."""
+    return measurement_history.query(source, destination, channel, _parse_path(path), since, until, limit,
+                                     protocol, direction)
+
+
+@router.get("/measurements/stats", response_model=List[MeasurementStatsResponse])
+def get_measurement_stats(
+    group_by: str = Query("channel", description="channel or path"),
+    source: Optional[str] = None,
+    destination: Optional[str] = None,
+    channel: Optional[int] = Query(None, description="Wireless channel"),
+    path: Optional[str] = Query(None, description="Comma-separated forwarding path, empty for direct measurements"),
+    since: Optional[int] = Query(None, description="Only measurements at or after this epoch timestamp (ms)"),
+    until: Optional[int] = Query(None, description="Only measurements before this epoch timestamp (ms)"),
+    protocol: Optional[Literal["tcp", "udp"]] = Query(None, description="Test profile protocol"),
+    direction: Optional[Literal["forward", "reverse", "bidirectional"]] = Query(None, description="Test profile direction")
+):
+    """Count, mean, p50 and p95 of the measured rate per channel or per path, split by test profile."""
+    try:
+        return measurement_history.stats(group_by, source, destination, channel, _parse_path(path), since, until,
+                                         protocol, direction)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/routes/suggest", response_model=List[RouteSuggestion])
+def suggest_routes(
+    source: str,
+    destination: str,
+    channel: Optional[int] = Query(None, description="Wireless channel, all channels pooled if omitted"),
+    k: int = Query(3, ge=1, le=20, description="Number of routes to return")
+):
+    """
+    Best candidate paths from source to destination by predicted rate, from the link graph
+    built out of past measurements. Offline devices are not suggested as relays.
+    """
+    try:
+        return route_graph.suggest(source, destination, channel, k, excluded=device_registry.get_offline_ips())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/traces/{trace_id}", response_model=MeasurementTraceResponse)
+async def get_trace(trace_id: str):
+    """
+    Timeline of a measurement: backend phases and every step the Pis reported, ordered by start time.
+    The trace id is the request_id returned with the measurement result.
+    """
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} not found")
+    return trace
+
+
+@router.get("/channels", response_model=ChannelCatalogResponse)
+async def get_channels(region: Optional[str] = Query(None, description="Only channels allowed in this region")):
+    """Known wireless channels with frequency, width, allowed regions and the channels they interfere with."""
+    channels = channel_catalog.channels_for_region(region) if region else channel_catalog.channels
+    return ChannelCatalogResponse(
+        channels=[
+            WirelessChannelInfo(
+                channel=channel,
+                frequency_mhz=channel_catalog.frequency(channel),
+                width_mhz=channel_catalog.width(channel),
+                regions=sorted(channel_catalog.regions[channel]),
+                overlapping=channel_catalog.overlapping(channel)
+            )
+            for channel in channels
+        ],
+        regions={name: list(members) for name, members in sorted(channel_catalog.region_index.items())}
+    )
 
 
 # --- Health Check Endpoint ---
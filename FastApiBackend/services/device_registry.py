@@ -0,0 +1,136 @@
+# device_registry.py
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+from constants.things import ThingsConstants
+from models.api_model import DeviceInfo
+from configurations.service_config import DEVICE_HEARTBEAT_TIMEOUT_SECONDS
+from utils.metrics import UNKNOWN_DEVICES
+
+
+logger = logging.getLogger(__name__)
+
+DEVICES_TOPIC = "devices"
+
+
+class DeviceRecord:
+    def __init__(self, device_id: str, ip: str, static: bool = False):
+        self.device_id = device_id
+        self.ip = ip
+        self.static = static
+        self.status: Optional[str] = None  # last status the device reported ("online"/"offline")
+        self.last_seen: Optional[float] = None  # time.time() of the last announce or heartbeat
+
+    def is_online(self, heartbeat_timeout: float) -> bool:
+        if self.status == "offline":
+            return False
+        if self.last_seen is None:
+            # Seeded from ThingsConstants and never heard from: liveness unknown, assume reachable
+            return self.static
+        return time.time() - self.last_seen <= heartbeat_timeout
+
+
+class DeviceRegistry:
+    """
+    Devices known to the backend, with O(1) IP -> device id and device id -> IP indexes.
+
+    Pis announce themselves with a retained message on devices/<id>/announce, keep alive
+    with devices/<id>/heartbeat and leave a retained last will on devices/<id>/status.
+    The hardcoded ThingsConstants.IP_TO_THING_ID only seeds the registry.
+    """
+
+    def __init__(self, seed: Optional[Dict[str, str]] = None,
+                 heartbeat_timeout: float = DEVICE_HEARTBEAT_TIMEOUT_SECONDS):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.devices: Dict[str, DeviceRecord] = {}
+        self.ip_to_id: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        for ip, device_id in (seed or {}).items():
+            self._register(device_id, ip, static=True)
+
+    def _register(self, device_id: str, ip: str, static: bool = False) -> DeviceRecord:
+        """Add or move a device, keeping both indexes consistent. Caller holds the lock (or is __init__)."""
+        record = self.devices.get(device_id)
+        if record is None:
+            record = DeviceRecord(device_id, ip, static)
+            self.devices[device_id] = record
+        elif record.ip != ip:
+            self.ip_to_id.pop(record.ip, None)
+            record.ip = ip
+
+        previous_owner = self.ip_to_id.get(ip)
+        if previous_owner is not None and previous_owner != device_id:
+            # The IP was handed to another Pi; the old mapping is stale
+            self.devices.pop(previous_owner, None)
+        self.ip_to_id[ip] = device_id
+        return record
+
+    def handle_message(self, topic: str, payload: Dict[str, Any]):
+        """Apply a devices/<id>/<announce|heartbeat|status> message."""
+        parts = topic.split("/")
+        if len(parts) != 3 or parts[0] != DEVICES_TOPIC:
+            return
+        device_id, kind = parts[1], parts[2]
+        ip = payload.get("ip")
+
+        with self.lock:
+            if kind in ("announce", "heartbeat"):
+                if ip:
+                    record = self._register(device_id, ip)
+                else:
+                    record = self.devices.get(device_id)
+                if record is None:
+                    logger.warning(f"[DeviceRegistry] {kind} from unknown device {device_id} without an IP")
+                    return
+                record.last_seen = time.time()
+                record.status = "online"
+                if kind == "announce":
+                    logger.info(f"[DeviceRegistry] Device {device_id} announced at {record.ip}")
+            elif kind == "status":
+                record = self.devices.get(device_id)
+                if record is None:
+                    return
+                record.status = payload.get("status")
+                logger.info(f"[DeviceRegistry] Device {device_id} is {record.status}")
+
+    def get_thing_id_by_ip(self, ip: str) -> Optional[str]:
+        with self.lock:
+            return self.ip_to_id.get(ip)
+
+    def get_ip_by_thing_id(self, device_id: str) -> Optional[str]:
+        with self.lock:
+            record = self.devices.get(device_id)
+            return record.ip if record else None
+
+    def require_thing_id(self, ip: str) -> str:
+        """Device id for an IP, raising ValueError for unknown or offline devices."""
+        with self.lock:
+            device_id = self.ip_to_id.get(ip)
+            if device_id is None:
+                UNKNOWN_DEVICES.inc()
+                raise ValueError(f"Unknown device IP {ip}")
+            if not self.devices[device_id].is_online(self.heartbeat_timeout):
+                raise ValueError(f"Device {device_id} ({ip}) is offline")
+            return device_id
+
+    def get_offline_ips(self) -> Set[str]:
+        with self.lock:
+            return {record.ip for record in self.devices.values() if not record.is_online(self.heartbeat_timeout)}
+
+    def list_devices(self) -> List[DeviceInfo]:
+        with self.lock:
+            return [
+                DeviceInfo(
+                    device_id=record.device_id,
+                    ip=record.ip,
+                    online=record.is_online(self.heartbeat_timeout),
+                    static=record.static,
+                    last_seen=int(record.last_seen * 1000) if record.last_seen else None
+                )
+                for record in self.devices.values()
+            ]
+
+
+# Global device registry, seeded with the static testbed
+device_registry = DeviceRegistry(ThingsConstants.IP_TO_THING_ID)
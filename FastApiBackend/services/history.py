@@ -0,0 +1,245 @@
+# history.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from models.api_model import DataTransferRateResponse, IperfProfile, MeasurementStatsResponse
+
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    path TEXT NOT NULL,
+    path_hash TEXT NOT NULL,
+    wireless_channel INTEGER,
+    rate_mbps REAL NOT NULL,
+    timestamp INTEGER NOT NULL,
+    setup_ms REAL,
+    profile TEXT NOT NULL DEFAULT '{}',
+    protocol TEXT NOT NULL DEFAULT 'tcp',
+    direction TEXT NOT NULL DEFAULT 'forward',
+    capacity INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS paths (
+    path_hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL
+);
+-- rate_mbps is included so route statistics are answered from the index alone
+CREATE INDEX IF NOT EXISTS idx_measurements_route
+    ON measurements (source, destination, wireless_channel, path_hash, timestamp, rate_mbps);
+CREATE INDEX IF NOT EXISTS idx_measurements_channel
+    ON measurements (wireless_channel, timestamp);
+CREATE INDEX IF NOT EXISTS idx_measurements_timestamp
+    ON measurements (timestamp);
+"""
+
+# Columns added after the first release, with the value every older row gets: the default test profile
+_MIGRATIONS = (
+    ("profile", "TEXT NOT NULL DEFAULT '{}'"),
+    ("protocol", "TEXT NOT NULL DEFAULT 'tcp'"),
+    ("direction", "TEXT NOT NULL DEFAULT 'forward'"),
+    ("capacity", "INTEGER NOT NULL DEFAULT 1"),
+)
+
+GROUP_BY_OPTIONS = ("channel", "path")
+
+
+def get_path_hash(path: List[str]) -> str:
+    """Short stable hash of a forwarding path, so routes can be indexed and grouped on one column."""
+    return hashlib.sha1(json.dumps(list(path)).encode("utf-8")).hexdigest()[:16]
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Linear-interpolated percentile (q in [0, 100]) of an already sorted, non-empty list."""
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class MeasurementHistory:
+    """
+    SQLite store of every measurement result, indexed for lookups by route, channel and time.
+
+    Works as a BackgroundWriter sink (write_batch/close), so rows are inserted in batches
+    off the request path, and answers filtered queries and per-channel or per-path
+    statistics without reading the whole CSV log.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database and create the schema on first use. Caller holds the lock."""
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self._migrate(self.connection)
+            self.connection.executescript(_SCHEMA)
+        return self.connection
+
+    @staticmethod
+    def _migrate(connection: sqlite3.Connection):
+        """Add the profile columns to a database created before test profiles existed."""
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(measurements)")}
+        if not columns:
+            return
+        with connection:
+            for column, definition in _MIGRATIONS:
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE measurements ADD COLUMN {column} {definition}")
+                    logger.info(f"[MeasurementHistory] Added column '{column}' to the measurements table")
+
+    def write_batch(self, records: List[DataTransferRateResponse]):
+        rows = [
+            (r.source, r.destination, json.dumps(r.path), get_path_hash(r.path),
+             r.wireless_channel, r.rate_mbps, r.timestamp, r.setup_ms, r.profile.model_dump_json(),
+             r.profile.protocol, r.profile.direction, int(r.profile.measures_capacity))
+            for r in records
+        ]
+        with self.lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO measurements (source, destination, path, path_hash, wireless_channel, "
+                    "rate_mbps, timestamp, setup_ms, profile, protocol, direction, capacity) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO paths (path_hash, path) VALUES (?, ?)",
+                    {(row[3], row[2]) for row in rows}
+                )
+
+    @staticmethod
+    def _where(source: Optional[str], destination: Optional[str], channel: Optional[int],
+               path: Optional[List[str]], since: Optional[int], until: Optional[int],
+               protocol: Optional[str] = None, direction: Optional[str] = None,
+               capacity_only: bool = False, measured_only: bool = False) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for column, value in (("source", source), ("destination", destination), ("wireless_channel", channel),
+                              ("protocol", protocol), ("direction", direction)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if path is not None:
+            clauses.append("path_hash = ?")
+            params.append(get_path_hash(path))
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if capacity_only:
+            clauses.append("capacity = 1")
+        if measured_only:
+            clauses.append("rate_mbps > 0")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, source: Optional[str] = None, destination: Optional[str] = None,
+              channel: Optional[int] = None, path: Optional[List[str]] = None,
+              since: Optional[int] = None, until: Optional[int] = None,
+              limit: int = 1000, protocol: Optional[str] = None, direction: Optional[str] = None,
+              capacity_only: bool = False) -> List[DataTransferRateResponse]:
+        """
+        Measurements matching every given filter, newest first. since/until are epoch milliseconds;
+        capacity_only keeps the unthrottled forward TCP tests that estimate a route's rate.
+        """
+        where, params = self._where(source, destination, channel, path, since, until,
+                                    protocol, direction, capacity_only)
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT source, destination, path, wireless_channel, rate_mbps, timestamp, setup_ms, profile "
+                f"FROM measurements{where} ORDER BY timestamp DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+
+        return [
+            DataTransferRateResponse(
+                source=row[0],
+                destination=row[1],
+                path=json.loads(row[2]),
+                wireless_channel=row[3],
+                rate_mbps=row[4],
+                timestamp=row[5],
+                setup_ms=row[6],
+                profile=IperfProfile.model_validate_json(row[7])
+            )
+            for row in rows
+        ]
+
+    def stats(self, group_by: str = "channel", source: Optional[str] = None,
+              destination: Optional[str] = None, channel: Optional[int] = None,
+              path: Optional[List[str]] = None, since: Optional[int] = None,
+              until: Optional[int] = None, protocol: Optional[str] = None,
+              direction: Optional[str] = None) -> List[MeasurementStatsResponse]:
+        """
+        Count, mean, p50 and p95 of rate_mbps per channel or per (source, destination, path).
+        Groups are also split by test profile, so e.g. UDP and TCP rates are never averaged together.
+        Rows of 0 Mbps, failed tests logged before failures were rejected, are left out.
+        """
+        if group_by not in GROUP_BY_OPTIONS:
+            raise ValueError(f"Unknown group_by '{group_by}', expected one of {', '.join(GROUP_BY_OPTIONS)}")
+
+        where, params = self._where(source, destination, channel, path, since, until, protocol, direction,
+                                    measured_only=True)
+        with self.lock:
+            connection = self._connect()
+            rows = connection.execute(
+                "SELECT source, destination, path_hash, wireless_channel, rate_mbps, profile "
+                f"FROM measurements{where}",
+                params
+            ).fetchall()
+
+            groups: Dict[Any, List[float]] = {}
+            # Parsed, so rows migrated with '{}' group with rows that spell out the default profile
+            profiles: Dict[str, IperfProfile] = {}
+            for row_source, row_destination, row_path_hash, row_channel, rate, row_profile in rows:
+                if row_profile not in profiles:
+                    profiles[row_profile] = IperfProfile.model_validate_json(row_profile)
+                key = (row_channel,) if group_by == "channel" else (row_source, row_destination, row_path_hash)
+                groups.setdefault(key + (profiles[row_profile],), []).append(rate)
+
+            paths = {}
+            if group_by == "path":
+                for path_hash in {key[2] for key in groups}:
+                    paths[path_hash] = json.loads(connection.execute(
+                        "SELECT path FROM paths WHERE path_hash = ?", (path_hash,)
+                    ).fetchone()[0])
+
+        results = []
+        for key, rates in groups.items():
+            rates.sort()
+            summary = dict(
+                count=len(rates),
+                mean_mbps=sum(rates) / len(rates),
+                p50_mbps=_percentile(rates, 50),
+                p95_mbps=_percentile(rates, 95)
+            )
+            summary["profile"] = key[-1]
+            if group_by == "channel":
+                results.append(MeasurementStatsResponse(wireless_channel=key[0], **summary))
+            else:
+                results.append(MeasurementStatsResponse(
+                    source=key[0], destination=key[1], path=paths[key[2]], **summary
+                ))
+
+        results.sort(key=lambda s: s.count, reverse=True)
+        return results
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
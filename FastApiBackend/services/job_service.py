@@ -0,0 +1,112 @@
+# job_service.py
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Dict, Optional
+from models.api_model import DataTransferRateRequest, DataTransferRateResponse, MeasurementJobResponse
+from services.mqtt_service import MQTTService
+from services.scheduler import MeasurementScheduler, measurement_scheduler
+from services.service import submit_measurement
+from configurations.service_config import JOB_RETENTION_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class MeasurementJob:
+    """A single data transfer rate measurement running in the background."""
+
+    def __init__(self, request: DataTransferRateRequest, future: "Future[DataTransferRateResponse]"):
+        self.job_id = uuid.uuid4().hex
+        self.request = request
+        self.future = future
+        self.submitted_at = _now_ms()
+        self.finished_at: Optional[int] = None
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future: Future):
+        self.finished_at = _now_ms()
+
+    @property
+    def status(self) -> str:
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "failed" if self.future.exception() is not None else "completed"
+        if self.future.running():
+            return "running"
+        return "pending"
+
+    def to_response(self, queue_position: Optional[int] = None) -> MeasurementJobResponse:
+        result = None
+        error = None
+        status = self.status
+        if status == "completed":
+            result = self.future.result()
+        elif status == "failed":
+            error = str(self.future.exception())
+
+        return MeasurementJobResponse(
+            job_id=self.job_id,
+            status=status,
+            submitted_at=self.submitted_at,
+            finished_at=self.finished_at,
+            result=result,
+            error=error,
+            queue_position=queue_position
+        )
+
+
+class JobManager:
+    """
+    Hands measurements to the testbed scheduler and keeps track of them by job id,
+    so HTTP workers only submit and poll instead of blocking for a whole iperf run.
+    """
+
+    def __init__(self, scheduler: MeasurementScheduler = measurement_scheduler,
+                 retention_seconds: float = JOB_RETENTION_SECONDS):
+        self.scheduler = scheduler
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, MeasurementJob] = {}
+        self.jobs_lock = threading.Lock()
+
+    def submit(self, request: DataTransferRateRequest, mqtt_service: MQTTService) -> MeasurementJob:
+        """Schedule a measurement and return its job handle immediately. Raises ValueError or QueueFullError."""
+        self._prune()
+        job = MeasurementJob(request, submit_measurement(request, mqtt_service))
+        with self.jobs_lock:
+            self.jobs[job.job_id] = job
+        logger.info(f"[JobManager] Submitted job {job.job_id} for {request.source} -> {request.destination}")
+        return job
+
+    def get(self, job_id: str) -> Optional[MeasurementJob]:
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def get_response(self, job: MeasurementJob) -> MeasurementJobResponse:
+        """Job status, with its queue position while it has not finished."""
+        position = None if job.future.done() else self.scheduler.get_position(job.future)
+        return job.to_response(position)
+
+    def _prune(self):
+        """Forget finished jobs that are older than the retention window."""
+        cutoff = _now_ms() - self.retention_seconds * 1000
+        with self.jobs_lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+    def shutdown(self):
+        """Stop accepting work and cancel measurements that have not started yet."""
+        self.scheduler.shutdown()
+
+
+# Global job manager instance
+job_manager = JobManager()
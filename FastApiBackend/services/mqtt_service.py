@@ -1,23 +1,49 @@
 # mqtt_service.py
+import asyncio
 import logging
-import threading
-from typing import Dict, Any, Union, Optional
-from mqtt_core.mqtt_client import MQTTClient
+import time
+from typing import Dict, Any, Union, Optional, List
+from mqtt_core.mqtt_client import MQTTClient, PublishResult
+from services.waiter_registry import WaiterRegistry
+from services.device_registry import DeviceRegistry, DEVICES_TOPIC, device_registry as default_device_registry
+from services.trace_store import TraceStore, trace_store as default_trace_store
 from models.mqtt_model import ClientCommand, ForwarderCommand, ServerCommand
+from utils.metrics import MEASUREMENT_PHASE_SECONDS, MQTT_WAITERS
 
 
 logger = logging.getLogger(__name__)
 
+TELEMETRY_TOPIC = "telemetry"
+
+
+def get_telemetry_topic(request_id: Optional[str] = None) -> str:
+    """Topic a measurement's telemetry is published on, e.g. 'telemetry/<request_id>'."""
+    return f"{TELEMETRY_TOPIC}/{request_id}" if request_id else TELEMETRY_TOPIC
+
+
+def get_interval_topic(request_id: str) -> str:
+    """Topic a client streams its iperf3 intervals on while the test runs, e.g. 'telemetry/<request_id>/interval'."""
+    return f"{get_telemetry_topic(request_id)}/interval"
+
+
+def get_ack_topic(device_id: str, request_id: str) -> str:
+    """Per-device reply topic a Pi acknowledges a command on, e.g. 'command/<device_id>/res/<request_id>'."""
+    return f"command/{device_id}/res/{request_id}"
+
+
 class MQTTService:
     """Service layer for sending commands to Raspberry Pi devices via MQTT."""
     
-    def __init__(self, mqtt_client: MQTTClient):
+    def __init__(self, mqtt_client: MQTTClient, device_registry: DeviceRegistry = default_device_registry,
+                 trace_store: TraceStore = default_trace_store):
         self.mqtt_client = mqtt_client
+        self.device_registry = device_registry
+        self.trace_store = trace_store
         self.latest_telemetry: Optional[Dict[str, Any]] = None  
 
-        # Here we add blocking message functionality
-        self.waiting_for_messages = {} # topic -> {"event": Event, "message":data}
-        self.message_lock = threading.Lock()
+        # Coroutines waiting for a message, keyed by topic (many waiters per topic)
+        self.waiting_for_messages = WaiterRegistry()
+        MQTT_WAITERS.set_function(lambda: len(self.waiting_for_messages))
 
 
         # Register our receive_results as the callback for mqtt_client
@@ -29,8 +55,18 @@ class MQTTService:
     
         
     def subscribe_to_telemetry(self) -> bool:
-        """Subscribe to the 'telemetry' topic."""
-        return self.mqtt_client.subscribe_to_pi_topic("telemetry")
+        """Subscribe to the shared 'telemetry' topic, the per-request 'telemetry/<request_id>' topics and their intervals."""
+        return (self.mqtt_client.subscribe_to_pi_topic(TELEMETRY_TOPIC)
+                and self.mqtt_client.subscribe_to_pi_topic(f"{TELEMETRY_TOPIC}/+")
+                and self.mqtt_client.subscribe_to_pi_topic(get_interval_topic("+")))
+
+    def subscribe_to_acks(self) -> bool:
+        """Subscribe to the per-device reply topics where Pis acknowledge their commands."""
+        return self.mqtt_client.subscribe_to_pi_topic(get_ack_topic("+", "#"))
+
+    def subscribe_to_devices(self) -> bool:
+        """Subscribe to device announcements, heartbeats and last-will status messages."""
+        return self.mqtt_client.subscribe_to_pi_topic(f"{DEVICES_TOPIC}/+/+")
 
     
     def get_latest_telemetry(self) -> Optional[Dict[str, Any]]:
@@ -39,8 +75,13 @@ class MQTTService:
 
     
 
-    def send_command(self, cmd: Union[ClientCommand, ForwarderCommand, ServerCommand]) -> Dict[str, Any]:
-        """Send any type of command to a Raspberry Pi."""
+    def send_command(self, cmd: Union[ClientCommand, ForwarderCommand, ServerCommand],
+                     buffer_if_offline: bool = True) -> Dict[str, Any]:
+        """
+        Send any type of command to a Raspberry Pi.
+        The status is "buffered" when the broker is unreachable and the command waits for a
+        reconnect: it is not delivered yet and may expire before it is.
+        """
         logger.info(f"I am on send_command") 
         try:
             # Build payload based on command type
@@ -52,6 +93,10 @@ class MQTTService:
                         "region": cmd.region,
                         "ip_server": cmd.ip_server,
                         "ip_routing": cmd.ip_routing,
+                        "ci_width_mbps": cmd.ci_width_mbps,
+                        "profile": cmd.profile.model_dump() if cmd.profile else None,
+                        "iperf_port": cmd.iperf_port,
+                        "request_id": cmd.request_id,
                     }
                 }
             elif isinstance(cmd, ForwarderCommand):
@@ -64,6 +109,7 @@ class MQTTService:
                         "ip_routing_previous": cmd.ip_routing_previous,
                         "ip_server": cmd.ip_server,
                         "ip_client": cmd.ip_client,
+                        "request_id": cmd.request_id,
                     }
                 }
             elif isinstance(cmd, ServerCommand):
@@ -74,6 +120,7 @@ class MQTTService:
                         "region": cmd.region,
                         "ip_client": cmd.ip_client,
                         "previous_ip": cmd.previous_ip,
+                        "request_id": cmd.request_id,
                     }
 
                 }
@@ -81,13 +128,25 @@ class MQTTService:
                 return {"status": "error", "message": "Unknown command type"}
                 
                 # Send the command
-            success = self.mqtt_client.send_command_to_pi(cmd.device_id, payload)
-            logger.info(f"Success: {success}") 
-            if success:
+            published_at = int(time.time() * 1000)
+            with MEASUREMENT_PHASE_SECONDS.labels("command_publish").time():
+                published = self.mqtt_client.send_command_to_pi(cmd.device_id, payload, buffer_if_offline)
+            self.trace_store.add_span(cmd.request_id, "command_publish", published_at, int(time.time() * 1000),
+                                      device_id=cmd.device_id, role=payload["value"]["role"],
+                                      ok=published is PublishResult.SENT)
+            logger.info(f"Publish result: {published.value}")
+            if published is PublishResult.SENT:
                 return {
                     "status": "success",
                     "device_id": cmd.device_id,
-                    "role": payload["role"]
+                    "role": payload["value"]["role"]
+                }
+            elif published is PublishResult.BUFFERED:
+                return {
+                    "status": "buffered",
+                    "device_id": cmd.device_id,
+                    "role": payload["value"]["role"],
+                    "message": "Broker unreachable, command buffered until reconnect"
                 }
             else:
                 return {
@@ -109,86 +168,171 @@ class MQTTService:
         """Callback for MQTT messages from mqtt_client._on_message."""
         logger.info(f"[MQTTService] Incoming message on topic '{topic}': {payload}")
 
-        if topic == "telemetry":
+        # Intervals are progress of a running test, not its result: nobody waits on them
+        if topic.startswith(f"{TELEMETRY_TOPIC}/") and topic.endswith("/interval"):
+            self.trace_store.add_interval(payload, int(time.time() * 1000))
+            return None
+
+        is_telemetry = topic == TELEMETRY_TOPIC or topic.startswith(f"{TELEMETRY_TOPIC}/")
+
+        if is_telemetry:
             # Save the latest telemetry payload
             self.latest_telemetry = payload
             logger.info("[MQTTService] Telemetry updated")
+
+        # Pis report the timestamps of their setup steps with every ack and telemetry message;
+        # record them before waking the waiter so the trace is complete when the measurement ends
+        if (is_telemetry or topic.startswith("command/")) and isinstance(payload.get("spans"), list):
+            self.trace_store.add_device_report(payload, int(time.time() * 1000))
         
-        with self.message_lock:
-            if topic in self.waiting_for_messages:
-                self.waiting_for_messages[topic]["message"] = payload
-                self.waiting_for_messages[topic]["event"].set()
-                logger.info(f"[MQTTService] Released thread waiting for topic '{topic}'")
+        # Runs on the paho network thread; waiters are woken on the event loop
+        self.waiting_for_messages.resolve(topic, payload)
 
-        if topic == "telemetry":
+        if is_telemetry:
             return self.latest_telemetry
+        elif topic.startswith("command/"):
+            logger.info(f"[MQTTService] Ack received on '{topic}'")
+        elif topic.startswith(f"{DEVICES_TOPIC}/"):
+            self.device_registry.handle_message(topic, payload)
         else:
             logger.warning(f"[MQTTService] Unhandled topic '{topic}'")
 
-    def wait_for_message(self, topic: str, timeout: float = 30.0) -> Optional[Dict[str, Any]]:
+    def expect_message(self, topic: str) -> asyncio.Future:
         """
-        BLOCK and wait for a message on the specified topic.
+        Register a waiter for a topic without waiting yet. Must be called from the event loop.
+
+        Call this before sending the command that triggers the reply, so a fast
+        reply is kept until wait_for_message picks it up instead of being lost.
+        """
+        return self.waiting_for_messages.register(topic)
+
+    def discard_message(self, topic: str, waiter: asyncio.Future):
+        """Drop a waiter registered with expect_message that will never be waited on."""
+        self.waiting_for_messages.discard(topic, waiter)
+
+    async def wait_for_message(self, topic: str, timeout: float = 30.0,
+                               waiter: Optional[asyncio.Future] = None) -> Optional[Dict[str, Any]]:
+        """
+        Wait for a message on the specified topic without holding a thread.
         
         Args:
             topic: The MQTT topic to wait for
             timeout: Maximum time to wait in seconds
+            waiter: Future from expect_message, if the waiter was registered up front
             
         Returns:
             The message payload or None if timeout
         """
-        logger.info(f"[MQTTService] Blocking and waiting for message on topic '{topic}' (timeout: {timeout}s)")
-        
-        # Create event to block on
-        event = threading.Event()
-        
-        with self.message_lock:
-            self.waiting_for_messages[topic] = {
-                "event": event,
-                "message": None
-            }
-        
-        # BLOCK HERE until message arrives or timeout
-        if event.wait(timeout):
-            with self.message_lock:
-                message = self.waiting_for_messages[topic]["message"]
-                del self.waiting_for_messages[topic]
+        logger.info(f"[MQTTService] Waiting for message on topic '{topic}' (timeout: {timeout}s)")
+        message = await self.waiting_for_messages.wait(topic, timeout, waiter)
+        if message is not None:
             logger.info(f"[MQTTService] Received message for topic '{topic}': {message}")
-            return message
-        else:
-            # Timeout occurred
-            with self.message_lock:
-                if topic in self.waiting_for_messages:
-                    del self.waiting_for_messages[topic]
-            logger.warning(f"[MQTTService] Timeout waiting for message on topic '{topic}'")
-            return None
-
+        return message
 
+    async def wait_for_messages(self, waiters: Dict[str, asyncio.Future],
+                                timeout: float = 30.0) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Wait concurrently for a message on every topic, with one shared deadline.
 
+        Args:
+            waiters: topic -> future from expect_message
 
+        Returns:
+            topic -> message payload, or None for topics that timed out
+        """
+        messages = await asyncio.gather(*(
+            self.wait_for_message(topic, timeout, waiter) for topic, waiter in waiters.items()
+        ))
+        return dict(zip(waiters, messages))
 
-    def send_network_setup(self, server_cmd: ServerCommand, 
+    async def send_network_setup(self, server_cmd: ServerCommand, 
                           forwarder_cmds: list[ForwarderCommand], 
-                          client_cmd: ClientCommand) -> Dict[str, Any]:
-        """Send complete network setup commands in correct order."""
-        results = []
-        
-        # Send server first
-        results.append(self.send_command(server_cmd))
-        
-        # Send forwarders
-        for forwarder_cmd in forwarder_cmds:
-            results.append(self.send_command(forwarder_cmd))
-        
-        # Send client last
-        results.append(self.send_command(client_cmd))
-        
-        # Check overall status
+                          client_cmd: ClientCommand,
+                          ack_timeout: float = 30.0) -> Dict[str, Any]:
+        """
+        Send complete network setup commands in correct order.
+
+        Server and forwarder commands are fanned out back-to-back (a paho publish only
+        queues the message, so there is nothing to gain from extra threads) and their
+        acks are gathered against one shared deadline. If any of them fails to publish, setup
+        fails at once without waiting for acks. A command buffered while the broker is
+        unreachable only counts as delivered once its ack arrives. A missing ack is a failed
+        setup like a "failed" ack: the client command is sent exactly once afterwards, never
+        buffered, and only if every device confirmed its configuration. It connects to the
+        iperf3 port the server's ack leased for the measurement.
+        Commands without a request_id can't be acknowledged and are not waited for.
+        """
+        setup_cmds = [server_cmd] + list(forwarder_cmds)
+        ack_topics = {
+            get_ack_topic(cmd.device_id, cmd.request_id): cmd
+            for cmd in setup_cmds if cmd.request_id
+        }
+        ack_waiters = {topic: self.expect_message(topic) for topic in ack_topics}
+
+        # Fan out server and forwarders at once
+        started = time.monotonic()
+        started_ms = int(time.time() * 1000)
+        results = [self.send_command(cmd) for cmd in setup_cmds]
+
+        failed = [r for r in results if r["status"] == "error"]
+        if failed:
+            for topic, waiter in ack_waiters.items():
+                self.discard_message(topic, waiter)
+            logger.error(f"[MQTTService] {len(failed)} setup command(s) failed to publish, not waiting for acks")
+            return {
+                "overall_status": "partial_failure" if len(failed) < len(results) else "failure",
+                "results": results,
+                "failed_count": len(failed),
+                "missing_acks": [],
+                "setup_ms": (time.monotonic() - started) * 1000
+            }
+
+        # Gather acks concurrently against a single deadline
+        acks = await self.wait_for_messages(ack_waiters, timeout=ack_timeout)
+        setup_ms = (time.monotonic() - started) * 1000
+        MEASUREMENT_PHASE_SECONDS.labels("node_setup").observe(setup_ms / 1000)
+        self.trace_store.add_span(server_cmd.request_id, "node_setup", started_ms, int(time.time() * 1000),
+                                  ok=all(ack is not None and ack.get("status") == "configured" for ack in acks.values()))
+
+        missing_acks = []
+        publish_results = dict(zip(map(id, setup_cmds), results))
+        for topic, ack in acks.items():
+            cmd = ack_topics[topic]
+            published = publish_results[id(cmd)]
+            if ack is None:
+                missing_acks.append(cmd.device_id)
+                logger.warning(f"[MQTTService] No configured ack from {cmd.device_id} within {ack_timeout}s")
+                published["status"] = "error"
+                published["message"] = f"No configuration ack within {ack_timeout}s"
+                continue
+            # The ack proves a buffered command was delivered after all
+            published["status"] = "success"
+            if cmd is server_cmd and ack.get("iperf_port") is not None:
+                # The server leased a port of its iperf3 pool for this measurement until its telemetry arrives
+                client_cmd.iperf_port = ack["iperf_port"]
+                logger.info(f"[MQTTService] {cmd.device_id} leased iperf3 port {ack['iperf_port']} "
+                            f"(lease {ack.get('lease_id')}) for {cmd.request_id}")
+            if ack.get("status") != "configured":
+                results.append({
+                    "status": "error",
+                    "device_id": cmd.device_id,
+                    "message": f"Device failed to configure: {ack.get('error', ack.get('status'))}"
+                })
+
+        # Send client last, once
         failed = [r for r in results if r["status"] != "success"]
+        if not failed:
+            # A buffered client command could start iperf after this measurement gave up on it
+            results.append(self.send_command(client_cmd, buffer_if_offline=False))
+            failed = [r for r in results if r["status"] != "success"]
+        logger.info(f"[MQTTService] Network setup publish-to-ready: {setup_ms:.1f} ms")
         
         return {
             "overall_status": "success" if not failed else "partial_failure" if len(failed) < len(results) else "failure",
             "results": results,
-            "failed_count": len(failed)
+            "failed_count": len(failed),
+            "missing_acks": missing_acks,
+            "setup_ms": setup_ms
         }
 
 
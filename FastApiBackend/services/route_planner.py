@@ -0,0 +1,209 @@
+# route_planner.py
+import heapq
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from models.api_model import DataTransferRateResponse, RouteSuggestion
+from services.history import MeasurementHistory
+from configurations.service_config import ROUTE_EWMA_ALPHA, ROUTE_GRAPH_SEED_LIMIT
+
+
+logger = logging.getLogger(__name__)
+
+Link = Tuple[str, str]
+Route = Tuple[str, ...]
+
+
+class RateEstimate:
+    """Exponentially weighted moving average of measured rates."""
+
+    def __init__(self, rate_mbps: float):
+        self.rate_mbps = rate_mbps
+        self.samples = 1
+
+    def update(self, rate_mbps: float, alpha: float):
+        self.rate_mbps += alpha * (rate_mbps - self.rate_mbps)
+        self.samples += 1
+
+
+class ChannelGraph:
+    """Link and route estimates for one wireless channel (or for all channels pooled)."""
+
+    def __init__(self):
+        # Single-hop measurements give a link's rate directly
+        self.links: Dict[Link, RateEstimate] = {}
+        # Multi-hop measurements only bound their links; used where no direct estimate exists
+        self.inferred_links: Dict[Link, RateEstimate] = {}
+        # Every measured (source, *path, destination) route
+        self.routes: Dict[Route, RateEstimate] = {}
+        self.routes_by_endpoints: Dict[Link, Set[Route]] = {}
+        self.neighbours: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def _update(estimates: Dict, key, rate_mbps: float, alpha: float):
+        estimate = estimates.get(key)
+        if estimate is None:
+            estimates[key] = RateEstimate(rate_mbps)
+        else:
+            estimate.update(rate_mbps, alpha)
+
+    def add(self, route: Route, rate_mbps: float, alpha: float):
+        self._update(self.routes, route, rate_mbps, alpha)
+        self.routes_by_endpoints.setdefault((route[0], route[-1]), set()).add(route)
+        hops = list(zip(route, route[1:]))
+        for a, b in hops:
+            self.neighbours.setdefault(a, set()).add(b)
+            self.neighbours.setdefault(b, set()).add(a)
+        if len(hops) == 1:
+            self._update(self.links, hops[0], rate_mbps, alpha)
+        else:
+            # Hops share the medium: n equal links of rate r give a path rate of r/n
+            for link in hops:
+                self._update(self.inferred_links, link, rate_mbps * len(hops), alpha)
+
+    def link_rate(self, a: str, b: str) -> Optional[float]:
+        """Best estimate of a link's rate, falling back to the reverse direction and then to inferred rates."""
+        for estimates in (self.links, self.inferred_links):
+            for link in ((a, b), (b, a)):
+                estimate = estimates.get(link)
+                if estimate is not None and estimate.rate_mbps > 0:
+                    return estimate.rate_mbps
+        return None
+
+
+def predict_route_rate(link_rates: Iterable[float]) -> float:
+    """
+    Rate of a multi-hop route on one channel: every hop transmits each packet in turn on the
+    shared medium, so airtime adds up and the rate is 1 / sum(1 / r_i). It never exceeds the
+    bottleneck link.
+    """
+    return 1.0 / sum(1.0 / rate for rate in link_rates)
+
+
+class RouteGraph:
+    """
+    Weighted link graph built from measurement history, used to suggest forwarding paths.
+
+    Works as a BackgroundWriter sink (write_batch/close), so every logged measurement updates
+    the graph incrementally. The k best routes are the k shortest simple paths (Yen's algorithm)
+    with link weight 1 / rate, which maximises the shared-medium route rate.
+    """
+
+    def __init__(self, alpha: float = ROUTE_EWMA_ALPHA):
+        self.alpha = alpha
+        # Keyed by wireless channel; None pools every channel
+        self.graphs: Dict[Optional[int], ChannelGraph] = {}
+        self.lock = threading.Lock()
+
+    def load(self, records: List[DataTransferRateResponse]):
+        """Seed the graph with past measurements, oldest first."""
+        self.write_batch(sorted(records, key=lambda record: record.timestamp))
+        logger.info(f"[RouteGraph] Seeded with {len(records)} past measurement(s)")
+
+    def write_batch(self, records: List[DataTransferRateResponse]):
+        with self.lock:
+            for record in records:
+                if record.rate_mbps <= 0 or not record.profile.measures_capacity:
+                    continue
+                route = (record.source, *record.path, record.destination)
+                for channel in {record.wireless_channel, None}:
+                    self.graphs.setdefault(channel, ChannelGraph()).add(route, record.rate_mbps, self.alpha)
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _shortest_path(graph: ChannelGraph, source: str, destination: str,
+                       removed_nodes: Set[str], removed_links: Set[Link]) -> Optional[Tuple[float, Route]]:
+        """Dijkstra over weights 1 / rate."""
+        queue = [(0.0, (source,))]
+        settled: Set[str] = set()
+        while queue:
+            cost, route = heapq.heappop(queue)
+            node = route[-1]
+            if node == destination:
+                return cost, route
+            if node in settled:
+                continue
+            settled.add(node)
+            for neighbour in graph.neighbours.get(node, ()):
+                if neighbour in settled or neighbour in removed_nodes or (node, neighbour) in removed_links:
+                    continue
+                rate = graph.link_rate(node, neighbour)
+                if rate is not None:
+                    heapq.heappush(queue, (cost + 1.0 / rate, route + (neighbour,)))
+        return None
+
+    def _k_shortest_routes(self, graph: ChannelGraph, source: str, destination: str,
+                           k: int, excluded: Set[str]) -> List[Route]:
+        """Yen's algorithm: the k cheapest loop-free routes."""
+        first = self._shortest_path(graph, source, destination, excluded, set())
+        if first is None:
+            return []
+        routes = [first[1]]
+        candidates: List[Tuple[float, Route]] = []
+        seen = {first[1]}
+        while len(routes) < k:
+            previous = routes[-1]
+            for i in range(len(previous) - 1):
+                root = previous[:i + 1]
+                removed_links = {(r[i], r[i + 1]) for r in routes if r[:i + 1] == root}
+                spur = self._shortest_path(graph, root[-1], destination, excluded | set(root[:-1]), removed_links)
+                if spur is None:
+                    continue
+                route = root[:-1] + spur[1]
+                if route not in seen:
+                    seen.add(route)
+                    cost = sum(1.0 / graph.link_rate(a, b) for a, b in zip(route, route[1:]))
+                    heapq.heappush(candidates, (cost, route))
+            if not candidates:
+                break
+            routes.append(heapq.heappop(candidates)[1])
+        return routes
+
+    def suggest(self, source: str, destination: str, channel: Optional[int] = None, k: int = 3,
+                excluded: Optional[Set[str]] = None) -> List[RouteSuggestion]:
+        """
+        The k routes from source to destination with the highest predicted rate. Routes measured
+        before are predicted from their own history, others from their links. Relays in `excluded`
+        (e.g. offline devices) are never suggested.
+        """
+        if source == destination:
+            raise ValueError("Source and destination must differ")
+        excluded = set(excluded or ()) - {source, destination}
+
+        with self.lock:
+            graph = self.graphs.get(channel)
+            if graph is None:
+                return []
+            routes = self._k_shortest_routes(graph, source, destination, k, excluded)
+            routes += [
+                route for route in graph.routes_by_endpoints.get((source, destination), ())
+                if route not in routes and not excluded.intersection(route[1:-1])
+            ]
+
+            suggestions = []
+            for route in routes:
+                link_rates = [graph.link_rate(a, b) for a, b in zip(route, route[1:])]
+                measured = graph.routes.get(route)
+                if measured is None and None in link_rates:
+                    continue
+                suggestions.append(RouteSuggestion(
+                    path=list(route[1:-1]),
+                    predicted_mbps=round(measured.rate_mbps if measured else predict_route_rate(link_rates), 2),
+                    bottleneck_mbps=round(min(link_rates), 2) if None not in link_rates else None,
+                    basis="measured" if measured else "links",
+                    samples=measured.samples if measured else 0
+                ))
+
+        suggestions.sort(key=lambda suggestion: suggestion.predicted_mbps, reverse=True)
+        return suggestions[:k]
+
+
+# Global route graph, fed by the measurement log and seeded from the history store on startup
+route_graph = RouteGraph()
+
+
+def seed_route_graph(history: MeasurementHistory):
+    """Replay the most recent capacity measurements (see IperfProfile.measures_capacity) into the route graph."""
+    route_graph.load(history.query(limit=ROUTE_GRAPH_SEED_LIMIT, capacity_only=True))
@@ -0,0 +1,200 @@
+# scheduler.py
+import asyncio
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Set
+from models.api_model import DataTransferRateRequest, DataTransferRateResponse, QueuedMeasurement
+from utils.wireless_channels import channels_interfere
+from utils.metrics import MEASUREMENTS_REJECTED
+from configurations.service_config import MEASUREMENT_WORKERS, MEASUREMENT_QUEUE_DEPTH, MEASUREMENT_DURATION_ESTIMATE_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """The measurement queue is at its configured depth; retry_after is a hint in seconds."""
+
+    def __init__(self, depth: int, retry_after: int):
+        super().__init__(f"Measurement queue is full ({depth} pending), retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class ScheduledMeasurement:
+    """A measurement waiting for, or holding, its nodes and channel on the testbed."""
+
+    def __init__(self, request: DataTransferRateRequest, measure: Callable[[], Awaitable[DataTransferRateResponse]]):
+        self.request = request
+        self.measure = measure
+        self.future: "Future[DataTransferRateResponse]" = Future()
+        self.nodes: FrozenSet[str] = frozenset(
+            ip for ip in [request.source, request.destination, *request.path] if ip
+        )
+        self.wireless_channel = request.wireless_channel
+
+    def conflicts_with(self, other: "ScheduledMeasurement") -> bool:
+        """Two measurements conflict if they share a node or their channels interfere."""
+        return bool(self.nodes & other.nodes) or channels_interfere(self.wireless_channel, other.wireless_channel)
+
+
+class MeasurementScheduler:
+    """
+    Queue of pending measurements that dispatches every mutually compatible measurement at once.
+
+    Measurements are compatible when their node sets (source, path, destination) are disjoint
+    and their channels do not overlap in spectrum. Dispatch walks the queue in FIFO order; a
+    measurement that has to wait still blocks newer measurements it conflicts with, so a long
+    path is never starved by a stream of small ones.
+
+    Measurements are coroutines run on the application's event loop; the returned
+    concurrent futures can be awaited from the loop or waited on from any thread.
+
+    The queue is bounded: once max_pending measurements are waiting, submit() raises
+    QueueFullError with a retry hint derived from the observed mean measurement time.
+    """
+
+    def __init__(self, max_parallel: int = MEASUREMENT_WORKERS, max_pending: int = MEASUREMENT_QUEUE_DEPTH,
+                 duration_estimate: float = MEASUREMENT_DURATION_ESTIMATE_SECONDS):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.max_parallel = max_parallel
+        self.max_pending = max_pending
+        self.pending: List[ScheduledMeasurement] = []
+        self.running: List[ScheduledMeasurement] = []
+        self.lock = threading.Lock()
+        # Moving average of how long a dispatched measurement holds the testbed
+        self.mean_duration = duration_estimate
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop):
+        """Bind the scheduler to the event loop measurements run on."""
+        self.loop = loop
+
+    def submit(self, request: DataTransferRateRequest,
+               measure: Callable[[], Awaitable[DataTransferRateResponse]]) -> "Future[DataTransferRateResponse]":
+        """Queue a measurement coroutine factory and return a future for its result. Raises QueueFullError."""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        item = ScheduledMeasurement(request, measure)
+        with self.lock:
+            if len(self.pending) >= self.max_pending:
+                MEASUREMENTS_REJECTED.inc()
+                raise QueueFullError(len(self.pending), self._retry_after())
+            self.pending.append(item)
+        self._dispatch()
+        return item.future
+
+    @staticmethod
+    def build_conflict_graph(items: List[ScheduledMeasurement]) -> Dict[int, Set[int]]:
+        """Adjacency sets over item indexes; an edge means the two measurements can't run together."""
+        graph: Dict[int, Set[int]] = {idx: set() for idx in range(len(items))}
+        for i in range(len(items)):
+            for j in range(i + 1, len(items)):
+                if items[i].conflicts_with(items[j]):
+                    graph[i].add(j)
+                    graph[j].add(i)
+        return graph
+
+    def _select_compatible(self) -> List[ScheduledMeasurement]:
+        """Pick, in FIFO order, the pending measurements that can start now. Caller holds the lock."""
+        items = self.running + self.pending
+        graph = self.build_conflict_graph(items)
+        blocking = set(range(len(self.running)))  # running items and pending items that must wait
+        selected = []
+
+        for idx in range(len(self.running), len(items)):
+            if len(self.running) + len(selected) >= self.max_parallel or graph[idx] & blocking:
+                blocking.add(idx)
+                continue
+            selected.append(items[idx])
+            blocking.add(idx)
+
+        return selected
+
+    def _dispatch(self):
+        with self.lock:
+            selected = self._select_compatible()
+            for item in selected:
+                self.pending.remove(item)
+                self.running.append(item)
+
+        for item in selected:
+            if not item.future.set_running_or_notify_cancel():
+                self._finish(item)
+                continue
+            logger.info(f"[Scheduler] Dispatching {item.request.source} -> {item.request.destination} "
+                        f"on channel {item.wireless_channel} ({len(self.running)} running, {len(self.pending)} pending)")
+            asyncio.run_coroutine_threadsafe(self._run(item), self.loop)
+
+    async def _run(self, item: ScheduledMeasurement):
+        started = time.monotonic()
+        try:
+            item.future.set_result(await item.measure())
+        except BaseException as e:
+            item.future.set_exception(e)
+        finally:
+            with self.lock:
+                self.mean_duration += 0.2 * (time.monotonic() - started - self.mean_duration)
+            self._finish(item)
+
+    def _finish(self, item: ScheduledMeasurement):
+        with self.lock:
+            if item in self.running:
+                self.running.remove(item)
+        self._dispatch()
+
+    def _estimated_wait(self, position: int) -> float:
+        """Seconds until the pending measurement at 1-based position can start, assuming full parallelism. Caller holds the lock."""
+        return self.mean_duration * math.ceil(position / max(1, self.max_parallel))
+
+    def _retry_after(self) -> int:
+        """Seconds until a queue slot is expected to free up: the next completion among the running measurements."""
+        return max(1, math.ceil(self.mean_duration / max(1, len(self.running))))
+
+    def get_position(self, future: Future) -> Optional[int]:
+        """1-based position of a measurement in the queue, 0 once it runs, None if it is not queued or running."""
+        with self.lock:
+            for position, item in enumerate(self.pending, start=1):
+                if item.future is future:
+                    return position
+            if any(item.future is future for item in self.running):
+                return 0
+        return None
+
+    def get_queue(self) -> List[QueuedMeasurement]:
+        """Pending measurements in dispatch order with their estimated wait."""
+        with self.lock:
+            return [
+                QueuedMeasurement(
+                    position=position,
+                    source=item.request.source,
+                    destination=item.request.destination,
+                    path=item.request.path,
+                    wireless_channel=item.wireless_channel,
+                    estimated_wait_seconds=round(self._estimated_wait(position), 1)
+                )
+                for position, item in enumerate(self.pending, start=1)
+            ]
+
+    def get_status(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "running": len(self.running),
+                "pending": len(self.pending),
+                "max_parallel": self.max_parallel,
+                "max_pending": self.max_pending,
+                "mean_duration_seconds": round(self.mean_duration, 2)
+            }
+
+    def shutdown(self):
+        """Cancel queued measurements; running ones end when the event loop stops."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for item in pending:
+            item.future.cancel()
+        logger.info(f"[Scheduler] Shut down, cancelled {len(pending)} pending measurement(s)")
+
+
+# Global scheduler instance
+measurement_scheduler = MeasurementScheduler()
@@ -1,30 +1,170 @@
+import asyncio
 import logging
+import threading
 import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
-from models.api_model import DataTransferRateResponse, DataTransferRateRequest
-from typing import List, Optional 
-from services.mqtt_service import MQTTService
-from utils.wireless_channels import get_channel_regions, get_region
-from utils.things import get_thing_id_by_ip
+from models.api_model import DataTransferRateResponse, DataTransferRateRequest, CacheStatsResponse, IperfProfile
+from typing import Callable, Dict, List, Optional, Tuple
+from services.mqtt_service import MQTTService, get_telemetry_topic
+from utils.wireless_channels import channel_catalog, get_command_region
+from utils.things import require_thing_id
 from models.mqtt_model import ClientCommand, ForwarderCommand, ServerCommand
+from utils.io import create_measurement_log
+from services.scheduler import measurement_scheduler
+from services.history import MeasurementHistory
+from services.route_planner import route_graph
+from services.trace_store import trace_store
+from utils.metrics import (MEASUREMENT_PHASE_SECONDS, MEASUREMENTS_COALESCED, MEASUREMENTS_IN_FLIGHT,
+                           MEASUREMENTS_STOPPED_EARLY, TELEMETRY_TIMEOUTS)
+from configurations.service_config import (
+    MEASUREMENT_LOG_PATH,
+    MEASUREMENT_LOG_ROTATION,
+    MEASUREMENT_LOG_MAX_BYTES,
+    MEASUREMENT_LOG_BATCH_SIZE,
+    MEASUREMENT_LOG_FLUSH_INTERVAL_SECONDS,
+    MEASUREMENT_HISTORY_PATH,
+    MEASUREMENT_CACHE_TTL_SECONDS,
+    MEASUREMENT_CACHE_MAX_ENTRIES,
+    ACK_TIMEOUT_SECONDS
+)
 
 logger = logging.getLogger(__name__)
 
+MeasurementKey = Tuple[str, str, Tuple[str, ...], Optional[int], Optional[float], IperfProfile]
 
-def get_data_transfer_rate(
+
+def get_measurement_key(request: DataTransferRateRequest) -> MeasurementKey:
+    """Identity of a measurement: (source, destination, path, wireless_channel, ci_width_mbps, profile)."""
+    return (request.source, request.destination, tuple(request.path), request.wireless_channel,
+            request.ci_width_mbps, request.profile)
+
+
+class MeasurementCache:
+    """Bounded TTL/LRU cache of recent measurement results."""
+
+    def __init__(self, ttl_seconds: float = MEASUREMENT_CACHE_TTL_SECONDS,
+                 max_entries: int = MEASUREMENT_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[MeasurementKey, Tuple[float, DataTransferRateResponse]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: MeasurementKey, max_age: Optional[float] = None) -> Optional[DataTransferRateResponse]:
+        """Return the cached result if it is younger than both the TTL and max_age."""
+        max_age = self.ttl_seconds if max_age is None else min(max_age, self.ttl_seconds)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= max_age:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: MeasurementKey, response: DataTransferRateResponse):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_stats(self) -> CacheStatsResponse:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return CacheStatsResponse(
+                size=len(self.entries),
+                max_entries=self.max_entries,
+                ttl_seconds=self.ttl_seconds,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                hit_ratio=self.hits / lookups if lookups else 0.0
+            )
+
+
+class InFlightMeasurements:
+    """
+    Single-flight table of measurements that are queued or running, by measurement key.
+
+    An identical request arriving while its measurement is in flight attaches to that
+    measurement's future instead of reconfiguring the nodes and running iperf again.
+    Entries are dropped as soon as the measurement finishes; from then on the cache answers.
+    """
+
+    def __init__(self):
+        self.futures: Dict[MeasurementKey, "Future[DataTransferRateResponse]"] = {}
+        self.lock = threading.Lock()
+
+    def get_or_submit(self, key: MeasurementKey,
+                      submit: Callable[[], "Future[DataTransferRateResponse]"]) -> Tuple["Future[DataTransferRateResponse]", bool]:
+        """Future of the in-flight measurement for key, submitting one if there is none. The flag is True when attached."""
+        with self.lock:
+            future = self.futures.get(key)
+            if future is not None:
+                return future, True
+            future = submit()
+            self.futures[key] = future
+        # Outside the lock: a future that is already done runs the callback right here
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future, False
+
+    def _forget(self, key: MeasurementKey, future: Future):
+        with self.lock:
+            if self.futures.get(key) is future:
+                del self.futures[key]
+
+
+# Global result cache
+measurement_cache = MeasurementCache()
+
+# Global single-flight table of queued and running measurements
+in_flight_measurements = InFlightMeasurements()
+
+# Global queryable history of every measurement
+measurement_history = MeasurementHistory(MEASUREMENT_HISTORY_PATH)
+
+# Global measurement log, written in batches off the request path (CSV file, history store and route graph)
+measurement_log = create_measurement_log(
+    MEASUREMENT_LOG_PATH,
+    rotation=MEASUREMENT_LOG_ROTATION,
+    max_bytes=MEASUREMENT_LOG_MAX_BYTES,
+    batch_size=MEASUREMENT_LOG_BATCH_SIZE,
+    flush_interval=MEASUREMENT_LOG_FLUSH_INTERVAL_SECONDS,
+    extra_sinks=[measurement_history, route_graph]
+)
+
+
+async def get_data_transfer_rate(
     source: str,
     destination: str,
     path: List[str],
     wireless_channel: Optional[int],
-    mqtt_service: MQTTService
+    mqtt_service: MQTTService,
+    request_id: Optional[str] = None,
+    ci_width_mbps: Optional[float] = None,
+    profile: Optional[IperfProfile] = None
 ) -> DataTransferRateResponse:
 
-    region = get_channel_regions(wireless_channel) # hardcoded region
+    region = get_command_region(wireless_channel)
+
+    # correlation id, travels with every command and comes back on telemetry/<request_id>
+    request_id = request_id or uuid.uuid4().hex
 
 
     # get IDs
-    source_id = get_thing_id_by_ip(source)
-    destination_id = get_thing_id_by_ip(destination)
+    source_id = require_thing_id(source)
+    destination_id = require_thing_id(destination)
 
 
 
@@ -35,45 +175,45 @@ def get_data_transfer_rate(
                 device_id=destination_id,
                 wireless_channel=wireless_channel,
                 region=region,
+                request_id=request_id,
                 ip_client = source,
                 previous_ip = path[len(path) - 1]
         )
         logger.info(f"SERVER value: {server_cmd}")
-        mqtt_service.send_command(server_cmd)
-
-
 
+        forwarder_cmds = []
         next_hops = list(path[1:]) + [destination]
 
         for idx, (intermediate_ip, next_ip) in enumerate(zip(filter(None, path), next_hops)):
             
             previous_ip = source if idx == 0 else path[idx - 1]
 
-            intermediate_id = get_thing_id_by_ip(intermediate_ip)
+            intermediate_id = require_thing_id(intermediate_ip)
 
             forwarder_cmd = ForwarderCommand(
                 device_id=intermediate_id,
                 wireless_channel=wireless_channel,
                 region=region,
+                request_id=request_id,
                 ip_routing_next=next_ip,
                 ip_routing_previous=previous_ip,
                 ip_server=destination,
                 ip_client=source  
             )
             logger.info(f"FORWARDER value: {forwarder_cmd}")
+            forwarder_cmds.append(forwarder_cmd)
 
-            mqtt_service.send_command(forwarder_cmd)
-
-            
-            client_cmd = ClientCommand(
-                device_id=source_id,
-                wireless_channel=wireless_channel,
-                region=region,
-                ip_server=destination,
-                ip_routing=path[0] if path else destination
-            )
-            mqtt_service.send_command(client_cmd)
-            logger.info(f"CLIENT value: {client_cmd}")
+        client_cmd = ClientCommand(
+            device_id=source_id,
+            wireless_channel=wireless_channel,
+            region=region,
+            request_id=request_id,
+            ci_width_mbps=ci_width_mbps,
+            profile=profile,
+            ip_server=destination,
+            ip_routing=path[0] if path else destination
+        )
+        logger.info(f"CLIENT value: {client_cmd}")
 
     # Single Hop
     else:
@@ -83,12 +223,13 @@ def get_data_transfer_rate(
                 device_id=destination_id,
                 wireless_channel=wireless_channel,
                 region=region,
+                request_id=request_id,
                 ip_client = source,
                 previous_ip = source
         )
         logger.info("_______________________________________________")
         logger.info(f"My variable value: {server_cmd}")
-        mqtt_service.send_command(server_cmd)
+        forwarder_cmds = []
 
 
         # --- Send client command ---
@@ -96,6 +237,9 @@ def get_data_transfer_rate(
             device_id=source_id,
             wireless_channel=wireless_channel,
             region=region,
+            request_id=request_id,
+            ci_width_mbps=ci_width_mbps,
+            profile=profile,
             ip_server=destination,
             ip_routing=destination
         )
@@ -103,17 +247,129 @@ def get_data_transfer_rate(
         logger.info("_______________________________________________")
         logger.info(f"My variable value: {client_cmd}")
 
-        mqtt_service.send_command(client_cmd)
+    # Register for telemetry before triggering the client so a fast result can't be missed
+    telemetry_topic = get_telemetry_topic(request_id)
+    telemetry_waiter = mqtt_service.expect_message(telemetry_topic)
+    waiting_since = time.monotonic()
+    waiting_since_ms = int(time.time() * 1000)
+    message = None
+
+    try:
+        # Server and forwarders must be configured before the client starts iperf
+        setup = await mqtt_service.send_network_setup(server_cmd, forwarder_cmds, client_cmd, ack_timeout=ACK_TIMEOUT_SECONDS)
+        if setup["overall_status"] != "success":
+            errors = [f"{r.get('device_id')}: {r.get('message')}" for r in setup["results"] if r["status"] != "success"]
+            raise RuntimeError(f"Network setup failed for request {request_id}: {'; '.join(errors)}")
+
+        # wait for telemetry; setup returns right after the client command is published
+        client_sent_at = time.monotonic()
+        client_sent_at_ms = int(time.time() * 1000)
+        message = await mqtt_service.wait_for_message(telemetry_topic, timeout=100.0, waiter=telemetry_waiter)
+        if message is not None:
+            MEASUREMENT_PHASE_SECONDS.labels("iperf_run").observe(time.monotonic() - client_sent_at)
+            trace_store.add_span(request_id, "iperf_run", client_sent_at_ms, int(time.time() * 1000))
+    finally:
+        MEASUREMENT_PHASE_SECONDS.labels("telemetry_wait").observe(time.monotonic() - waiting_since)
+        trace_store.add_span(request_id, "telemetry_wait", waiting_since_ms, int(time.time() * 1000),
+                             ok=message is not None)
+        mqtt_service.discard_message(telemetry_topic, telemetry_waiter)
 
 
-    # wait for telemetry
-    message = mqtt_service.wait_for_message("telemetry", timeout=100.0)
+    if message is None:
+        TELEMETRY_TIMEOUTS.inc()
+        raise TimeoutError(f"No telemetry received on '{telemetry_topic}' for {source} -> {destination}")
+    if message.get("error"):
+        raise RuntimeError(f"Measurement {source} -> {destination} failed on the client: {message['error']}")
     rate_mbps = message["sent_rate_mbps"]
+    # Pis that predate the error field report a failed test as 0 Mbps; never pass that off as a result
+    if rate_mbps <= 0:
+        raise RuntimeError(f"Measurement {source} -> {destination} transferred no data")
+    if message.get("stopped_early"):
+        MEASUREMENTS_STOPPED_EARLY.inc()
 
     return DataTransferRateResponse(
         source=source,
         destination=destination,
+        path=list(path),
         rate_mbps=rate_mbps,
         wireless_channel=wireless_channel,
-        timestamp=int(datetime.utcnow().timestamp() * 1000)
+        timestamp=int(datetime.utcnow().timestamp() * 1000),
+        setup_ms=round(setup["setup_ms"], 1),
+        request_id=request_id,
+        intervals=message.get("intervals"),
+        ci_width_mbps=message.get("ci_width_mbps"),
+        stopped_early=bool(message.get("stopped_early", False)),
+        profile=profile or IperfProfile(),
+        directions=message.get("directions") or {}
+    )
+
+
+async def run_measurement(
+    request: DataTransferRateRequest,
+    mqtt_service: MQTTService
+) -> DataTransferRateResponse:
+    """Run a full measurement for a request, tracing it, and queue the result for the measurement log."""
+    # The request id doubles as the trace id of the measurement's timeline
+    request_id = uuid.uuid4().hex
+    trace_store.start(request_id, request)
+    try:
+        with MEASUREMENTS_IN_FLIGHT.track_inprogress():
+            data = await get_data_transfer_rate(
+                source=request.source,
+                destination=request.destination,
+                path=request.path,
+                wireless_channel=request.wireless_channel,
+                mqtt_service=mqtt_service,
+                request_id=request_id,
+                ci_width_mbps=request.ci_width_mbps,
+                profile=request.profile
+            )
+    except BaseException as e:
+        trace_store.finish(request_id, error=str(e) or type(e).__name__)
+        raise
+    trace_store.finish(request_id)
+    # Queue for the measurement log, the file is written in the background
+    measurement_log.write(data)
+    measurement_cache.put(get_measurement_key(request), data)
+    return data
+
+
+def submit_measurement(
+    request: DataTransferRateRequest,
+    mqtt_service: MQTTService
+) -> "Future[DataTransferRateResponse]":
+    """
+    Entry point for every measurement: answer from the cache when a fresh-enough
+    result exists, attach to an identical measurement that is already queued or running,
+    otherwise queue a new measurement on the testbed scheduler.
+    Raises ValueError for requests naming unknown or offline devices, a channel
+    that is not allowed in any region, or a UDP profile without a bitrate.
+    """
+    if request.wireless_channel is not None and not channel_catalog.is_allowed(request.wireless_channel):
+        raise ValueError(f"Wireless channel {request.wireless_channel} is not allowed in any configured region")
+    if request.profile.protocol == "udp" and request.profile.bitrate_mbps is None:
+        raise ValueError("A UDP profile needs a bitrate_mbps")
+
+    # Reject unknown or offline nodes right away instead of waiting for a timeout
+    for ip in [request.source, request.destination, *request.path]:
+        if ip:
+            require_thing_id(ip)
+
+    key = get_measurement_key(request)
+    cached = measurement_cache.get(key, request.max_age)
+    if cached is not None:
+        logger.info(f"Cache hit for {request.source} -> {request.destination} on channel {request.wireless_channel}")
+        future: "Future[DataTransferRateResponse]" = Future()
+        future.set_running_or_notify_cancel()
+        future.set_result(cached)
+        return future
+
+    # An in-flight measurement finishes after this request arrived, so it satisfies any max_age
+    future, attached = in_flight_measurements.get_or_submit(
+        key, lambda: measurement_scheduler.submit(request, lambda: run_measurement(request, mqtt_service))
     )
+    if attached:
+        MEASUREMENTS_COALESCED.inc()
+        logger.info(f"Attached to in-flight measurement {request.source} -> {request.destination} "
+                    f"on channel {request.wireless_channel}")
+    return future
@@ -0,0 +1,156 @@
+# trace_store.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from models.api_model import DataTransferRateRequest, MeasurementTraceResponse, ThroughputInterval, TraceSpan
+from utils.io import BackgroundWriter, create_trace_log
+from configurations.service_config import TRACE_STORE_MAX_TRACES, TRACE_LOG_PATH
+
+
+logger = logging.getLogger(__name__)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class MeasurementTrace:
+    """Timeline of one measurement: backend steps plus the steps each Pi reported."""
+
+    def __init__(self, trace_id: str, request: DataTransferRateRequest):
+        self.trace_id = trace_id
+        self.request = request
+        self.started_at = _now_ms()
+        self.finished_at: Optional[int] = None
+        self.error: Optional[str] = None
+        self.spans: List[TraceSpan] = []
+        self.intervals: List[ThroughputInterval] = []
+
+    @property
+    def status(self) -> str:
+        if self.finished_at is None:
+            return "running"
+        return "failed" if self.error is not None else "completed"
+
+    def to_response(self) -> MeasurementTraceResponse:
+        return MeasurementTraceResponse(
+            trace_id=self.trace_id,
+            source=self.request.source,
+            destination=self.request.destination,
+            path=self.request.path,
+            wireless_channel=self.request.wireless_channel,
+            status=self.status,
+            error=self.error,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            duration_ms=self.finished_at - self.started_at if self.finished_at is not None else None,
+            spans=sorted(self.spans, key=lambda span: (span.start_ms, span.end_ms)),
+            intervals=sorted(self.intervals, key=lambda interval: interval.index)
+        )
+
+
+class TraceStore:
+    """
+    In-memory store of recent measurement timelines, keyed by trace id (the measurement's request_id).
+
+    Spans come from the backend (command publish, node setup, iperf run, telemetry wait) and from
+    the Pis, which send the timestamps of their subprocess steps with every ack and telemetry
+    message. Pi timestamps are their own wall clock, so the Pis should run NTP. Finished traces
+    are handed to the exporter, a BackgroundWriter appending them to a JSON-lines file.
+    """
+
+    def __init__(self, max_traces: int = TRACE_STORE_MAX_TRACES, exporter: Optional[BackgroundWriter] = None):
+        self.max_traces = max_traces
+        self.exporter = exporter
+        self.traces: "OrderedDict[str, MeasurementTrace]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def start(self, trace_id: str, request: DataTransferRateRequest) -> MeasurementTrace:
+        trace = MeasurementTrace(trace_id, request)
+        with self.lock:
+            self.traces[trace_id] = trace
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+        return trace
+
+    def add_span(self, trace_id: Optional[str], name: str, start_ms: int, end_ms: int,
+                 device_id: Optional[str] = None, role: Optional[str] = None, ok: bool = True,
+                 skipped: bool = False):
+        """Append a span to a trace; spans for unknown or evicted traces are dropped."""
+        if not trace_id:
+            return
+        with self.lock:
+            trace = self.traces.get(trace_id)
+            if trace is not None:
+                trace.spans.append(TraceSpan(name=name, start_ms=start_ms, end_ms=end_ms,
+                                             device_id=device_id, role=role, ok=ok, skipped=skipped))
+
+    def add_device_report(self, payload: Dict[str, Any], received_ms: int):
+        """
+        Ingest the spans a Pi sent with an ack or telemetry message, plus an mqtt_delivery
+        span from when the Pi published the message until the backend received it.
+        """
+        trace_id = payload.get("request_id")
+        device_id = payload.get("device_id")
+        role = payload.get("role")
+        for span in payload.get("spans") or []:
+            try:
+                self.add_span(trace_id, span["name"], int(span["start_ms"]), int(span["end_ms"]),
+                              device_id=device_id, role=role, ok=bool(span.get("ok", True)),
+                              skipped=bool(span.get("skipped", False)))
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"[TraceStore] Ignoring malformed span from {device_id}: {span}")
+        if payload.get("sent_at_ms") is not None:
+            self.add_span(trace_id, "mqtt_delivery", int(payload["sent_at_ms"]), received_ms,
+                          device_id=device_id, role=role)
+
+    def add_interval(self, payload: Dict[str, Any], received_ms: int):
+        """Append an iperf3 interval the client streamed while its test runs."""
+        trace_id = payload.get("request_id")
+        if not trace_id:
+            return
+        try:
+            interval = ThroughputInterval(
+                index=payload["index"],
+                start=payload.get("start"),
+                end=payload.get("end"),
+                rate_mbps=payload["rate_mbps"],
+                mean_mbps=payload["mean_mbps"],
+                ci_width_mbps=payload.get("ci_width_mbps"),
+                received_at=received_ms
+            )
+        except (KeyError, ValueError):
+            logger.warning(f"[TraceStore] Ignoring malformed interval from {payload.get('device_id')}: {payload}")
+            return
+        with self.lock:
+            trace = self.traces.get(trace_id)
+            if trace is not None:
+                trace.intervals.append(interval)
+
+    def finish(self, trace_id: str, error: Optional[str] = None):
+        """Close a trace and queue it for the JSON-lines export."""
+        with self.lock:
+            trace = self.traces.get(trace_id)
+            if trace is None:
+                return
+            trace.finished_at = _now_ms()
+            trace.error = error
+            response = trace.to_response()
+        if self.exporter is not None:
+            self.exporter.write(response)
+
+    def get(self, trace_id: str) -> Optional[MeasurementTraceResponse]:
+        with self.lock:
+            trace = self.traces.get(trace_id)
+            return trace.to_response() if trace else None
+
+    def close(self):
+        """Flush finished traces that are still queued for export."""
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+# Global trace store, exporting to TRACE_LOG_PATH unless it is set to an empty string
+trace_store = TraceStore(exporter=create_trace_log(TRACE_LOG_PATH) if TRACE_LOG_PATH else None)
@@ -0,0 +1,92 @@
+# waiter_registry.py
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class WaiterRegistry:
+    """
+    asyncio-native registry of coroutines waiting for an MQTT message.
+
+    Waiters are keyed by topic (or any correlation id) and any number of them can wait
+    on the same key; a message resolves all of them. Messages are delivered from the paho
+    network thread with call_soon_threadsafe, so waiting costs a future, not a thread.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.waiters: Dict[str, List[asyncio.Future]] = {}
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop):
+        """Bind the registry to the event loop the waiters live on."""
+        self.loop = loop
+
+    def register(self, key: str) -> asyncio.Future:
+        """
+        Create a waiter for a key. Must be called from the event loop.
+
+        Register before sending the command that triggers the reply, so a fast
+        reply can't arrive before anyone is listening.
+        """
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        future = loop.create_future()
+        self.waiters.setdefault(key, []).append(future)
+        return future
+
+    def resolve(self, key: str, payload: Any):
+        """Deliver a message to every waiter on a key. Safe to call from any thread."""
+        if self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self._resolve, key, payload)
+
+    def _resolve(self, key: str, payload: Any):
+        futures = self.waiters.pop(key, [])
+        for future in futures:
+            if not future.done():
+                future.set_result(payload)
+        if futures:
+            logger.info(f"[WaiterRegistry] Released {len(futures)} waiter(s) for '{key}'")
+
+    async def wait(self, key: str, timeout: float = 30.0, future: Optional[asyncio.Future] = None) -> Optional[Any]:
+        """
+        Wait for a message on a key, reusing a future from register() if given.
+
+        Returns:
+            The message payload or None if timeout
+        """
+        future = future or self.register(key)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[WaiterRegistry] Timeout waiting for '{key}' after {timeout}s")
+            return None
+        finally:
+            self.discard(key, future)
+
+    def discard(self, key: str, future: asyncio.Future):
+        """Remove a single waiter, cancelling it if it is still pending. Must be called from the event loop."""
+        futures = self.waiters.get(key)
+        if futures and future in futures:
+            futures.remove(future)
+            if not futures:
+                del self.waiters[key]
+        if not future.done():
+            future.cancel()
+
+    def cancel(self, key: str) -> int:
+        """Cancel every waiter on a key. Must be called from the event loop."""
+        futures = self.waiters.pop(key, [])
+        for future in futures:
+            future.cancel()
+        return len(futures)
+
+    def __len__(self) -> int:
+        return sum(len(futures) for futures in self.waiters.values())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.waiters
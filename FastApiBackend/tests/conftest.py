@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# Run from FastApiBackend/: `python -m pytest tests`. Modules import each other as top-level packages.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# services.service opens its history database, measurement log and trace file on import; keep them out of ./logs
+_log_dir = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("MEASUREMENT_LOG_PATH", os.path.join(_log_dir, "data_transfer_log.csv"))
+os.environ.setdefault("MEASUREMENT_HISTORY_PATH", os.path.join(_log_dir, "measurement_history.db"))
+os.environ.setdefault("TRACE_LOG_PATH", os.path.join(_log_dir, "traces.jsonl"))
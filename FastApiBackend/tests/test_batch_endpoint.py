@@ -0,0 +1,69 @@
+import asyncio
+import json
+from concurrent.futures import Future
+
+from models.api_model import DataTransferRateRequest, DataTransferRateResponse
+from routers import router as router_module
+from services.scheduler import QueueFullError
+
+
+def make_request(source: str) -> DataTransferRateRequest:
+    return DataTransferRateRequest(source=source, destination="192.168.2.3", path=[], wireless_channel=6)
+
+
+def run_batch(requests):
+    async def scenario():
+        response = await router_module.get_data_transfer_rate_batch_endpoint(requests, mqtt_service=None)
+        return [json.loads(line) async for line in response.body_iterator]
+
+    return asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+
+
+def test_batch_of_invalid_requests_ends_with_an_error_per_line(monkeypatch):
+    def submit(request, mqtt_service):
+        raise ValueError(f"Unknown device IP: {request.source}")
+
+    monkeypatch.setattr(router_module, "submit_measurement", submit)
+    lines = run_batch([make_request("10.0.0.1"), make_request("10.0.0.2")])
+    assert [(line["index"], line["error"]) for line in lines] == [
+        (0, "Unknown device IP: 10.0.0.1"),
+        (1, "Unknown device IP: 10.0.0.2"),
+    ]
+
+
+def test_batch_reports_results_failures_and_cancellations(monkeypatch):
+    def submit(request, mqtt_service):
+        future = Future()
+        if request.source == "192.168.2.1":
+            future.set_result(DataTransferRateResponse(source=request.source, destination=request.destination,
+                                                       rate_mbps=42.0, wireless_channel=6, timestamp=0))
+        elif request.source == "192.168.2.2":
+            future.set_exception(RuntimeError("iperf3 failed"))
+        else:
+            future.cancel()
+        return future
+
+    monkeypatch.setattr(router_module, "submit_measurement", submit)
+    lines = run_batch([make_request("192.168.2.1"), make_request("192.168.2.2"), make_request("192.168.2.4")])
+    by_index = {line["index"]: line for line in lines}
+    assert by_index[0]["result"]["rate_mbps"] == 42.0
+    assert by_index[1]["error"] == "iperf3 failed"
+    assert by_index[2]["error"] == "Measurement was cancelled"
+
+
+def test_full_queue_waits_for_the_hinted_slot(monkeypatch):
+    calls = []
+
+    def submit(request, mqtt_service):
+        calls.append(request.source)
+        if len(calls) == 1:
+            raise QueueFullError(depth=1, retry_after=0)
+        future = Future()
+        future.set_result(DataTransferRateResponse(source=request.source, destination=request.destination,
+                                                   rate_mbps=10.0, wireless_channel=6, timestamp=0))
+        return future
+
+    monkeypatch.setattr(router_module, "submit_measurement", submit)
+    lines = run_batch([make_request("192.168.2.1")])
+    assert calls == ["192.168.2.1", "192.168.2.1"]
+    assert lines[0]["result"]["rate_mbps"] == 10.0
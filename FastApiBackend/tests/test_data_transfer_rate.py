@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from models.api_model import DataTransferRateRequest
+from services import service
+from services.service import MeasurementCache, get_measurement_key
+
+
+class FakeMQTTService:
+    """Configures every node at once and answers the client command with the given telemetry."""
+
+    def __init__(self, telemetry):
+        self.telemetry = telemetry
+
+    def expect_message(self, topic):
+        return None
+
+    def discard_message(self, topic, waiter):
+        pass
+
+    async def send_network_setup(self, server_cmd, forwarder_cmds, client_cmd, ack_timeout=30.0):
+        return {"overall_status": "success", "results": [], "failed_count": 0, "missing_acks": [], "setup_ms": 5.0}
+
+    async def wait_for_message(self, topic, timeout=30.0, waiter=None):
+        return self.telemetry
+
+
+class RecordingLog:
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def sinks(monkeypatch):
+    cache, log = MeasurementCache(ttl_seconds=60, max_entries=8), RecordingLog()
+    monkeypatch.setattr(service, "measurement_cache", cache)
+    monkeypatch.setattr(service, "measurement_log", log)
+    return cache, log
+
+
+REQUEST = DataTransferRateRequest(source="192.168.2.10", destination="192.168.2.30", path=[], wireless_channel=6)
+
+
+def run(telemetry):
+    return asyncio.run(service.run_measurement(REQUEST, FakeMQTTService(telemetry)))
+
+
+def test_successful_measurement_is_cached_and_logged(sinks):
+    cache, log = sinks
+    data = run({"sent_rate_mbps": 42.5})
+    assert data.rate_mbps == 42.5
+    assert cache.get(get_measurement_key(REQUEST)) == data
+    assert log.records == [data]
+
+
+def test_failed_test_raises_and_is_neither_cached_nor_logged(sinks):
+    cache, log = sinks
+    with pytest.raises(RuntimeError, match="iPerf3 test failed"):
+        run({"sent_rate_mbps": 0, "error": "iPerf3 test failed"})
+    assert cache.get(get_measurement_key(REQUEST)) is None
+    assert log.records == []
+
+
+def test_zero_rate_from_a_pi_without_error_field_is_a_failure(sinks):
+    cache, log = sinks
+    with pytest.raises(RuntimeError, match="transferred no data"):
+        run({"sent_rate_mbps": 0})
+    assert cache.get(get_measurement_key(REQUEST)) is None
+    assert log.records == []
@@ -0,0 +1,95 @@
+import pytest
+
+from services import device_registry as registry_module
+from services.device_registry import DeviceRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(registry_module, "time", clock)
+    return clock
+
+
+def test_seeded_devices_resolve_both_ways(clock):
+    registry = DeviceRegistry({"192.168.2.10": "pi-1", "192.168.2.20": "pi-2"}, heartbeat_timeout=30)
+    assert registry.require_thing_id("192.168.2.10") == "pi-1"
+    assert registry.get_ip_by_thing_id("pi-2") == "192.168.2.20"
+    with pytest.raises(ValueError, match="Unknown device IP"):
+        registry.require_thing_id("192.168.2.99")
+
+
+def test_announce_registers_a_new_device(clock):
+    registry = DeviceRegistry(heartbeat_timeout=30)
+    registry.handle_message("devices/pi-3/announce", {"device_id": "pi-3", "ip": "192.168.2.30"})
+
+    assert registry.require_thing_id("192.168.2.30") == "pi-3"
+    [device] = registry.list_devices()
+    assert device.online and not device.static and device.last_seen == 1000000
+
+
+def test_seeded_mapping_survives_an_announce_of_the_testbed_ip(clock):
+    registry = DeviceRegistry({"192.168.2.10": "pi-1", "192.168.2.20": "pi-2"}, heartbeat_timeout=30)
+    registry.handle_message("devices/pi-1/announce", {"device_id": "pi-1", "ip": "192.168.2.10"})
+    registry.handle_message("devices/pi-1/heartbeat", {"ip": "192.168.2.10"})
+
+    assert registry.require_thing_id("192.168.2.10") == "pi-1"
+    assert registry.get_ip_by_thing_id("pi-1") == "192.168.2.10"
+    assert registry.require_thing_id("192.168.2.20") == "pi-2"
+
+
+def test_device_moving_to_a_new_ip_drops_the_old_mapping(clock):
+    registry = DeviceRegistry({"192.168.2.10": "pi-1"}, heartbeat_timeout=30)
+    registry.handle_message("devices/pi-1/heartbeat", {"ip": "192.168.2.11"})
+
+    assert registry.get_thing_id_by_ip("192.168.2.10") is None
+    assert registry.require_thing_id("192.168.2.11") == "pi-1"
+    assert registry.get_ip_by_thing_id("pi-1") == "192.168.2.11"
+
+
+def test_ip_taken_over_by_another_device_evicts_the_old_owner(clock):
+    registry = DeviceRegistry({"192.168.2.10": "pi-1"}, heartbeat_timeout=30)
+    registry.handle_message("devices/pi-9/announce", {"ip": "192.168.2.10"})
+
+    assert registry.require_thing_id("192.168.2.10") == "pi-9"
+    assert registry.get_ip_by_thing_id("pi-1") is None
+
+
+def test_device_expires_without_heartbeats(clock):
+    registry = DeviceRegistry(heartbeat_timeout=30)
+    registry.handle_message("devices/pi-3/announce", {"ip": "192.168.2.30"})
+
+    clock.now += 30
+    assert registry.require_thing_id("192.168.2.30") == "pi-3"
+    clock.now += 1
+    with pytest.raises(ValueError, match="offline"):
+        registry.require_thing_id("192.168.2.30")
+
+    # A heartbeat without an IP keeps the known address alive
+    registry.handle_message("devices/pi-3/heartbeat", {})
+    assert registry.require_thing_id("192.168.2.30") == "pi-3"
+
+
+def test_last_will_marks_a_device_offline(clock):
+    registry = DeviceRegistry({"192.168.2.10": "pi-1"}, heartbeat_timeout=30)
+    registry.handle_message("devices/pi-1/status", {"status": "offline"})
+    with pytest.raises(ValueError, match="offline"):
+        registry.require_thing_id("192.168.2.10")
+
+    registry.handle_message("devices/pi-1/announce", {"ip": "192.168.2.10"})
+    assert registry.require_thing_id("192.168.2.10") == "pi-1"
+
+
+def test_unrelated_topics_are_ignored(clock):
+    registry = DeviceRegistry(heartbeat_timeout=30)
+    registry.handle_message("devices/pi-3", {"ip": "192.168.2.30"})
+    registry.handle_message("devices/pi-3/heartbeat", {})
+    assert registry.list_devices() == []
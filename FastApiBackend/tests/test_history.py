@@ -0,0 +1,130 @@
+import sqlite3
+
+import pytest
+
+from models.api_model import DataTransferRateResponse, IperfProfile
+from services.history import MeasurementHistory
+
+
+def make_record(rate_mbps, channel=6, source="10.0.0.1", destination="10.0.0.2", path=(), timestamp=0,
+                profile=None):
+    return DataTransferRateResponse(source=source, destination=destination, path=list(path),
+                                    rate_mbps=rate_mbps, wireless_channel=channel, timestamp=timestamp,
+                                    profile=profile or IperfProfile())
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = MeasurementHistory(str(tmp_path / "history.db"))
+    yield history
+    history.close()
+
+
+def test_query_filters_and_orders_newest_first(history):
+    history.write_batch([
+        make_record(10.0, timestamp=1),
+        make_record(20.0, timestamp=3, path=["10.0.0.3"]),
+        make_record(30.0, timestamp=2, channel=11),
+    ])
+
+    assert [r.rate_mbps for r in history.query()] == [20.0, 30.0, 10.0]
+    assert [r.rate_mbps for r in history.query(channel=6)] == [20.0, 10.0]
+    assert [r.path for r in history.query(path=["10.0.0.3"])] == [["10.0.0.3"]]
+    assert [r.rate_mbps for r in history.query(since=2, until=3)] == [30.0]
+    assert len(history.query(limit=1)) == 1
+
+
+def test_stats_percentiles_per_channel(history):
+    history.write_batch([make_record(float(rate)) for rate in range(1, 11)] + [make_record(50.0, channel=11)])
+
+    by_channel = {s.wireless_channel: s for s in history.stats(group_by="channel")}
+    six = by_channel[6]
+    assert six.count == 10
+    assert six.mean_mbps == pytest.approx(5.5)
+    assert six.p50_mbps == pytest.approx(5.5)
+    # Linear interpolation between the 9th and 10th of ten sorted rates
+    assert six.p95_mbps == pytest.approx(9.55)
+    assert by_channel[11].p50_mbps == by_channel[11].p95_mbps == 50.0
+
+
+def test_stats_per_path_restore_the_path(history):
+    history.write_batch([
+        make_record(10.0, path=["10.0.0.3"]),
+        make_record(30.0, path=["10.0.0.3"]),
+        make_record(5.0),
+    ])
+
+    [relayed, direct] = history.stats(group_by="path")
+    assert (relayed.path, relayed.count, relayed.mean_mbps) == (["10.0.0.3"], 2, 20.0)
+    assert (direct.path, direct.count) == ([], 1)
+
+
+def test_unknown_grouping_is_rejected(history):
+    with pytest.raises(ValueError):
+        history.stats(group_by="hour")
+
+
+def test_stats_skip_failed_tests_logged_as_zero(history):
+    history.write_batch([make_record(0.0, timestamp=1), make_record(40.0, timestamp=2), make_record(60.0, timestamp=3)])
+
+    [six] = history.stats()
+    assert (six.count, six.mean_mbps) == (2, 50.0)
+    # The raw rows stay queryable
+    assert len(history.query()) == 3
+
+
+def test_stats_never_mix_profiles(history):
+    reverse = IperfProfile(direction="reverse")
+    udp = IperfProfile(protocol="udp", bitrate_mbps=20)
+    history.write_batch([make_record(50.0), make_record(48.0), make_record(30.0, profile=reverse),
+                         make_record(20.0, profile=udp)])
+
+    by_profile = {(s.profile.protocol, s.profile.direction): s for s in history.stats()}
+    assert by_profile[("tcp", "forward")].mean_mbps == 49.0
+    assert by_profile[("tcp", "reverse")].count == 1
+    assert by_profile[("udp", "forward")].profile == udp
+
+    [only_reverse] = history.stats(direction="reverse")
+    assert only_reverse.mean_mbps == 30.0
+    assert [s.mean_mbps for s in history.stats(protocol="udp")] == [20.0]
+
+
+def test_capacity_only_skips_reverse_and_rate_capped_tests(history):
+    history.write_batch([make_record(50.0, timestamp=2), make_record(30.0, profile=IperfProfile(direction="reverse")),
+                         make_record(20.0, profile=IperfProfile(protocol="udp", bitrate_mbps=20)),
+                         make_record(45.0, timestamp=1, profile=IperfProfile(parallel=4))])
+    assert [r.rate_mbps for r in history.query(capacity_only=True)] == [50.0, 45.0]
+    assert history.query(direction="reverse")[0].profile.direction == "reverse"
+
+
+def test_old_database_is_migrated_in_place(tmp_path):
+    path = str(tmp_path / "history.db")
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE measurements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT NOT NULL, destination TEXT NOT NULL,
+            path TEXT NOT NULL, path_hash TEXT NOT NULL, wireless_channel INTEGER,
+            rate_mbps REAL NOT NULL, timestamp INTEGER NOT NULL, setup_ms REAL
+        );
+        CREATE TABLE paths (path_hash TEXT PRIMARY KEY, path TEXT NOT NULL);
+        INSERT INTO measurements (source, destination, path, path_hash, wireless_channel, rate_mbps, timestamp)
+            VALUES ('10.0.0.1', '10.0.0.2', '[]', 'x', 6, 40.0, 1);
+    """)
+    connection.close()
+
+    history = MeasurementHistory(path)
+    history.write_batch([make_record(50.0, timestamp=2, profile=IperfProfile(duration=10))])
+
+    # Old rows read back with the default profile and still count as capacity measurements
+    [old] = history.query(until=2)
+    assert old.profile == IperfProfile()
+    assert len(history.query(capacity_only=True)) == 2
+    # ...and are grouped with new rows of the default profile
+    [summary] = history.stats()
+    assert (summary.count, summary.mean_mbps) == (2, 45.0)
+    history.close()
+
+    # Reopening an already migrated database changes nothing
+    reopened = MeasurementHistory(path)
+    assert len(reopened.query()) == 2
+    reopened.close()
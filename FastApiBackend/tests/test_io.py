@@ -0,0 +1,115 @@
+import csv
+import os
+import threading
+import time
+
+import pytest
+
+from utils.io import BackgroundWriter, RotatingCsvWriter
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        return list(csv.reader(file))
+
+
+def test_header_is_written_once(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = RotatingCsvWriter(path, ["a", "b"])
+    writer.write_batch([{"a": 1, "b": 2}])
+    writer.close()
+    writer = RotatingCsvWriter(path, ["a", "b"])
+    writer.write_batch([{"a": 3, "b": 4}])
+    writer.close()
+
+    assert read_rows(path) == [["a", "b"], ["1", "2"], ["3", "4"]]
+
+
+def test_size_rotation_starts_a_new_file(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = RotatingCsvWriter(path, ["a"], rotation="size", max_bytes=10)
+    writer.write_batch([{"a": "x" * 10}])
+    writer.write_batch([{"a": "y"}])
+    writer.close()
+
+    rotated = [name for name in os.listdir(tmp_path) if name != "log.csv"]
+    assert len(rotated) == 1
+    assert read_rows(tmp_path / rotated[0]) == [["a"], ["x" * 10]]
+    assert read_rows(path) == [["a"], ["y"]]
+
+
+def test_daily_rotation_names_the_file_after_its_day(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = RotatingCsvWriter(path, ["a"])
+    writer.write_batch([{"a": 1}])
+    writer.opened_day = "2000-01-01"
+    writer.write_batch([{"a": 2}])
+    writer.close()
+
+    assert read_rows(tmp_path / "log.2000-01-01.csv") == [["a"], ["1"]]
+    assert read_rows(path) == [["a"], ["2"]]
+
+
+def test_file_with_other_columns_is_moved_aside(tmp_path):
+    path = tmp_path / "log.csv"
+    path.write_text("a\n1\n", encoding="utf-8")
+    day = time.strftime("%Y-%m-%d", time.localtime(os.path.getmtime(path)))
+
+    writer = RotatingCsvWriter(str(path), ["a", "b"])
+    writer.write_batch([{"a": 2, "b": 3}])
+    writer.close()
+
+    assert read_rows(tmp_path / f"log.{day}.csv") == [["a"], ["1"]]
+    assert read_rows(path) == [["a", "b"], ["2", "3"]]
+
+
+def test_unknown_rotation_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        RotatingCsvWriter(str(tmp_path / "log.csv"), ["a"], rotation="hourly")
+
+
+class RecordingSink:
+    def __init__(self):
+        self.batches = []
+        self.closed = False
+        self.flushed = threading.Event()
+
+    def write_batch(self, records):
+        self.batches.append(list(records))
+        self.flushed.set()
+
+    def close(self):
+        self.closed = True
+
+
+def test_background_writer_flushes_full_batches():
+    sink = RecordingSink()
+    writer = BackgroundWriter([sink], batch_size=2, flush_interval=60)
+    for record in range(3):
+        writer.write(record)
+    assert sink.flushed.wait(5)
+    writer.close()
+
+    assert sink.batches == [[0, 1], [2]]
+    assert sink.closed
+
+
+def test_background_writer_flushes_after_the_interval():
+    sink = RecordingSink()
+    writer = BackgroundWriter([sink], batch_size=100, flush_interval=0.01)
+    writer.write("record")
+    assert sink.flushed.wait(5)
+    assert sink.batches == [["record"]]
+    writer.close()
+
+
+def test_failing_sink_does_not_stop_the_others():
+    class BrokenSink(RecordingSink):
+        def write_batch(self, records):
+            raise OSError("disk full")
+
+    sink = RecordingSink()
+    writer = BackgroundWriter([BrokenSink(), sink], batch_size=1, flush_interval=60)
+    writer.write("record")
+    writer.close()
+    assert sink.batches == [["record"]]
@@ -0,0 +1,119 @@
+from concurrent.futures import Future
+
+import pytest
+
+from models.api_model import DataTransferRateRequest, DataTransferRateResponse, IperfProfile
+from services import service
+from services.service import InFlightMeasurements, MeasurementCache, get_measurement_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(service, "time", clock)
+    return clock
+
+
+def make_response(rate_mbps=50.0):
+    return DataTransferRateResponse(source="10.0.0.1", destination="10.0.0.2", rate_mbps=rate_mbps,
+                                    wireless_channel=6, timestamp=0)
+
+
+def test_entry_expires_after_the_ttl(clock):
+    cache = MeasurementCache(ttl_seconds=30, max_entries=8)
+    cache.put("key", make_response())
+
+    clock.now += 30
+    assert cache.get("key").rate_mbps == 50.0
+    clock.now += 0.1
+    assert cache.get("key") is None
+    assert cache.get_stats().size == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_max_age_only_tightens_the_ttl(clock):
+    cache = MeasurementCache(ttl_seconds=30, max_entries=8)
+    cache.put("key", make_response())
+    clock.now += 10
+
+    assert cache.get("key", max_age=5) is None
+    # Too old for this caller, still fresh for others
+    assert cache.get("key", max_age=60).rate_mbps == 50.0
+    assert cache.get_stats().size == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = MeasurementCache(ttl_seconds=30, max_entries=2)
+    cache.put("a", make_response(1.0))
+    cache.put("b", make_response(2.0))
+    cache.get("a")
+    cache.put("c", make_response(3.0))
+
+    assert cache.get("b") is None
+    assert cache.get("a").rate_mbps == 1.0
+    assert cache.get("c").rate_mbps == 3.0
+    assert cache.evictions == 1
+
+
+def test_zero_entries_disables_the_cache(clock):
+    cache = MeasurementCache(ttl_seconds=30, max_entries=0)
+    cache.put("key", make_response())
+    assert cache.get("key") is None
+
+
+def test_key_is_the_measured_route():
+    request = DataTransferRateRequest(source="10.0.0.1", destination="10.0.0.2", path=["10.0.0.3"], wireless_channel=6)
+    same = DataTransferRateRequest(source="10.0.0.1", destination="10.0.0.2", path=["10.0.0.3"], wireless_channel=6,
+                                   max_age=5)
+    other_channel = request.model_copy(update={"wireless_channel": 11})
+    direct = request.model_copy(update={"path": []})
+
+    assert get_measurement_key(request) == get_measurement_key(same)
+    assert get_measurement_key(request) != get_measurement_key(other_channel)
+    assert get_measurement_key(request) != get_measurement_key(direct)
+
+
+def test_key_separates_profiles_and_precision():
+    request = DataTransferRateRequest(source="10.0.0.1", destination="10.0.0.2", path=["10.0.0.3"], wireless_channel=6)
+    same = DataTransferRateRequest(source="10.0.0.1", destination="10.0.0.2", path=["10.0.0.3"], wireless_channel=6)
+    reverse = request.model_copy(update={"profile": IperfProfile(direction="reverse")})
+    precise = request.model_copy(update={"ci_width_mbps": 2.0})
+
+    assert get_measurement_key(request) == get_measurement_key(same)
+    assert get_measurement_key(request) != get_measurement_key(reverse)
+    assert get_measurement_key(request) != get_measurement_key(precise)
+
+
+def test_identical_request_attaches_to_the_measurement_in_flight():
+    in_flight = InFlightMeasurements()
+    submitted = []
+
+    def submit():
+        submitted.append(Future())
+        return submitted[-1]
+
+    first, attached = in_flight.get_or_submit("key", submit)
+    assert not attached
+    second, attached = in_flight.get_or_submit("key", submit)
+    assert attached and second is first
+    assert len(submitted) == 1
+
+    first.set_result(make_response())
+    # Once done the entry is dropped, the next request measures again
+    third, attached = in_flight.get_or_submit("key", submit)
+    assert not attached and third is not first
+
+
+def test_failed_measurement_leaves_the_single_flight_table():
+    in_flight = InFlightMeasurements()
+    future, _ = in_flight.get_or_submit("key", Future)
+    future.set_exception(RuntimeError("no telemetry"))
+    assert "key" not in in_flight.futures
@@ -0,0 +1,90 @@
+import pytest
+import paho.mqtt.client as mqtt
+
+from mqtt_core import mqtt_client as client_module
+from mqtt_core.mqtt_client import MQTTClient, PublishResult
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakePaho:
+    """Stands in for paho's client: records publishes and fails them on demand."""
+
+    def __init__(self):
+        self.published = []
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+
+    def publish(self, topic, payload, qos=0):
+        if self.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.published.append(topic)
+        return type("MessageInfo", (), {"rc": self.rc})()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(client_module, "time", clock)
+    monkeypatch.setattr(client_module, "MQTT_OUTBOUND_TTL_SECONDS", 30.0)
+    return clock
+
+
+@pytest.fixture
+def client(clock):
+    client = MQTTClient()
+    client.client = FakePaho()
+    return client
+
+
+def test_connected_publish_is_sent(client):
+    client.is_connected = True
+    assert client.send_command_to_pi("pi-1", {"role": "server"}) is PublishResult.SENT
+    assert client.client.published == ["command/pi-1/req/start"]
+
+
+def test_rejected_publish_fails(client):
+    client.is_connected = True
+    client.client.rc = mqtt.MQTT_ERR_NO_CONN
+    assert client.send_command_to_pi("pi-1", {"role": "server"}) is PublishResult.FAILED
+
+
+def test_offline_publish_is_buffered_not_sent(client):
+    assert client.send_command_to_pi("pi-1", {"role": "server"}) is PublishResult.BUFFERED
+    assert client.client.published == []
+    assert client.get_status()["buffered_commands"] == 1
+
+
+def test_offline_publish_can_refuse_the_buffer(client):
+    assert client.send_command_to_pi("pi-1", {"role": "client"}, buffer_if_offline=False) is PublishResult.FAILED
+    assert client.get_status()["buffered_commands"] == 0
+
+
+def test_buffered_commands_expire_after_the_ttl(client, clock):
+    client.send_command_to_pi("pi-1", {"role": "server"})
+    clock.now += 20
+    client.send_command_to_pi("pi-2", {"role": "server"})
+    clock.now += 15
+
+    client._flush_outbound_buffer()
+    # pi-1's command is 35 s old and dropped, pi-2's is 15 s old and replayed
+    assert client.client.published == ["command/pi-2/req/start"]
+    assert client.dropped_messages == 1
+    assert client.get_status()["buffered_commands"] == 0
+
+
+def test_full_buffer_drops_the_oldest_command(client, monkeypatch):
+    client.outbound_buffer = client_module.deque(maxlen=2)
+    for device in ("pi-1", "pi-2", "pi-3"):
+        client.send_command_to_pi(device, {"role": "server"})
+    client._flush_outbound_buffer()
+    assert client.client.published == ["command/pi-2/req/start", "command/pi-3/req/start"]
+    assert client.dropped_messages == 1
+
+
+def test_not_started_client_fails(clock):
+    assert MQTTClient().send_command_to_pi("pi-1", {"role": "server"}) is PublishResult.FAILED
@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import paho.mqtt.client as mqtt
+
+from models.mqtt_model import ClientCommand, ForwarderCommand, ServerCommand
+from mqtt_core.mqtt_client import MQTTClient
+from services.mqtt_service import MQTTService, get_ack_topic
+
+
+class FakePaho:
+    """Records publishes; devices listed in `acks` answer their command like a Pi would."""
+
+    def __init__(self, service=None, acks=(), failing=()):
+        self.service = service
+        self.acks = set(acks)
+        self.failing = set(failing)
+        self.published = []
+        self.commands = {}
+
+    def publish(self, topic, payload, qos=0):
+        device_id = topic.split("/")[1]
+        if device_id in self.failing:
+            return type("MessageInfo", (), {"rc": mqtt.MQTT_ERR_NO_CONN})()
+        self.published.append(device_id)
+        value = json.loads(payload)["value"]
+        self.commands[device_id] = value
+        if device_id in self.acks:
+            ack = {"status": "configured"}
+            if value["role"] == "server":
+                ack.update(iperf_port=5203, lease_id="lease-1")
+            self.service.receive_results(get_ack_topic(device_id, value["request_id"]), ack)
+        return type("MessageInfo", (), {"rc": mqtt.MQTT_ERR_SUCCESS})()
+
+
+def make_service(**fake_kwargs):
+    client = MQTTClient()
+    client.is_connected = True
+    service = MQTTService(client)
+    client.client = FakePaho(service, **fake_kwargs)
+    return service, client.client
+
+
+def make_commands():
+    common = dict(wireless_channel=6, region="DE", request_id="req-1")
+    server = ServerCommand(device_id="pi-3", ip_client="192.168.2.1", previous_ip="192.168.2.2", **common)
+    forwarder = ForwarderCommand(device_id="pi-2", ip_routing_next="192.168.2.3", ip_routing_previous="192.168.2.1",
+                                 ip_server="192.168.2.3", ip_client="192.168.2.1", **common)
+    client = ClientCommand(device_id="pi-1", ip_server="192.168.2.3", ip_routing="192.168.2.2", **common)
+    return server, [forwarder], client
+
+
+def test_client_is_sent_once_every_device_acked():
+    service, fake = make_service(acks={"pi-3", "pi-2"})
+    result = asyncio.run(service.send_network_setup(*make_commands(), ack_timeout=1.0))
+    assert result["overall_status"] == "success"
+    assert fake.published == ["pi-3", "pi-2", "pi-1"]
+    assert result["missing_acks"] == []
+
+
+def test_publish_error_fails_without_waiting_for_acks():
+    service, fake = make_service(failing={"pi-2"})
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        # A long ack timeout would be noticed if setup waited for the server's ack
+        result = await service.send_network_setup(*make_commands(), ack_timeout=30.0)
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert elapsed < 1.0
+    assert result["overall_status"] == "partial_failure"
+    assert result["failed_count"] == 1
+    assert "pi-1" not in fake.published
+    assert len(service.waiting_for_messages) == 0
+
+
+def test_missing_ack_fails_and_the_client_is_never_sent():
+    service, fake = make_service(acks={"pi-3"})
+    result = asyncio.run(service.send_network_setup(*make_commands(), ack_timeout=0.05))
+    assert result["overall_status"] != "success"
+    assert result["missing_acks"] == ["pi-2"]
+    assert "pi-1" not in fake.published
+    forwarder_result = next(r for r in result["results"] if r["device_id"] == "pi-2")
+    assert forwarder_result["status"] == "error"
+
+
+def test_buffered_setup_command_counts_once_acked():
+    service, fake = make_service(acks={"pi-3", "pi-2"})
+    service.mqtt_client.is_connected = False
+    server, forwarders, client = make_commands()
+
+    async def scenario():
+        setup = asyncio.ensure_future(service.send_network_setup(server, forwarders, client, ack_timeout=1.0))
+        await asyncio.sleep(0)
+        # The broker comes back and the buffered server and forwarder commands go out
+        service.mqtt_client.is_connected = True
+        service.mqtt_client._flush_outbound_buffer()
+        return await setup
+
+    result = asyncio.run(scenario())
+    assert result["overall_status"] == "success"
+    assert fake.published == ["pi-3", "pi-2", "pi-1"]
+
+
+def test_client_connects_to_the_port_the_server_leased():
+    service, fake = make_service(acks={"pi-3", "pi-2"})
+    result = asyncio.run(service.send_network_setup(*make_commands(), ack_timeout=1.0))
+    assert result["overall_status"] == "success"
+    assert fake.commands["pi-1"]["iperf_port"] == 5203
+
+
+def test_server_without_a_port_pool_leaves_the_client_on_its_default_port():
+    service, fake = make_service(acks={"pi-2"})
+    server, forwarders, client = make_commands()
+
+    async def scenario():
+        setup = asyncio.ensure_future(service.send_network_setup(server, forwarders, client, ack_timeout=1.0))
+        await asyncio.sleep(0.01)
+        # An older Pi acks without iperf_port
+        service.receive_results(get_ack_topic("pi-3", "req-1"), {"status": "configured"})
+        return await setup
+
+    result = asyncio.run(scenario())
+    assert result["overall_status"] == "success"
+    assert fake.commands["pi-1"]["iperf_port"] is None
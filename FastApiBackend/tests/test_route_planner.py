@@ -0,0 +1,80 @@
+import pytest
+
+from models.api_model import DataTransferRateResponse
+from services.route_planner import RouteGraph, predict_route_rate
+
+
+def measured(source, destination, rate_mbps, path=(), channel=6, timestamp=0):
+    return DataTransferRateResponse(source=source, destination=destination, path=list(path),
+                                    rate_mbps=rate_mbps, wireless_channel=channel, timestamp=timestamp)
+
+
+@pytest.fixture
+def graph():
+    graph = RouteGraph(alpha=0.5)
+    graph.write_batch([
+        measured("A", "B", 60.0),
+        measured("B", "C", 40.0),
+        measured("A", "C", 10.0),
+        measured("A", "D", 30.0),
+        measured("D", "C", 30.0),
+    ])
+    return graph
+
+
+def test_route_rate_adds_up_airtime():
+    assert predict_route_rate([60.0, 40.0]) == pytest.approx(24.0)
+    assert predict_route_rate([30.0, 30.0]) == pytest.approx(15.0)
+    assert predict_route_rate([25.0]) == 25.0
+    assert predict_route_rate([100.0, 5.0]) < 5.0
+
+
+def test_suggestions_are_ordered_by_predicted_rate(graph):
+    suggestions = graph.suggest("A", "C", channel=6)
+
+    assert [s.path for s in suggestions] == [["B"], ["D"], []]
+    assert [s.predicted_mbps for s in suggestions] == [24.0, 15.0, 10.0]
+    assert [s.basis for s in suggestions] == ["links", "links", "measured"]
+    assert suggestions[0].bottleneck_mbps == 40.0
+
+
+def test_k_limits_the_suggestions(graph):
+    assert [s.path for s in graph.suggest("A", "C", channel=6, k=1)] == [["B"]]
+
+
+def test_excluded_relays_are_never_suggested(graph):
+    suggestions = graph.suggest("A", "C", channel=6, excluded={"B"})
+    assert [s.path for s in suggestions] == [["D"], []]
+
+    # Excluding an endpoint has no effect
+    assert len(graph.suggest("A", "C", channel=6, excluded={"A", "C"})) == 3
+
+
+def test_measured_route_beats_its_link_prediction(graph):
+    graph.write_batch([measured("A", "C", 30.0, path=["B"])])
+    [best, *_] = graph.suggest("A", "C", channel=6)
+    assert (best.path, best.predicted_mbps, best.basis, best.samples) == (["B"], 30.0, "measured", 1)
+
+
+def test_repeated_measurements_are_smoothed(graph):
+    graph.write_batch([measured("A", "C", 30.0)])
+    direct = [s for s in graph.suggest("A", "C", channel=6) if s.path == []][0]
+    assert (direct.predicted_mbps, direct.samples) == (20.0, 2)
+
+
+def test_channels_are_kept_apart_and_pooled(graph):
+    graph.write_batch([measured("A", "E", 50.0, channel=11)])
+    assert graph.suggest("A", "E", channel=6) == []
+    assert [s.path for s in graph.suggest("A", "E", channel=11)] == [[]]
+    assert [s.path for s in graph.suggest("A", "E")] == [[]]
+    assert graph.suggest("A", "C", channel=36) == []
+
+
+def test_failed_measurements_are_ignored(graph):
+    graph.write_batch([measured("A", "F", 0.0)])
+    assert graph.suggest("A", "F", channel=6) == []
+
+
+def test_source_must_differ_from_destination(graph):
+    with pytest.raises(ValueError):
+        graph.suggest("A", "A")
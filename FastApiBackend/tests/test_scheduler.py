@@ -0,0 +1,183 @@
+import asyncio
+
+import pytest
+
+from models.api_model import DataTransferRateRequest, DataTransferRateResponse
+from services.scheduler import MeasurementScheduler, QueueFullError
+
+
+def make_request(source, destination, path=(), channel=1):
+    return DataTransferRateRequest(source=source, destination=destination, path=list(path), wireless_channel=channel)
+
+
+class FakeTestbed:
+    """Measurement coroutines that hold the testbed until released, recording the order they started in."""
+
+    def __init__(self):
+        self.started = []
+        self.gates = {}
+
+    def measure(self, name, request):
+        async def run():
+            self.started.append(name)
+            gate = self.gates[name] = asyncio.Event()
+            await gate.wait()
+            return DataTransferRateResponse(source=request.source, destination=request.destination,
+                                            rate_mbps=1.0, wireless_channel=request.wireless_channel, timestamp=0)
+        return run
+
+    def submit(self, scheduler, name, request):
+        return asyncio.wrap_future(scheduler.submit(request, self.measure(name, request)))
+
+    async def release(self, name):
+        self.gates[name].set()
+        # Let the measurement finish and the scheduler dispatch whatever it unblocked
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_disjoint_measurements_run_in_parallel():
+    async def scenario():
+        scheduler, testbed = MeasurementScheduler(max_parallel=4, max_pending=8), FakeTestbed()
+        first = testbed.submit(scheduler, "a", make_request("10.0.0.1", "10.0.0.2", channel=1))
+        second = testbed.submit(scheduler, "b", make_request("10.0.0.3", "10.0.0.4", channel=11))
+        await settle()
+        assert testbed.started == ["a", "b"]
+        await testbed.release("a")
+        await testbed.release("b")
+        assert (await first).source == "10.0.0.1"
+        assert (await second).source == "10.0.0.3"
+
+    asyncio.run(scenario())
+
+
+def test_measurements_sharing_a_node_run_one_at_a_time():
+    async def scenario():
+        scheduler, testbed = MeasurementScheduler(max_parallel=4, max_pending=8), FakeTestbed()
+        first = testbed.submit(scheduler, "a", make_request("10.0.0.1", "10.0.0.3", path=["10.0.0.2"], channel=1))
+        second = testbed.submit(scheduler, "b", make_request("10.0.0.2", "10.0.0.4", channel=11))
+        await settle()
+        assert testbed.started == ["a"]
+        assert scheduler.get_status()["pending"] == 1
+
+        await testbed.release("a")
+        assert testbed.started == ["a", "b"]
+        await testbed.release("b")
+        await asyncio.gather(first, second)
+
+    asyncio.run(scenario())
+
+
+def test_waiting_measurement_blocks_newer_conflicting_ones():
+    async def scenario():
+        scheduler, testbed = MeasurementScheduler(max_parallel=4, max_pending=8), FakeTestbed()
+        testbed.submit(scheduler, "a", make_request("10.0.0.1", "10.0.0.2", channel=1))
+        # b waits for a; c only conflicts with b, but must not overtake it
+        testbed.submit(scheduler, "b", make_request("10.0.0.2", "10.0.0.3", channel=11))
+        testbed.submit(scheduler, "c", make_request("10.0.0.3", "10.0.0.4", channel=36))
+        await settle()
+        assert testbed.started == ["a"]
+
+        await testbed.release("a")
+        assert testbed.started == ["a", "b"]
+        await testbed.release("b")
+        assert testbed.started == ["a", "b", "c"]
+        await testbed.release("c")
+
+    asyncio.run(scenario())
+
+
+def test_interfering_channels_conflict():
+    async def scenario():
+        scheduler, testbed = MeasurementScheduler(max_parallel=4, max_pending=8), FakeTestbed()
+        testbed.submit(scheduler, "a", make_request("10.0.0.1", "10.0.0.2", channel=1))
+        testbed.submit(scheduler, "b", make_request("10.0.0.3", "10.0.0.4", channel=2))
+        await settle()
+        assert testbed.started == ["a"]
+        await testbed.release("a")
+        await testbed.release("b")
+
+    asyncio.run(scenario())
+
+
+def test_max_parallel_caps_running_measurements():
+    async def scenario():
+        scheduler, testbed = MeasurementScheduler(max_parallel=1, max_pending=8), FakeTestbed()
+        testbed.submit(scheduler, "a", make_request("10.0.0.1", "10.0.0.2", channel=1))
+        testbed.submit(scheduler, "b", make_request("10.0.0.3", "10.0.0.4", channel=11))
+        await settle()
+        assert testbed.started == ["a"]
+        await testbed.release("a")
+        assert testbed.started == ["a", "b"]
+        await testbed.release("b")
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_raises_with_retry_hint():
+    async def scenario():
+        scheduler, testbed = MeasurementScheduler(max_parallel=1, max_pending=1, duration_estimate=12), FakeTestbed()
+        testbed.submit(scheduler, "running", make_request("10.0.0.1", "10.0.0.2"))
+        await settle()
+        testbed.submit(scheduler, "pending", make_request("10.0.0.1", "10.0.0.2"))
+
+        with pytest.raises(QueueFullError) as error:
+            scheduler.submit(make_request("10.0.0.1", "10.0.0.2"), testbed.measure("rejected", None))
+        assert error.value.retry_after == 12
+
+        await testbed.release("running")
+        await testbed.release("pending")
+        assert testbed.started == ["running", "pending"]
+
+    asyncio.run(scenario())
+
+
+def test_failed_measurement_frees_its_nodes():
+    async def scenario():
+        scheduler = MeasurementScheduler(max_parallel=4, max_pending=8)
+
+        async def fail():
+            raise RuntimeError("setup failed")
+
+        failed = asyncio.wrap_future(scheduler.submit(make_request("10.0.0.1", "10.0.0.2"), fail))
+        with pytest.raises(RuntimeError):
+            await failed
+        await settle()
+        assert scheduler.get_status()["running"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_cancels_pending_measurements():
+    async def scenario():
+        scheduler, testbed = MeasurementScheduler(max_parallel=4, max_pending=8), FakeTestbed()
+        testbed.submit(scheduler, "a", make_request("10.0.0.1", "10.0.0.2"))
+        pending = scheduler.submit(make_request("10.0.0.1", "10.0.0.2"), testbed.measure("b", None))
+        await settle()
+        scheduler.shutdown()
+        assert pending.cancelled()
+        await testbed.release("a")
+
+    asyncio.run(scenario())
+
+
+def test_queue_position_and_estimated_wait():
+    async def scenario():
+        scheduler, testbed = MeasurementScheduler(max_parallel=1, max_pending=8, duration_estimate=10), FakeTestbed()
+        running = scheduler.submit(make_request("10.0.0.1", "10.0.0.2"), testbed.measure("a", None))
+        await settle()
+        second = scheduler.submit(make_request("10.0.0.1", "10.0.0.2"), testbed.measure("b", None))
+        scheduler.submit(make_request("10.0.0.3", "10.0.0.4", channel=11), testbed.measure("c", None))
+
+        assert scheduler.get_position(running) == 0
+        assert scheduler.get_position(second) == 1
+        assert [item.estimated_wait_seconds for item in scheduler.get_queue()] == [10.0, 20.0]
+        scheduler.shutdown()
+        await testbed.release("a")
+
+    asyncio.run(scenario())
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+from services.waiter_registry import WaiterRegistry
+
+
+def test_message_resolves_every_waiter_on_its_topic():
+    async def scenario():
+        registry = WaiterRegistry()
+        first, second = registry.register("ack/1"), registry.register("ack/1")
+        other = registry.register("ack/2")
+        registry.resolve("ack/1", {"status": "configured"})
+
+        assert await first == {"status": "configured"}
+        assert await second == {"status": "configured"}
+        assert not other.done()
+        assert "ack/1" not in registry and len(registry) == 1
+        registry.cancel("ack/2")
+
+    asyncio.run(scenario())
+
+
+def test_message_from_another_thread_wakes_the_waiter():
+    async def scenario():
+        registry = WaiterRegistry()
+        waiter = registry.register("telemetry/1")
+        # paho delivers messages on its own network thread
+        threading.Thread(target=registry.resolve, args=("telemetry/1", {"sent_rate_mbps": 42.0})).start()
+        assert await registry.wait("telemetry/1", timeout=1.0, future=waiter) == {"sent_rate_mbps": 42.0}
+        assert len(registry) == 0
+
+    asyncio.run(scenario())
+
+
+def test_reply_before_wait_is_kept_by_an_early_registration():
+    async def scenario():
+        registry = WaiterRegistry()
+        waiter = registry.register("ack/1")
+        registry.resolve("ack/1", {"status": "configured"})
+        await asyncio.sleep(0)
+        assert await registry.wait("ack/1", timeout=0.1, future=waiter) == {"status": "configured"}
+
+    asyncio.run(scenario())
+
+
+def test_wait_times_out_with_none_and_cleans_up():
+    async def scenario():
+        registry = WaiterRegistry()
+        assert await registry.wait("ack/1", timeout=0.01) is None
+        assert len(registry) == 0
+        # A late reply finds nobody waiting and is dropped
+        registry.resolve("ack/1", {"status": "configured"})
+        await asyncio.sleep(0)
+        assert len(registry) == 0
+
+    asyncio.run(scenario())
+
+
+def test_discard_cancels_a_single_waiter():
+    async def scenario():
+        registry = WaiterRegistry()
+        kept, dropped = registry.register("ack/1"), registry.register("ack/1")
+        registry.discard("ack/1", dropped)
+        assert dropped.cancelled()
+        assert len(registry) == 1
+
+        registry.resolve("ack/1", {"status": "configured"})
+        assert await kept == {"status": "configured"}
+
+    asyncio.run(scenario())
+
+
+def test_cancel_cancels_every_waiter_on_a_topic():
+    async def scenario():
+        registry = WaiterRegistry()
+        waiters = [registry.register("ack/1") for _ in range(3)]
+        assert registry.cancel("ack/1") == 3
+        assert all(waiter.cancelled() for waiter in waiters)
+        assert registry.cancel("ack/1") == 0
+
+    asyncio.run(scenario())
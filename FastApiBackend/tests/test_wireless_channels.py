@@ -0,0 +1,65 @@
+from constants.wireless_channels import CHANNEL_INFO
+from utils.wireless_channels import ChannelCatalog, channel_catalog, get_command_region
+
+
+CATALOG = ChannelCatalog({
+    1: {"frequency": 2412, "regions": ("gr", "US")},
+    6: {"frequency": 2437, "regions": ("GR",)},
+    11: {"frequency": 2462, "regions": ("US",)},
+    13: {"frequency": 2472, "regions": ("GR",)},
+    14: {"frequency": 2484, "regions": ()},
+    36: {"frequency": 5180, "regions": ("GR",)},
+    40: {"frequency": 5200, "regions": ("GR",)},
+})
+
+
+def test_overlap_matrix_is_symmetric_and_reflexive():
+    for a in CATALOG.channels:
+        assert CATALOG.interfere(a, a)
+        for b in CATALOG.channels:
+            assert CATALOG.interfere(a, b) == CATALOG.interfere(b, a)
+
+
+def test_channels_overlap_when_closer_than_half_their_widths():
+    # 22 MHz wide 2.4 GHz channels 25 MHz apart clear each other, 20 MHz 5 GHz channels 20 MHz apart too
+    assert not CATALOG.interfere(1, 6)
+    assert not CATALOG.interfere(36, 40)
+    assert CATALOG.interfere(11, 13)
+    # Exactly half the combined width apart is just clear
+    assert not CATALOG.interfere(11, 14)
+    assert not CATALOG.interfere(1, 36)
+
+
+def test_unknown_channels_interfere_with_everything():
+    assert CATALOG.interfere(None, 1)
+    assert CATALOG.interfere(1, 165)
+    assert CATALOG.overlapping(165) == list(CATALOG.channels)
+    assert CATALOG.overlapping(11) == [11, 13]
+
+
+def test_matrix_matches_the_pairwise_definition_for_the_real_table():
+    for a, info_a in CHANNEL_INFO.items():
+        for b, info_b in CHANNEL_INFO.items():
+            width_a = 22 if info_a["frequency"] < 5000 else 20
+            width_b = 22 if info_b["frequency"] < 5000 else 20
+            expected = abs(info_a["frequency"] - info_b["frequency"]) < (width_a + width_b) / 2
+            assert channel_catalog.interfere(a, b) == expected, (a, b)
+
+
+def test_region_index_is_case_insensitive():
+    assert CATALOG.channels_for_region("gr") == (1, 6, 13, 36, 40)
+    assert CATALOG.channels_for_region("US") == (1, 11)
+    assert CATALOG.channels_for_region("JP") == ()
+
+
+def test_legality_per_region_and_anywhere():
+    assert CATALOG.is_allowed(11, "us")
+    assert not CATALOG.is_allowed(11, "GR")
+    assert CATALOG.is_allowed(6)
+    assert not CATALOG.is_allowed(14)
+    assert not CATALOG.is_allowed(165)
+
+
+def test_command_region_is_stable():
+    assert get_command_region(1) == "GR"
+    assert get_command_region(14) is None
@@ -1,30 +1,208 @@
 import os
 import csv
+import json
+import queue
+import logging
+import threading
+import time
 from datetime import datetime
+from typing import Any, Callable, Dict, IO, List, Optional
 from models.api_model import DataTransferRateResponse  # Adjust import if needed
+from utils.metrics import MEASUREMENT_PHASE_SECONDS
 
-def save_data_transfer_rate_to_file(
-    response: DataTransferRateResponse,
-    file_path: str = "data_transfer_log.csv"
-):
-    if not response.timestamp:
-        response.timestamp = datetime.utcnow().isoformat()
-    
-    record = response.dict()
-
-    # ✅ Ensure directory exists
-    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
-
-    # Check if file exists to determine if we need to write headers
-    file_exists = os.path.exists(file_path)
-
-    # Open file in append mode
-    with open(file_path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=record.keys())
-        
+logger = logging.getLogger(__name__)
+
+# Columns of the measurement log; only ever append, a file with other columns is moved aside on open
+CSV_FIELDNAMES = ["source", "destination", "rate_mbps", "wireless_channel", "timestamp", "protocol", "direction"]
+
+
+def to_measurement_row(record: DataTransferRateResponse) -> Dict[str, Any]:
+    """CSV row of a measurement, with its test profile flattened into the protocol and direction columns."""
+    return dict(record.model_dump(), protocol=record.profile.protocol, direction=record.profile.direction)
+
+
+class RotatingCsvWriter:
+    """
+    Append-only CSV file with fixed columns that rotates by size or by calendar day.
+
+    The file handle stays open between batches. On rotation the current file is renamed
+    with a date (daily) or timestamp (size) suffix, e.g. data_transfer_log.2026-10-17.csv,
+    and a new file with a header is started.
+    """
+
+    def __init__(self, file_path: str, fieldnames: List[str], rotation: str = "daily",
+                 max_bytes: int = 10 * 1024 * 1024, to_row: Callable[[Any], Dict[str, Any]] = dict):
+        if rotation not in ("daily", "size"):
+            raise ValueError(f"Unknown log rotation '{rotation}', expected 'daily' or 'size'")
+        self.file_path = file_path
+        self.fieldnames = fieldnames
+        self.rotation = rotation
+        self.max_bytes = max_bytes
+        self.to_row = to_row
+        self.file: Optional[IO[str]] = None
+        self.writer: Optional[csv.DictWriter] = None
+        self.opened_day: Optional[str] = None
+
+    def _open(self):
+        # ✅ Ensure directory exists
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        # A file written with other columns (by an older version) is rotated out, so every file has one header
+        if self._header() not in (None, self.fieldnames):
+            self.opened_day = self._file_day()
+            self._move_aside()
+        self.file = open(self.file_path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction="ignore")
         # Write header only if file is new/empty
-        if not file_exists or os.path.getsize(file_path) == 0:
-            writer.writeheader()
-        
-        # Write the record
-        writer.writerow(record)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+        self.opened_day = self._file_day()
+
+    def _header(self) -> Optional[List[str]]:
+        """Columns of the existing file, None if there is none yet."""
+        if not os.path.exists(self.file_path) or os.path.getsize(self.file_path) == 0:
+            return None
+        with open(self.file_path, newline="", encoding="utf-8") as file:
+            return next(csv.reader(file), None)
+
+    def _file_day(self) -> str:
+        """Day the current file belongs to: the day it was last written, or today for a new file."""
+        if os.path.exists(self.file_path) and os.path.getsize(self.file_path) > 0:
+            return datetime.fromtimestamp(os.path.getmtime(self.file_path)).strftime("%Y-%m-%d")
+        return datetime.now().strftime("%Y-%m-%d")
+
+    def _should_rotate(self) -> bool:
+        if self.rotation == "daily":
+            return self.opened_day != datetime.now().strftime("%Y-%m-%d")
+        return self.file.tell() >= self.max_bytes
+
+    def _rotate(self):
+        self.close()
+        self._move_aside()
+        self._open()
+
+    def _move_aside(self):
+        root, ext = os.path.splitext(self.file_path)
+        suffix = self.opened_day if self.rotation == "daily" else datetime.now().strftime("%Y%m%dT%H%M%S")
+        rotated_path = f"{root}.{suffix}{ext}"
+        counter = 1
+        while os.path.exists(rotated_path):
+            rotated_path = f"{root}.{suffix}-{counter}{ext}"
+            counter += 1
+        os.replace(self.file_path, rotated_path)
+        logger.info(f"Rotated measurement log to {rotated_path}")
+
+    def write_batch(self, records: List[Any]):
+        with MEASUREMENT_PHASE_SECONDS.labels("csv_write").time():
+            if self.file is None:
+                self._open()
+            if self._should_rotate():
+                self._rotate()
+            self.writer.writerows(self.to_row(record) for record in records)
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.writer = None
+
+
+class JsonLinesWriter:
+    """Append-only JSON-lines file, one record per line; the file handle stays open between batches."""
+
+    def __init__(self, file_path: str, to_record: Callable[[Any], Dict[str, Any]] = dict):
+        self.file_path = file_path
+        self.to_record = to_record
+        self.file: Optional[IO[str]] = None
+
+    def write_batch(self, records: List[Any]):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            self.file = open(self.file_path, "a", encoding="utf-8")
+        self.file.writelines(json.dumps(self.to_record(record)) + "\n" for record in records)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class BackgroundWriter:
+    """
+    Queue records in memory and flush them in batches on a background thread.
+
+    write() never touches the disk: a batch is handed to every sink's write_batch once it
+    reaches batch_size records or flush_interval seconds have passed since its first record.
+    close() drains the queue, flushes whatever is left and closes the sinks.
+    """
+
+    _STOP = object()
+
+    def __init__(self, sinks: List[Any], batch_size: int = 100,
+                 flush_interval: float = 1.0, name: str = "background-writer"):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records: "queue.Queue[Any]" = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def write(self, record: Any):
+        self.records.put_nowait(record)
+
+    def _flush(self, batch: List[Any]):
+        for sink in self.sinks:
+            try:
+                sink.write_batch(batch)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} record(s) to {type(sink).__name__}: {e}")
+
+    def _run(self):
+        batch: List[Any] = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                record = self.records.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+
+            if record is self._STOP:
+                if batch:
+                    self._flush(batch)
+                for sink in self.sinks:
+                    sink.close()
+                return
+            if record is not None:
+                batch.append(record)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+    def close(self, timeout: float = 10.0):
+        """Flush everything queued so far and stop the background thread."""
+        self.records.put(self._STOP)
+        self.thread.join(timeout)
+
+
+def create_measurement_log(file_path: str, rotation: str = "daily", max_bytes: int = 10 * 1024 * 1024,
+                           batch_size: int = 100, flush_interval: float = 1.0,
+                           extra_sinks: Optional[List[Any]] = None) -> BackgroundWriter:
+    """
+    Background writer that appends DataTransferRateResponses to a rotating CSV log
+    and hands the same batches to any extra sinks (e.g. the measurement history).
+    """
+    csv_writer = RotatingCsvWriter(file_path, CSV_FIELDNAMES, rotation, max_bytes,
+                                   to_row=to_measurement_row)
+    return BackgroundWriter([csv_writer, *(extra_sinks or [])], batch_size, flush_interval, name="measurement-log")
+
+
+def create_trace_log(file_path: str, batch_size: int = 100, flush_interval: float = 1.0) -> BackgroundWriter:
+    """Background writer that appends finished measurement traces to a JSON-lines file."""
+    jsonl_writer = JsonLinesWriter(file_path, to_record=lambda trace: trace.model_dump())
+    return BackgroundWriter([jsonl_writer], batch_size, flush_interval, name="trace-log")
@@ -0,0 +1,30 @@
+# metrics.py
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# Measurements span milliseconds (a publish) to minutes (a slow iperf run)
+PHASE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Time spent in each phase of a measurement:
+#   command_publish  one MQTT publish of a server/forwarder/client command
+#   node_setup       setup commands published until every server/forwarder acked
+#   iperf_run        client command published until its telemetry arrived
+#   telemetry_wait   telemetry waiter registered until telemetry arrived or timed out
+#   csv_write        one batch appended to the CSV measurement log
+MEASUREMENT_PHASE_SECONDS = Histogram(
+    "measurement_phase_seconds",
+    "Duration of each phase of a data transfer rate measurement",
+    ["phase"],
+    buckets=PHASE_BUCKETS
+)
+
+MQTT_RECONNECTS = Counter("mqtt_reconnects_total", "Unexpected disconnects from the MQTT broker")
+MQTT_PUBLISH_FAILURES = Counter("mqtt_publish_failures_total", "Commands that could not be published to a Pi")
+TELEMETRY_TIMEOUTS = Counter("telemetry_timeouts_total", "Measurements that got no telemetry before the timeout")
+UNKNOWN_DEVICES = Counter("unknown_devices_total", "Requests naming an IP that is not in the device registry")
+MEASUREMENTS_REJECTED = Counter("measurements_rejected_total", "Measurements refused with a 429 because the queue was full")
+MEASUREMENTS_COALESCED = Counter("measurements_coalesced_total", "Requests answered by an identical measurement already in flight")
+MEASUREMENTS_STOPPED_EARLY = Counter("measurements_stopped_early_total", "iperf3 tests ended once their confidence interval was narrow enough")
+
+MEASUREMENTS_IN_FLIGHT = Gauge("measurements_in_flight", "Measurements currently running on the testbed")
+MQTT_WAITERS = Gauge("mqtt_waiters", "Coroutines waiting for an MQTT message in MQTTService.waiting_for_messages")
@@ -1,6 +1,10 @@
 # utils.py
-from constants.things import ThingsConstants
+from services.device_registry import device_registry
 
 def get_thing_id_by_ip(ip: str) -> str:
     """Get thing ID for a given IP address."""
-    return ThingsConstants.IP_TO_THING_ID.get(ip)
\ No newline at end of file
+    return device_registry.get_thing_id_by_ip(ip)
+
+def require_thing_id(ip: str) -> str:
+    """Get thing ID for a given IP address, raising ValueError if it is unknown or offline."""
+    return device_registry.require_thing_id(ip)
@@ -1,29 +1,101 @@
-from typing import Optional, Tuple, Union, List
+from typing import Dict, FrozenSet, List, Optional, Tuple, Union
+import numpy as np
 from constants.wireless_channels import CHANNEL_INFO
 
 
+class ChannelCatalog:
+    """
+    Channel table precomputed once at import: per-channel frequency, width and region set,
+    a region -> channels index and a spectral-overlap matrix, so legality and interference
+    checks are dictionary/array lookups instead of scans of CHANNEL_INFO.
+    """
+
+    def __init__(self, channel_info: Dict[int, dict]):
+        self.channels: Tuple[int, ...] = tuple(sorted(channel_info))
+        self.index: Dict[int, int] = {channel: i for i, channel in enumerate(self.channels)}
+        self.frequencies = np.array([channel_info[channel]["frequency"] for channel in self.channels], dtype=np.int64)
+        # 22 MHz for 2.4GHz DSSS, 20 MHz for 5GHz OFDM
+        self.widths = np.where(self.frequencies < 5000, 22, 20)
+        self.regions: Dict[int, FrozenSet[str]] = {
+            channel: frozenset(region.upper() for region in channel_info[channel]["regions"])
+            for channel in self.channels
+        }
+        region_index: Dict[str, List[int]] = {}
+        for channel in self.channels:
+            for region in self.regions[channel]:
+                region_index.setdefault(region, []).append(channel)
+        self.region_index: Dict[str, Tuple[int, ...]] = {region: tuple(channels) for region, channels in region_index.items()}
+        self.legal_channels: FrozenSet[int] = frozenset(channel for channel in self.channels if self.regions[channel])
+
+        # Two channels overlap when their centre frequencies are closer than half their combined widths
+        distance = np.abs(self.frequencies[:, None] - self.frequencies[None, :])
+        self.overlap = distance * 2 < self.widths[:, None] + self.widths[None, :]
+
+    def frequency(self, channel: Optional[int]) -> Optional[int]:
+        i = self.index.get(channel)
+        return None if i is None else int(self.frequencies[i])
+
+    def width(self, channel: Optional[int]) -> Optional[int]:
+        i = self.index.get(channel)
+        return None if i is None else int(self.widths[i])
+
+    def interfere(self, channel_a: Optional[int], channel_b: Optional[int]) -> bool:
+        """Unknown channels are assumed to interfere with everything."""
+        i, j = self.index.get(channel_a), self.index.get(channel_b)
+        if i is None or j is None:
+            return True
+        return bool(self.overlap[i, j])
+
+    def is_allowed(self, channel: Optional[int], region: Optional[str] = None) -> bool:
+        """Whether the channel may be used in the region, or in any region when none is given."""
+        if region is None:
+            return channel in self.legal_channels
+        return region.upper() in self.regions.get(channel, ())
+
+    def channels_for_region(self, region: str) -> Tuple[int, ...]:
+        return self.region_index.get(region.upper(), ())
+
+    def overlapping(self, channel: int) -> List[int]:
+        """Every known channel that interferes with this one, itself included."""
+        i = self.index.get(channel)
+        if i is None:
+            return list(self.channels)
+        return [self.channels[j] for j in np.flatnonzero(self.overlap[i])]
+
+
+# Global catalog, built once from the constants table
+channel_catalog = ChannelCatalog(CHANNEL_INFO)
+
 
 # Helper functions
 def get_channel_frequency(channel: int) -> int:
     """Get frequency for a channel"""
-    info = CHANNEL_INFO.get(channel)
-    return info["frequency"] if info else None
+    return channel_catalog.frequency(channel)
+
+def get_channel_width(channel: int) -> Optional[int]:
+    """Get the occupied bandwidth of a channel in MHz (22 for 2.4GHz DSSS, 20 for 5GHz OFDM)"""
+    return channel_catalog.width(channel)
+
+def channels_interfere(channel_a: Optional[int], channel_b: Optional[int]) -> bool:
+    """Check if two channels overlap in spectrum. Unknown channels are assumed to interfere with everything"""
+    return channel_catalog.interfere(channel_a, channel_b)
 
-def get_channel_regions(channel: int) -> tuple:
+def get_channel_regions(channel: int) -> FrozenSet[str]:
     """Get regions where this channel is allowed"""
-    info = CHANNEL_INFO.get(channel)
-    return info["regions"] if info else ()
+    return channel_catalog.regions.get(channel, frozenset())
+
+def get_command_region(channel: int) -> Optional[str]:
+    """Regulatory region the Pis are configured with (`iw reg set`) for a channel, None if it is allowed nowhere"""
+    regions = get_channel_regions(channel)
+    return min(regions) if regions else None
 
 def is_channel_allowed_in_region(channel: int, region: str) -> bool:
     """Check if channel is allowed in specific region"""
-    regions = get_channel_regions(channel)
-    return region.upper() in regions
+    return channel_catalog.is_allowed(channel, region)
 
 def get_channels_for_region(region: str) -> list:
     """Get all channels allowed in a region"""
-    return [channel for channel, info in CHANNEL_INFO.items() 
-            if region.upper() in info["regions"]]
-
+    return list(channel_catalog.channels_for_region(region))
 
 def get_region(regions: Union[Tuple, List[Tuple]]) -> Optional[Tuple]:
     """
@@ -45,4 +117,4 @@ def get_region(regions: Union[Tuple, List[Tuple]]) -> Optional[Tuple]:
         # List/tuple of tuples
         return regions[0]
 
-    return None
\ No newline at end of file
+    return None
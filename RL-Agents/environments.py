@@ -3,6 +3,45 @@ import requests
 import time
 
 
+def post_measurement(endpoint, request_data, max_retries=3, delay=2, max_queue_wait=600):
+    """
+    POST a measurement request and return the JSON response, or None if every attempt failed.
+
+    A 429 means the backend's measurement queue is full: wait for the Retry-After it sends,
+    which reflects how fast the testbed is finishing measurements, without using up an attempt
+    (up to max_queue_wait seconds in total). Other failures are retried with exponential backoff.
+    """
+    attempt = 1
+    queue_wait = 0
+
+    while True:
+        try:
+            time.sleep(2)
+            response = requests.post(endpoint, json=request_data, timeout = 100)
+
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 429:
+                retry_after = float(response.headers.get("Retry-After", delay))
+                if queue_wait + retry_after <= max_queue_wait:
+                    print(f"⏳ Testbed busy, retrying in {retry_after:g} seconds...")
+                    queue_wait += retry_after
+                    time.sleep(retry_after)
+                    continue
+            print(f"❌ Attempt {attempt}: HTTP {response.status_code} - {response.text}")
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Attempt {attempt}: Request error: {e}")
+
+        if attempt < max_retries:
+            sleep_time = delay * ( 2 ** (attempt - 1))
+            print(f"⏳ Retrying in {sleep_time} seconds...")
+            time.sleep(sleep_time)
+            attempt += 1
+        else:
+            print("🚫 All retries failed.")
+            return None
+
+
 #Make a super class for wirelessEnv and subclasses wirelesschannelEnv and wirelessroutingEnv 
 
 class WirelessChannelEnv:
@@ -44,30 +83,7 @@ class WirelessChannelEnv:
         }
 
 
-        max_retries = 3
-        delay = 2
-
-        for attempt in range (1, max_retries + 1):
-
-            try:
-                time.sleep(2)
-                response = requests.post(self.reward_endpoint, json=request_data, timeout = 100)
-
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    print(f"❌ Attempt {attempt}: HTTP {response.status_code} - {response.text}")
-            except requests.exceptions.RequestException as e:
-                print(f"❌ Attempt {attempt}: Request error: {e}")
-            
-
-            if attempt < max_retries:
-                sleep_time = delay * ( 2 ** (attempt - 1))
-                print(f"⏳ Retrying in {sleep_time} seconds...")
-                time.sleep(sleep_time)
-            else:
-                print("🚫 All retries failed.")
-                return None
+        return post_measurement(self.reward_endpoint, request_data)
 
 
     def get_reward(self, channel):
@@ -144,30 +160,7 @@ class WirelessRouteEnv:
         }
 
 
-        max_retries = 3
-        delay = 2
-
-        for attempt in range (1, max_retries + 1):
-
-            try:
-                time.sleep(2)
-                response = requests.post(self.reward_endpoint, json=request_data, timeout = 100)
-
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    print(f"❌ Attempt {attempt}: HTTP {response.status_code} - {response.text}")
-            except requests.exceptions.RequestException as e:
-                print(f"❌ Attempt {attempt}: Request error: {e}")
-            
-
-            if attempt < max_retries:
-                sleep_time = delay * ( 2 ** (attempt - 1))
-                print(f"⏳ Retrying in {sleep_time} seconds...")
-                time.sleep(sleep_time)
-            else:
-                print("🚫 All retries failed.")
-                return None
+        return post_measurement(self.reward_endpoint, request_data)
 
     
 
@@ -0,0 +1,62 @@
+import math
+
+
+# Two-sided 95% quantiles of Student's t distribution for 1..30 degrees of freedom
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+Z_95 = 1.960
+
+
+class RateConvergence:
+    """
+    Running mean of per-interval iperf3 rates and the width of its 95% confidence interval.
+
+    With a target width, converged() turns true once at least min_intervals rates are in and
+    the interval mean +- t * s / sqrt(n) is no wider than the target, so a stable link can end
+    its test early. Without a target it only keeps the statistics for the telemetry.
+    """
+
+    def __init__(self, ci_width_mbps=None, min_intervals=3):
+        self.ci_width_mbps = ci_width_mbps
+        self.min_intervals = max(2, min_intervals)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.stopped_early = False
+
+    def add(self, rate_mbps):
+        # Welford's update, numerically stable for long runs
+        self.count += 1
+        delta = rate_mbps - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (rate_mbps - self.mean)
+
+    @property
+    def width(self):
+        """Full width of the 95% confidence interval of the mean, None below two intervals."""
+        if self.count < 2:
+            return None
+        t = T_95[self.count - 2] if self.count - 1 <= len(T_95) else Z_95
+        return 2 * t * math.sqrt(self.m2 / (self.count - 1) / self.count)
+
+    def converged(self):
+        if self.ci_width_mbps is None or self.count < self.min_intervals:
+            return False
+        return self.width <= self.ci_width_mbps
+
+    def summary(self):
+        width = self.width
+        return {
+            "intervals": self.count,
+            "ci_width_mbps": round(width, 2) if width is not None else None,
+            "stopped_early": self.stopped_early
+        }
+
+
+def interval_rate_mbps(interval, key="sum"):
+    """Rate of one iperf3 interval (the `sum` of all streams, or `sum_bidir_reverse`), None for omitted intervals."""
+    total = interval.get(key) or {}
+    if total.get("omitted") or "bits_per_second" not in total:
+        return None
+    return total["bits_per_second"] / 1e6
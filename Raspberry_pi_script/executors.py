@@ -0,0 +1,15 @@
+import subprocess
+
+
+class SubprocessExecutor:
+    """
+    Runs the Pi's system commands for real. MqttDevice sends every `iw`, `iwconfig`, `ip route`,
+    `sysctl`, `pkill` and `iperf3` call through an executor, so simulation.SimulatedExecutor can
+    stand in for the hardware with the same run()/popen() interface.
+    """
+
+    def run(self, cmd, **kwargs):
+        return subprocess.run(cmd, **kwargs)
+
+    def popen(self, cmd, **kwargs):
+        return subprocess.Popen(cmd, **kwargs)
@@ -0,0 +1,88 @@
+from convergence import interval_rate_mbps
+
+
+DIRECTIONS = ("forward", "reverse", "bidirectional")
+PROTOCOLS = ("tcp", "udp")
+
+
+class IperfProfile:
+    """
+    How the client runs its iperf3 test, from the `profile` of a client command. Missing fields
+    keep iperf3's defaults: a 10 s TCP test, one stream, client to server.
+
+    Figures are reported per direction: "uplink" is client to server, "downlink" server to client.
+    A forward test measures the uplink, a reverse test (-R) the downlink and a bidirectional test
+    (--bidir) both at once.
+    """
+
+    def __init__(self, duration=10, parallel=1, direction="forward", protocol="tcp", bitrate_mbps=None):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown iperf3 direction '{direction}'")
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown iperf3 protocol '{protocol}'")
+        self.duration = int(duration)
+        self.parallel = int(parallel)
+        self.direction = direction
+        self.protocol = protocol
+        self.bitrate_mbps = bitrate_mbps
+
+    @classmethod
+    def from_message(cls, profile):
+        return cls(**{key: value for key, value in (profile or {}).items() if value is not None})
+
+    @property
+    def primary(self):
+        """Direction whose rate is the measurement's headline rate and drives early stop."""
+        return "downlink" if self.direction == "reverse" else "uplink"
+
+    def client_args(self):
+        args = ["-t", str(self.duration)]
+        if self.parallel > 1:
+            args += ["-P", str(self.parallel)]
+        if self.direction == "reverse":
+            args.append("-R")
+        elif self.direction == "bidirectional":
+            args.append("--bidir")
+        if self.protocol == "udp":
+            args.append("-u")
+        if self.bitrate_mbps is not None:
+            args += ["-b", f"{self.bitrate_mbps}M"]
+        return args
+
+    def direction_rates(self, result):
+        """
+        {direction: figures} from an iperf3 result: sent and received Mbit/s, plus retransmits for
+        TCP and jitter and loss for UDP. A test stopped early has no end summary; its interval
+        means stand in for both rates.
+        """
+        keys = {self.primary: ("sum_sent", "sum_received", "sum")}
+        if self.direction == "bidirectional":
+            keys["downlink"] = ("sum_sent_bidir_reverse", "sum_received_bidir_reverse", "sum_bidir_reverse")
+
+        end = result.get("end") or {}
+        rates = {}
+        for direction, (sent_key, received_key, sum_key) in keys.items():
+            sent, received, total = end.get(sent_key), end.get(received_key), end.get(sum_key)
+            figures = {}
+            if sent is None and total is None:
+                interval_rates = [rate for rate in (interval_rate_mbps(interval, sum_key)
+                                                    for interval in result.get("intervals", []))
+                                  if rate is not None]
+                if not interval_rates:
+                    continue
+                figures["sent_mbps"] = figures["received_mbps"] = sum(interval_rates) / len(interval_rates)
+            elif self.protocol == "udp":
+                # Older iperf3 only gives the sender's UDP sum; the loss tells what arrived
+                stats = total or received or sent
+                figures["sent_mbps"] = (sent or stats)["bits_per_second"] / 1e6
+                figures["received_mbps"] = (received["bits_per_second"] / 1e6 if received is not None
+                                            else figures["sent_mbps"] * (1 - stats.get("lost_percent", 0) / 100))
+                figures["jitter_ms"] = stats.get("jitter_ms")
+                figures["lost_percent"] = stats.get("lost_percent")
+            else:
+                figures["sent_mbps"] = sent["bits_per_second"] / 1e6
+                figures["received_mbps"] = received["bits_per_second"] / 1e6
+                figures["retransmits"] = sent.get("retransmits")
+            rates[direction] = {key: round(value, 2) if isinstance(value, float) else value
+                                for key, value in figures.items()}
+        return rates
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+import uuid
+
+
+class NoFreePortError(Exception):
+    """Every port of the iperf3 server pool is leased to a running measurement."""
+
+
+class IperfLease:
+    """A port of the pool reserved for one measurement until its telemetry arrives or the lease expires."""
+
+    def __init__(self, request_id, port, expires_at):
+        self.request_id = request_id
+        self.port = port
+        self.expires_at = expires_at
+        self.lease_id = uuid.uuid4().hex
+
+
+class IperfServerPool:
+    """
+    Long-lived `iperf3 -s -p <port>` servers, one per port in [base_port, base_port + size).
+
+    The servers are started once and keep listening between measurements, so the server role
+    never kills and respawns iperf3 for a test. Each measurement leases the lowest free port for
+    its request_id; the port and lease id go back to the backend in the server's ack, and the
+    backend hands the port to the client. The lease ends when the measurement's own telemetry
+    arrives, or after lease_timeout seconds if it never does (a client that crashed, a lost
+    message). A server that has exited is restarted when its port is leased.
+
+    lease() runs on the command worker and release() on paho's network thread, hence the lock.
+    """
+
+    def __init__(self, executor, base_port=5201, size=4, lease_timeout=300.0, logger=None, clock=time.monotonic):
+        if size < 1:
+            raise ValueError("The iperf3 server pool needs at least one port")
+        self.executor = executor
+        self.ports = range(base_port, base_port + size)
+        self.lease_timeout = lease_timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock
+        self.processes = {}
+        self.leases = {}  # request_id -> IperfLease
+        self.lock = threading.Lock()
+
+    @property
+    def default_port(self):
+        """Port clients connect to when the command names none, e.g. from a backend without leases."""
+        return self.ports[0]
+
+    def start(self):
+        # Servers left over from an earlier run would hold the ports
+        self.executor.run(["sudo", "pkill", "-f", "iperf3.*-s"], check=False)
+        for port in self.ports:
+            self.ensure_running(port)
+        self.logger.info(f"iperf3 servers listening on ports {self.ports.start}-{self.ports.stop - 1}")
+
+    def ensure_running(self, port):
+        """Start the server on port unless it is already running. Returns True if it was (re)started."""
+        process = self.processes.get(port)
+        if process is not None and process.poll() is None:
+            return False
+        self.processes[port] = self.executor.popen(["iperf3", "-s", "-p", str(port)])
+        return True
+
+    def lease(self, request_id):
+        """
+        Reserve the lowest free port for request_id. A repeated command for the same
+        request_id keeps its lease. Raises NoFreePortError when every port is taken.
+        """
+        with self.lock:
+            now = self.clock()
+            for stale in [lease for lease in self.leases.values() if lease.expires_at <= now]:
+                del self.leases[stale.request_id]
+                self.logger.warning(f"iperf3 port {stale.port} lease of {stale.request_id} expired without telemetry")
+
+            lease = self.leases.get(request_id)
+            if lease is None:
+                taken = {lease.port for lease in self.leases.values()}
+                port = next((port for port in self.ports if port not in taken), None)
+                if port is None:
+                    raise NoFreePortError(f"All {len(self.ports)} iperf3 ports are leased")
+                lease = self.leases[request_id] = IperfLease(request_id, port, now + self.lease_timeout)
+            return lease
+
+    def release(self, request_id):
+        """End the lease of request_id; returns it, or None if it held none."""
+        with self.lock:
+            return self.leases.pop(request_id, None)
+
+    def stop(self):
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        self.processes.clear()
+        with self.lock:
+            self.leases.clear()
@@ -0,0 +1,84 @@
+import logging
+import os
+import socket
+
+try:
+    from pyroute2 import IPRoute
+except ImportError:  # optional: without pyroute2 the Pi configures routes with `ip`/`sysctl` subprocesses
+    IPRoute = None
+
+
+IP_FORWARD_PATH = "/proc/sys/net/ipv4/ip_forward"
+
+
+class NetlinkNetwork:
+    """
+    Reads and rewrites the Pi's host routes over one persistent netlink socket.
+
+    apply() is the whole route and forwarding setup of a command in one call: one route dump,
+    a delete for every stale testbed route, a replace for every wanted route that is missing
+    or points elsewhere, and a direct write of the ip_forward sysctl. This replaces the
+    `ip route show`, `ip route del`, `ip route add` and `sysctl` processes, one per step, of
+    the subprocess path. The requests are sent one after another over the same socket, each
+    waiting for its reply; they are not one atomic transaction, so a failure partway leaves
+    the earlier changes in place. Changing routes needs CAP_NET_ADMIN, so the script must run
+    as root.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.ipr = IPRoute()
+
+    def get_routes(self, subnet_prefix):
+        """Current gateway host routes into the testbed subnet, as {destination: gateway}."""
+        routes = {}
+        for route in self.ipr.get_routes(family=socket.AF_INET, table=254):
+            destination = route.get_attr("RTA_DST")
+            gateway = route.get_attr("RTA_GATEWAY")
+            if gateway and destination and route["dst_len"] == 32 and destination.startswith(subnet_prefix):
+                routes[destination] = gateway
+        return routes
+
+    def apply(self, routes, subnet_prefix, ip_forward=False):
+        """
+        Make {destination: gateway} the only testbed host routes and enable forwarding if asked.
+        Returns the number of route changes made. Raises on the first failed request, with the
+        changes before it already applied.
+        """
+        current = self.get_routes(subnet_prefix)
+        changes = 0
+        for destination, gateway in current.items():
+            # Routes that only change gateway are handled by the replace below
+            if destination not in routes:
+                self.ipr.route("del", dst=destination, dst_len=32, gateway=gateway)
+                changes += 1
+        for destination, gateway in routes.items():
+            if current.get(destination) != gateway:
+                self.ipr.route("replace", dst=destination, dst_len=32, gateway=gateway)
+                changes += 1
+        if ip_forward:
+            with open(IP_FORWARD_PATH, "w") as file:
+                file.write("1")
+        return changes
+
+    def close(self):
+        self.ipr.close()
+
+
+def create_netlink_network(logger=None):
+    """
+    A NetlinkNetwork, or None when pyroute2 is missing or the process can't change routes.
+    Netlink was asked for when this is called, so falling back is logged as a warning.
+    """
+    logger = logger or logging.getLogger(__name__)
+    if IPRoute is None:
+        logger.warning("Netlink requested but pyroute2 is not installed, configuring routes with subprocesses")
+        return None
+    if os.geteuid() != 0:
+        logger.warning("Netlink requested but not running as root, configuring routes with sudo subprocesses")
+        return None
+    try:
+        return NetlinkNetwork(logger)
+    except Exception as e:
+        logger.warning(f"Netlink unavailable ({e}), configuring routes with subprocesses")
+        return None
@@ -0,0 +1,26 @@
+class NodeState:
+    """
+    What the Pi believes its radio and routing are configured to: regulatory region, channel,
+    IP forwarding flag and the manual host routes in the testbed subnet ({destination: gateway}).
+
+    None means unknown (at startup, or after a step failed), which forces that part to be applied
+    in full. MqttDevice.configure() diffs every command against this model and runs only the
+    steps that change something.
+    """
+
+    def __init__(self):
+        self.region = None
+        self.channel = None
+        self.ip_forward = None
+        self.routes = None
+
+    def invalidate(self):
+        self.__init__()
+
+    def route_changes(self, routes):
+        """(stale, missing): current routes to delete and wanted routes to add. Only valid when routes are known."""
+        stale = {destination: gateway for destination, gateway in self.routes.items()
+                 if routes.get(destination) != gateway}
+        missing = {destination: gateway for destination, gateway in routes.items()
+                   if self.routes.get(destination) != gateway}
+        return stale, missing
@@ -1,10 +1,19 @@
 import logging
+import os
 import time
 import json
 import paho.mqtt.client as mqtt
 import subprocess
 import re
-from  dotenc import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from executors import SubprocessExecutor
+from netlink import create_netlink_network
+from iperf_server import IperfServerPool, NoFreePortError
+from node_state import NodeState
+from convergence import RateConvergence, interval_rate_mbps
+from iperf_profile import IperfProfile
 
 load_dotenv()
 
@@ -15,8 +24,30 @@ class MqttDevice:
     DEVICE_ID = os.getenv("DEVICE_ID")
     MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST")
     MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", 1883))
-
-    def __init__(self, logger=None):
+    HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", 10))
+    IPERF_RETRY_DELAY = float(os.getenv("IPERF_RETRY_DELAY", 5))
+    # Long-lived iperf3 servers listen on IPERF_PORT .. IPERF_PORT + IPERF_PORT_COUNT - 1, leased per measurement
+    IPERF_PORT = int(os.getenv("IPERF_PORT", 5201))
+    IPERF_PORT_COUNT = int(os.getenv("IPERF_PORT_COUNT", 4))
+    # A lease whose telemetry never arrives frees its port after this many seconds
+    IPERF_LEASE_TIMEOUT = float(os.getenv("IPERF_LEASE_TIMEOUT", 300))
+    # A test with a ci_width_mbps target runs at least this many 1 s intervals before it may stop early
+    IPERF_MIN_INTERVALS = int(os.getenv("IPERF_MIN_INTERVALS", 3))
+    # Only manual host routes inside the testbed subnet are flushed between commands
+    ROUTE_SUBNET_PREFIX = os.getenv("ROUTE_SUBNET_PREFIX", "192.168.2.")
+    # "netlink" batches route and forwarding changes over netlink when possible, "subprocess" always forks ip/sysctl
+    NETWORK_BACKEND = os.getenv("NETWORK_BACKEND", "netlink")
+    # Ad hoc interface of the testbed; its address is the IP the Pi announces (eth0 may carry another one)
+    TESTBED_INTERFACE = os.getenv("TESTBED_INTERFACE", "wlan0")
+
+    def __init__(self, logger=None, executor=None, device_id=None, broker_host=None, broker_port=None,
+                 username=None, password=None, result_file="result.json", network_backend=None):
+        # Arguments override the environment, so many devices can share one process (see simulation.py)
+        self.DEVICE_ID = device_id or self.DEVICE_ID
+        self.MQTT_BROKER_HOST = broker_host or self.MQTT_BROKER_HOST
+        self.MQTT_BROKER_PORT = broker_port or self.MQTT_BROKER_PORT
+        self.DEVICE_USERNAME = username or self.DEVICE_USERNAME
+        self.DEVICE_PASSWORD = password or self.DEVICE_PASSWORD
         required_vars = [
             self.DEVICE_USERNAME,
             self.DEVICE_PASSWORD,
@@ -28,6 +59,18 @@ class MqttDevice:
             raise EnvironmentError("Missing one or more required environment variables")
         self.logger = logger or logging.getLogger(__name__)
         logging.basicConfig(level=logging.INFO)
+        # Every system command goes through the executor: the real shell, or a simulated Pi
+        self.executor = executor or SubprocessExecutor()
+        self.result_file = result_file
+        # Route/forwarding changes of the current command, applied in one netlink pass by apply_network()
+        self.netlink = None
+        if (network_backend or self.NETWORK_BACKEND) == "netlink":
+            self.netlink = create_netlink_network(self.logger)
+        self.logger.info(f"Network backend: {'netlink' if self.netlink is not None else 'subprocess'}")
+        self.pending_routes = {}
+        self.pending_ip_forward = False
+        # Radio and routing state the node is known to be in, so commands only apply what changed
+        self.node_state = NodeState()
         
 
         self.client = mqtt.Client()
@@ -38,18 +81,35 @@ class MqttDevice:
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
+        # Retained last will, so the backend marks us offline if we drop off without saying goodbye
+        self.client.will_set(
+            f"devices/{self.DEVICE_ID}/status",
+            json.dumps({"device_id": self.DEVICE_ID, "status": "offline"}),
+            qos=1,
+            retain=True
+        )
 
         # we add a gloabl variable for the role
         self.current_role = None
-        self.iperf_server_process = None
+        self.iperf_pool = IperfServerPool(self.executor, self.IPERF_PORT, self.IPERF_PORT_COUNT,
+                                          self.IPERF_LEASE_TIMEOUT, self.logger)
+        # Whether the local iperf3 can stream its intervals (--json-stream), probed on the first client run
+        self.iperf_json_stream = None
+        self.last_heartbeat = 0.0
+        # Timed steps of the command being handled, sent back with its ack or telemetry
+        self.spans = []
+        # Role handlers run here, one at a time and in arrival order, never on paho's network thread
+        self.command_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.DEVICE_ID}-command")
 
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.logger.info("✅ Successfully connected to MQTT broker")
             command_topic = f"command/{self.DEVICE_ID}/req/#"
             self.client.subscribe(command_topic)
-            self.client.subscribe("telemetry")
             self.logger.info(f"📥 Subscribed to command topic: {command_topic}")
+            # Results end the iperf3 port leases of the measurements we serve; intervals are not results
+            self.client.subscribe([("telemetry", 0), ("telemetry/+", 0)])
+            self.announce()
         else:
             self.logger.error(f"❌ Connection failed with code {rc}")
 
@@ -58,48 +118,66 @@ class MqttDevice:
 
     def _on_message(self, client, userdata, msg):
         try:
-            self.logger.info(f"📩 Received message on topic '{msg.topic}': {msg.payload.decode()}")
-
-
-            # If telemetry message and we're server, stop iperf3
-            if msg.topic == "telemetry" and self.current_role == "server":
-                self.logger.info("📊 Client finished, stopping iperf3 server")
-                subprocess.run(["sudo", "pkill", "-f", "iperf3.*-s"], check=False)
-                self.current_role = None
+            if msg.topic == "telemetry" or msg.topic.startswith("telemetry/"):
+                self.release_iperf_port(msg.topic.partition("/")[2] or None)
                 return
-    
+            self.logger.info(f"📩 Received message on topic '{msg.topic}': {msg.payload.decode()}")
             payload = json.loads(msg.payload)
-            message = payload.get('value', {})
+        except Exception as e:
+            self.logger.error(f"❗ Error processing message: {e}")
+            return
+        # A role can block for the whole iperf3 test. Publishes made from the network thread are only
+        # queued until the callback returns, so acks and streamed intervals must come from the worker
+        self.command_worker.submit(self.handle_command, payload.get('value', {}))
+
+    def handle_command(self, message):
+        try:
             role = message.get("role")
+            self.spans = []
 
 
             if role == "server":
-                self.flush_routes()
                 region = message.get("region")
                 wireless_channel = message.get("wireless_channel")
                 ip_client = message.get("ip_client")
                 ip_previous = message.get("previous_ip")
-                self.dataTransferServer(wireless_channel, region, ip_client, ip_previous)
+                request_id = message.get("request_id")
+                try:
+                    lease = self.dataTransferServer(wireless_channel, region, ip_client, ip_previous, request_id)
+                    self.send_ack(request_id, role, lease is not None, lease=lease)
+                except NoFreePortError as e:
+                    self.logger.error(f"❗ {e}, refusing measurement {request_id}")
+                    self.send_ack(request_id, role, False, error=str(e))
 
             elif role == "forwarder":
-                self.flush_routes()
                 region = message.get("region")
                 wireless_channel = message.get("wireless_channel")
                 ip_next_routing = message.get("ip_routing_next")
                 ip_previous_routing = message.get("ip_routing_previous")
                 ip_server = message.get("ip_server")
                 ip_client = message.get("ip_client")
-                self.forwarder(wireless_channel, region, ip_next_routing, ip_previous_routing, ip_server, ip_client)
+                configured = self.forwarder(wireless_channel, region, ip_next_routing, ip_previous_routing, ip_server, ip_client)
+                self.send_ack(message.get("request_id"), role, configured)
 
             elif role == "client":
-                self.flush_routes()
                 region = message.get("region")
                 wireless_channel = message.get("wireless_channel")
                 ip_server = message.get("ip_server")
                 ip_routing = message.get("ip_routing")
-                self.dataTransferClient(wireless_channel, region, ip_server, ip_routing)
-                rates = self.extractMeasurement(role)
-                self.send_telemetry(wireless_channel, rates[1])
+                request_id = message.get("request_id")
+                profile = IperfProfile.from_message(message.get("profile"))
+                convergence = self.dataTransferClient(wireless_channel, region, ip_server, ip_routing,
+                                                      request_id, message.get("ci_width_mbps"), profile,
+                                                      message.get("iperf_port"))
+                if convergence is None:
+                    # result_file still holds an older test, never report it as this one
+                    directions, error = {}, "iPerf3 test failed"
+                else:
+                    directions = self.extractMeasurement(role, profile)
+                    error = None if directions else "No iPerf3 result to report"
+                # The headline rate is what the receiver got in the profile's main direction
+                rate = directions.get(profile.primary, {}).get("received_mbps", 0)
+                self.send_telemetry(wireless_channel, rate, request_id, convergence, directions, error)
 
             else:
                 self.logger.warning(f"⚠️ Unknown role received: {role}")
@@ -109,10 +187,140 @@ class MqttDevice:
 
    
 
+    def configure(self, region, wireless_channel, routes, ip_forward=False):
+        # Diff the command against the node's known state and apply only what changed.
+        # Skipped steps are still reported, as zero-length spans marked "skipped"
+        state = self.node_state
+        try:
+            if state.region == region:
+                self.skip("iw reg set")
+            else:
+                self.run_step("iw reg set", ["sudo", "iw", "reg", "set", region], check=True)
+                print(f"[INFO] Set wireless region to: {region}")
+                state.region = region
+                state.channel = None  # a new regulatory domain may move the radio, so set the channel again
+
+            if state.channel == wireless_channel:
+                self.skip("iwconfig channel")
+            else:
+                self.run_step("iwconfig channel", ["sudo", "iwconfig", self.TESTBED_INTERFACE, "channel", str(wireless_channel)], check=True)
+                self.log_interface()
+                state.channel = wireless_channel
+
+            self.configure_routes(routes, ip_forward)
+        except Exception:
+            # A failed step leaves the node in an unknown state; the next command applies everything
+            state.invalidate()
+            raise
+
+    def configure_routes(self, routes, ip_forward=False):
+        state = self.node_state
+        enable = ip_forward and state.ip_forward is not True
+        if ip_forward and not enable:
+            self.skip("sysctl ip_forward")
+
+        if state.routes is None:
+            # Unknown routing table: start clean, as every command used to
+            self.reset_network()
+            stale, missing = {}, dict(routes)
+        else:
+            stale, missing = state.route_changes(routes)
+            if not stale and not missing:
+                self.skip("ip route")
+        # With netlink the batch always holds the full wanted set; it removes anything else itself
+        self.pending_routes = dict(routes)
+
+        ok = True
+        if enable:
+            self.enable_forwarding()
+        if self.netlink is None:
+            for destination, gateway in stale.items():
+                ok = self.delete_route(destination, gateway) and ok
+        for destination, gateway in missing.items():
+            ok = self.add_route(destination, gateway) and ok
+        if stale or missing or enable:
+            ok = self.apply_network() and ok
+
+        # A route that could not be set leaves the table unknown, so the next command flushes it
+        state.routes = dict(routes) if ok else None
+        if enable:
+            state.ip_forward = True
+
+    def skip(self, name):
+        print(f"[INFO] Skipping {name}, node already configured")
+        now = int(time.time() * 1000)
+        self.spans.append({"name": name, "start_ms": now, "end_ms": now, "ok": True, "skipped": True})
+
+    def reset_network(self):
+        # Start from a clean routing table. With netlink, stale routes are
+        # dropped in the same batch that adds the new ones (see apply_network)
+        self.pending_routes = {}
+        self.pending_ip_forward = False
+        if self.netlink is None:
+            with self.span("flush_routes"):
+                self.flush_routes()
+
+    def add_route(self, destination, gateway):
+        print(f"[INFO] Adding route: {destination} via {gateway}")
+        if self.netlink is not None:
+            self.pending_routes[destination] = gateway
+            return True
+        route_cmd = ["sudo", "ip", "route", "add", destination, "via", gateway]
+        result = self.run_step("ip route add", route_cmd, capture_output=True, text=True)
+        if result.returncode == 0:
+            print("[INFO] Route added successfully")
+            return True
+        print(f"[WARNING] Failed to add route: {result.stderr.strip()}")
+        return False
+
+    def delete_route(self, destination, gateway):
+        result = self.run_step("ip route del", ["sudo", "ip", "route", "del", destination, "via", gateway],
+                               capture_output=True, text=True)
+        if result.returncode == 0:
+            print(f"[INFO] Removed route: {destination} via {gateway}")
+            return True
+        print(f"[WARNING] Failed to remove route: {result.stderr.strip()}")
+        return False
+
+    def enable_forwarding(self):
+        if self.netlink is not None:
+            self.pending_ip_forward = True
+            return
+        self.run_step("sysctl ip_forward", ["sudo", "sysctl", "-w", "net.ipv4.ip_forward=1"], check=True)
+        print("[INFO] Enabled IP forwarding")
+
+    def apply_network(self):
+        # Apply the command's routes and forwarding in one netlink pass; a no-op on the subprocess path
+        if self.netlink is None:
+            return True
+        try:
+            with self.span("netlink apply"):
+                changes = self.netlink.apply(self.pending_routes, self.ROUTE_SUBNET_PREFIX, self.pending_ip_forward)
+            print(f"[INFO] Applied {len(self.pending_routes)} route(s) over netlink, {changes} change(s)")
+            return True
+        except Exception as e:
+            print(f"[WARNING] Netlink configuration failed ({e}), falling back to subprocesses")
+            self.netlink.close()
+            self.netlink = None
+            routes, ip_forward = self.pending_routes, self.pending_ip_forward
+            self.reset_network()
+            if ip_forward:
+                self.enable_forwarding()
+            ok = True
+            for destination, gateway in routes.items():
+                ok = self.add_route(destination, gateway) and ok
+            return ok
+
+    def log_interface(self):
+        # `iwconfig <interface>` is only for the log, so skip the extra process unless debugging
+        if self.logger.isEnabledFor(logging.DEBUG):
+            result = self.executor.run(["iwconfig", self.TESTBED_INTERFACE], capture_output=True, text=True)
+            self.logger.debug(result.stdout)
+
     def flush_routes(self):
         try:
             # Get all current routes
-            result = subprocess.run(["ip", "route", "show"], capture_output=True, text=True)
+            result = self.executor.run(["ip", "route", "show"], capture_output=True, text=True)
             routes = result.stdout.strip().split('\n')
 
             for route_line in routes:
@@ -121,20 +329,20 @@ class MqttDevice:
                     continue
 
                 # Identify a manual host route (e.g., 192.168.2.10 via 192.168.2.20)
-                if "via" in parts and parts[0].startswith("192.168.2."):
+                if "via" in parts and parts[0].startswith(self.ROUTE_SUBNET_PREFIX):
                     # Get the destination and gateway from the parsed parts
                     destination = parts[0]
                     gateway = parts[2]
                     
                     # Use a specific, robust command to delete the route
-                    subprocess.run(["sudo", "ip", "route", "del", destination, "via", gateway], check=False)
+                    self.executor.run(["sudo", "ip", "route", "del", destination, "via", gateway], check=False)
                     print(f"[INFO] Flushed specific manual route: {destination} via {gateway}")
                 
         except Exception as e:
             print(f"[ERROR] Failed to flush routes: {e}")
             try:
                 # Get all current routes
-                result = subprocess.run(["ip", "route", "show"], capture_output=True, text=True)
+                result = self.executor.run(["ip", "route", "show"], capture_output=True, text=True)
                 routes = result.stdout.strip().split('\n')
 
                 for route_line in routes:
@@ -146,55 +354,44 @@ class MqttDevice:
                     
                     # Identify a manual host route (e.g., 192.168.2.10 via 192.168.2.20)
                     # by checking if it contains the "via" keyword and is in the 192.168.2.x subnet.
-                    if "via" in parts and destination.startswith("192.168.2."):
+                    if "via" in parts and destination.startswith(self.ROUTE_SUBNET_PREFIX):
                         route_to_delete = " ".join(parts)
-                        subprocess.run(["sudo", "ip", "route", "del", route_to_delete], check=False)
+                        self.executor.run(["sudo", "ip", "route", "del", route_to_delete], check=False)
                         print(f"[INFO] Flushed specific manual route: {route_to_delete}")
 
             except Exception as e:
                 print(f"[ERROR] Failed to flush routes: {e}")
 
     
-    def dataTransferServer(self, wireless_channel, region, ip_client, ip_previous):
+    def dataTransferServer(self, wireless_channel, region, ip_client, ip_previous, request_id=None):
+        # Returns the iperf3 port lease of the measurement, or None if setup failed.
+        # Raises NoFreePortError before touching the radio when every port is leased
         print("[INFO] Acting as receiver...")
+        lease = self.iperf_pool.lease(request_id)
 
         try:
-            subprocess.run(["sudo", "pkill", "-f", "iperf3.*-s"], check=False)
-            subprocess.run(["sudo", "iw", "reg", "set", region], check=True)
-            print(f"[INFO] Set wireless region to: {region}")
-            
-            # NEW: Apply channel immediately
-            subprocess.run(["sudo", "iwconfig", "wlan0", "channel", str(wireless_channel)], check=True)
-            result = subprocess.run(
-                ["iwconfig", "wlan0"],
-                capture_output=True,
-                text=True
-            )
-            print(result)
-            
-            print(f"[INFO] Adding route: {ip_client} via {ip_previous}")
-            route_cmd = ["sudo", "ip", "route", "add", ip_client, "via", ip_previous]
-            result = subprocess.run(route_cmd, capture_output=True, text=True)
-            if result.returncode == 0:
-                print("[INFO] Route added successfully")
-            else:
-                print(f"[WARNING] Failed to add route: {result.stderr.strip()}")
+            self.configure(region, wireless_channel, {ip_client: ip_previous})
 
-            
-            subprocess.run(["sudo", "pkill", "-f", "iperf3.*-s"], check=False)
-            #time.sleep(1)  # small delay to ensure the port is released
+            # The pool's server on the leased port is already listening; it is only (re)started if it died
+            with self.span("iperf3 server check"):
+                if self.iperf_pool.ensure_running(lease.port):
+                    self.logger.info(f"Restarted iperf3 server on port {lease.port}")
 
-            # subprocess.run(["iperf3", "-s"], check=True)
-            self.current_role = "server"
-            self.iperf_server_process = subprocess.Popen(["iperf3", "-s"])
-            
-
-            print("[SUCCESS] iPerf3 server started")
+            print(f"[SUCCESS] iPerf3 server ready on port {lease.port}")
+            return lease
 
         except subprocess.CalledProcessError as e:
             print(f"[ERROR] Command failed: {e}")
         except Exception as e:
             print(f"[ERROR] Unexpected error: {e}")
+        self.iperf_pool.release(request_id)
+        return None
+
+    def release_iperf_port(self, request_id):
+        # The measurement's result is in, so the client is done with our server
+        lease = self.iperf_pool.release(request_id)
+        if lease is not None:
+            self.logger.info(f"📊 Measurement {request_id} finished, released iperf3 port {lease.port}")
 
 
 
@@ -203,139 +400,286 @@ class MqttDevice:
             print("[INFO] Acting as forwarder...")
         
             try:
-                subprocess.run(["sudo", "iw", "reg", "set", region], check=True)
-                print(f"[INFO] Set wireless region to: {region}")
-        
-                subprocess.run(["sudo", "iwconfig", "wlan0", "channel", str(wireless_channel)], check=True)
-        
-                result = subprocess.run(
-                    ["iwconfig", "wlan0"],
-                    capture_output=True,
-                    text=True
-                )
-                print(result)
-    
-                # Enable forwarding
-                subprocess.run(["sudo", "sysctl", "-w", "net.ipv4.ip_forward=1"], check=True)
-                print("[INFO] Enabled IP forwarding")
-        
-                # ✅ Add route: server via next hop
-                route_1_cmd = ["sudo", "ip", "route", "add", ip_server, "via", ip_next_routing]
-                route_2_cmd = ["sudo", "ip", "route", "add", ip_client, "via", ip_previous_routing]
-                result = subprocess.run(route_1_cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    print("[INFO] Route added successfully")
-                else:
-                    print(f"[WARNING] Failed to add route: {result.stderr.strip()}")
-                result = subprocess.run(route_2_cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    print("[INFO] Route added successfully")
-                else:
-                    print(f"[WARNING] Failed to add route: {result.stderr.strip()}")
+                # ✅ Forwarding on, server via next hop, client via previous hop
+                self.configure(region, wireless_channel,
+                               {ip_server: ip_next_routing, ip_client: ip_previous_routing}, ip_forward=True)
+                return True
         
             except subprocess.CalledProcessError as e:
                 print(f"[ERROR] Failed during forwarder setup: {e}")
             except Exception as e:
                 print(f"[ERROR] Unexpected error: {e}")
+            return False
 
 
 
-    def dataTransferClient(self, wireless_channel, region, ip_server, ip_routing):
+    def dataTransferClient(self, wireless_channel, region, ip_server, ip_routing,
+                           request_id=None, ci_width_mbps=None, profile=None, iperf_port=None):
         print("[INFO] Acting as sender...")
 
         try:
-            subprocess.run(["sudo", "iw", "reg", "set", region], check=True)
-            print(f"[INFO] Set wireless region to: {region}")
-
-            subprocess.run(["sudo", "iwconfig", "wlan0", "channel", str(wireless_channel)], check=True)
-
-            result = subprocess.run(
-                ["iwconfig", "wlan0"],
-                capture_output=True,
-                text=True
-            )
-            
             # ✅ Correct route: server via forwarder
-            print(f"[INFO] Adding route: {ip_server} via {ip_routing}")
-            route_cmd = ["sudo", "ip", "route", "add", ip_server, "via", ip_routing]
-            result = subprocess.run(route_cmd, capture_output=True, text=True)
-            if result.returncode == 0:
-                print("[INFO] Route added successfully")
-            else:
-                print(f"[WARNING] Failed to add route: {result.stderr.strip()}")
+            self.configure(region, wireless_channel, {ip_server: ip_routing})
 
             max_retries = 3
-            retry_delay = 5  # seconds
+            retry_delay = self.IPERF_RETRY_DELAY  # seconds
+            profile = profile or IperfProfile()
+            # The port the server leased for this measurement, from its ack
+            iperf_cmd = ["iperf3", "-c", ip_server, "-p", str(iperf_port or self.iperf_pool.default_port)]
+            iperf_cmd += profile.client_args()
             
             for attempt in range(1, max_retries + 1):
                 try:
                     print(f"[INFO] Running iPerf3 test (attempt {attempt}/{max_retries})")
-            
-                    with open("result.json", "w") as outfile:
-                        subprocess.run(
-                            ["iperf3", "-c", ip_server, "--json"],
-                            check=True,
-                            stdout=outfile
-                        )
+                    name = f"iperf3 client (attempt {attempt})"
+
+                    if self.supports_json_stream():
+                        convergence = self.stream_iperf_client(name, iperf_cmd + ["--json-stream"],
+                                                               request_id, ci_width_mbps)
+                    else:
+                        # Older iperf3: the whole report arrives at the end, so the test always runs in full
+                        with open(self.result_file, "w") as outfile:
+                            self.run_step(name, iperf_cmd + ["--json"], check=True, stdout=outfile)
+                        convergence = self.read_convergence(ci_width_mbps)
 
                     print("[SUCCESS] iPerf3 test completed")
-                    break  # ✅ stop retrying, continue function
+                    return convergence  # ✅ stop retrying
             
                 except subprocess.CalledProcessError as e:
                     print(f"[WARNING] iPerf3 failed (attempt {attempt}): {e}")
             
                     if attempt < max_retries:
                         print(f"[INFO] Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
+                        with self.span("iperf3 retry wait"):
+                            time.sleep(retry_delay)
                     else:
                         print("[ERROR] iPerf3 failed after maximum retries")
+                        # The node may not be configured the way we think; reapply everything next time
+                        self.node_state.invalidate()
 
         except subprocess.CalledProcessError as e:
             print(f"[ERROR] Command failed: {e}")
         except Exception as e:
             print(f"[ERROR] Unexpected error: {e}")
 
+    def supports_json_stream(self):
+        # --json-stream arrived in iperf3 3.17; older versions print their JSON only once the test is over
+        if self.iperf_json_stream is None:
+            try:
+                result = self.executor.run(["iperf3", "--version"], capture_output=True, text=True)
+                match = re.search(r"iperf (\d+)\.(\d+)", result.stdout or "")
+                self.iperf_json_stream = bool(match) and (int(match.group(1)), int(match.group(2))) >= (3, 17)
+            except OSError:
+                self.iperf_json_stream = False
+            if not self.iperf_json_stream:
+                self.logger.info("iperf3 has no --json-stream, falling back to --json without early stop")
+        return self.iperf_json_stream
+
+    def stream_iperf_client(self, name, cmd, request_id=None, ci_width_mbps=None):
+        """
+        Run an `iperf3 --json-stream` client: publish every interval as it arrives and end the test
+        once the confidence interval of the mean rate is narrower than ci_width_mbps. The events are
+        saved to result_file in the layout of `iperf3 --json`. Raises CalledProcessError on failure.
+        """
+        convergence = RateConvergence(ci_width_mbps, self.IPERF_MIN_INTERVALS)
+        result = {"start": {}, "intervals": [], "end": {}}
+        with self.span(name) as record:
+            process = self.executor.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            try:
+                for line in process.stdout:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    kind, data = event.get("event"), event.get("data")
+                    if kind in ("start", "end"):
+                        result[kind] = data
+                    elif kind == "error":
+                        result["error"] = data
+                    elif kind == "interval":
+                        result["intervals"].append(data)
+                        rate = interval_rate_mbps(data)
+                        if rate is None:
+                            continue
+                        convergence.add(rate)
+                        self.send_interval(request_id, len(result["intervals"]) - 1, data, rate, convergence)
+                        if convergence.converged():
+                            print(f"[INFO] Rate converged after {convergence.count} intervals, stopping iPerf3")
+                            convergence.stopped_early = True
+                            process.terminate()
+                            break
+            except BaseException:
+                process.kill()
+                raise
+            finally:
+                process.stdout.close()
+                returncode = process.wait()
+            record["ok"] = convergence.stopped_early or returncode == 0
+
+        with open(self.result_file, "w") as outfile:
+            json.dump(result, outfile)
+        if not record["ok"]:
+            raise subprocess.CalledProcessError(returncode, cmd, output=result.get("error"))
+        return convergence
+
+    def read_convergence(self, ci_width_mbps=None):
+        # Interval statistics of the finished test in result_file
+        convergence = RateConvergence(ci_width_mbps, self.IPERF_MIN_INTERVALS)
+        try:
+            with open(self.result_file, "r") as file:
+                data = json.load(file)
+            for interval in data.get("intervals", []):
+                rate = interval_rate_mbps(interval)
+                if rate is not None:
+                    convergence.add(rate)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Failed to read iPerf3 intervals: {e}")
+        return convergence
+
+    @contextmanager
+    def span(self, name):
+        # Record a timed step of the current command for the backend's measurement timeline
+        record = {"name": name, "start_ms": int(time.time() * 1000), "ok": True}
+        try:
+            yield record
+        except Exception:
+            record["ok"] = False
+            raise
+        finally:
+            record["end_ms"] = int(time.time() * 1000)
+            self.spans.append(record)
+
+    def run_step(self, name, cmd, **kwargs):
+        # executor.run, timed as a span; a non-zero exit marks the span as failed
+        with self.span(name) as record:
+            result = self.executor.run(cmd, **kwargs)
+            record["ok"] = result.returncode == 0
+            return result
+
     def get_device_ip(self):
+        # IPv4 address of the testbed interface, the one the backend knows the Pi by;
+        # `hostname -I` lists eth0's DHCP address first on a Pi with a wired uplink
         try:
-            command = "hostname -I | awk '{print $1}'"
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
-            device_ip = result.stdout.strip()
-            if device_ip:
-                return device_ip
+            command = ["ip", "-4", "-o", "addr", "show", "dev", self.TESTBED_INTERFACE]
+            result = self.executor.run(command, capture_output=True, text=True)
+            # e.g. "3: wlan0    inet 192.168.2.1/24 brd 192.168.2.255 scope global wlan0 ..."
+            fields = result.stdout.split()
+            if "inet" in fields[:-1]:
+                return fields[fields.index("inet") + 1].split("/")[0]
             else:
-                self.logger.error("No IP address found for wlan0")
+                self.logger.error(f"No IP address found for {self.TESTBED_INTERFACE}")
                 return "0.0.0.0"
         except Exception as e:
             self.logger.error(f"Error fetching device IP: {e}")
             return "0.0.0.0"
 
-    def extractMeasurement(self, role):
+    def extractMeasurement(self, role, profile=None):
+        # Per-direction figures of the last test, e.g. {"uplink": {"sent_mbps", "received_mbps", ...}}
+        profile = profile or IperfProfile()
         try:
-            with open("result.json", "r") as file:
+            with open(self.result_file, "r") as file:
                 data = json.load(file)
-            sent_rate = data['end']['sum_sent']['bits_per_second']
-            received_rate = data['end']['sum_received']['bits_per_second']
-            return [sent_rate / 1e6, received_rate / 1e6]
+            directions = profile.direction_rates(data)
+            if profile.primary not in directions:
+                raise ValueError(data.get('error') or "no end summary and no intervals")
+            return directions
         except Exception as e:
             print(f"[ERROR] Failed to extract measurement: {e}")
-            return [0, 0]
+            return {}
+
+    @staticmethod
+    def telemetry_topic(request_id):
+        # Results are routed per measurement so concurrent node pairs don't see each other's telemetry
+        return f"telemetry/{request_id}" if request_id else "telemetry"
+
+    def send_interval(self, request_id, index, interval, rate_mbps, convergence):
+        # Live progress of a streamed test; only on per-request topics, never on the shared telemetry topic
+        if not request_id:
+            return
+        width = convergence.width
+        payload = {
+            "device_id": self.DEVICE_ID,
+            "request_id": request_id,
+            "index": index,
+            "start": interval["sum"].get("start"),
+            "end": interval["sum"].get("end"),
+            "rate_mbps": round(rate_mbps, 2),
+            "mean_mbps": round(convergence.mean, 2),
+            "ci_width_mbps": round(width, 2) if width is not None else None,
+            "sent_at_ms": int(time.time() * 1000)
+        }
+        self.client.publish(f"{self.telemetry_topic(request_id)}/interval", json.dumps(payload))
 
-    def send_telemetry(self, wireless_channel, sent_rate):
-        topic = "telemetry"
+    def send_telemetry(self, wireless_channel, sent_rate, request_id=None, convergence=None, directions=None,
+                       error=None):
+        # A failed test is reported with an error, so the backend never takes its 0 Mbps for a measurement
+        topic = self.telemetry_topic(request_id)
         payload = {
+            "device_id": self.DEVICE_ID,
+            "role": "client",
             "wireless_channel": wireless_channel,
-            "sent_rate_mbps": round(sent_rate, 2)
+            "sent_rate_mbps": round(sent_rate, 2),
+            "request_id": request_id,
+            "spans": self.spans,
+            "sent_at_ms": int(time.time() * 1000)
         }
+        if convergence is not None:
+            payload.update(convergence.summary())
+        if directions:
+            payload["directions"] = directions
+        if error:
+            payload["error"] = error
         message = json.dumps(payload)
         self.client.publish(topic, message)
         self.logger.info(f"📤 Published telemetry to '{topic}': {message}")
 
+    def send_ack(self, request_id, role, configured, lease=None, error=None):
+        # Tell the backend this node is ready, so it can trigger the client without waiting on retries.
+        # A server names the iperf3 port it leased for the measurement; the client must connect to it
+        if not request_id:
+            return
+        topic = f"command/{self.DEVICE_ID}/res/{request_id}"
+        payload = {
+            "device_id": self.DEVICE_ID,
+            "request_id": request_id,
+            "role": role,
+            "status": "configured" if configured else "failed",
+            "spans": self.spans,
+            "sent_at_ms": int(time.time() * 1000)
+        }
+        if lease is not None:
+            payload.update(iperf_port=lease.port, lease_id=lease.lease_id)
+        if error:
+            payload["error"] = error
+        message = json.dumps(payload)
+        self.client.publish(topic, message, qos=1)
+        self.logger.info(f"📤 Published ack to '{topic}': {message}")
+
+    def announce(self):
+        # Retained, so a backend that starts later still learns our IP
+        device = {"device_id": self.DEVICE_ID, "ip": self.get_device_ip()}
+        self.client.publish(f"devices/{self.DEVICE_ID}/announce", json.dumps(device), qos=1, retain=True)
+        self.client.publish(
+            f"devices/{self.DEVICE_ID}/status",
+            json.dumps({"device_id": self.DEVICE_ID, "status": "online"}),
+            qos=1,
+            retain=True
+        )
+        self.logger.info(f"📣 Announced {device}")
+
+    def send_heartbeat(self):
+        payload = {"device_id": self.DEVICE_ID, "ip": self.get_device_ip(), "timestamp": int(time.time() * 1000)}
+        self.client.publish(f"devices/{self.DEVICE_ID}/heartbeat", json.dumps(payload))
+        self.last_heartbeat = time.time()
+
     def connect(self):
+        self.iperf_pool.start()
         self.client.connect(self.MQTT_BROKER_HOST, self.MQTT_BROKER_PORT)
         self.client.loop_start()
 
     def run(self):
-        pass
+        if time.time() - self.last_heartbeat >= self.HEARTBEAT_INTERVAL:
+            self.send_heartbeat()
 
 def main():
     device = MqttDevice()
@@ -348,8 +692,17 @@ def main():
     except KeyboardInterrupt:
         print("\n👋 Execution interrupted by user. Exiting...")
         print("🔄 Cleaning up resources...")
+        # A clean disconnect doesn't fire the last will, so report offline ourselves
+        device.client.publish(
+            f"devices/{device.DEVICE_ID}/status",
+            json.dumps({"device_id": device.DEVICE_ID, "status": "offline"}),
+            qos=1,
+            retain=True
+        ).wait_for_publish(2)
         device.client.loop_stop()
         device.client.disconnect()
+        device.command_worker.shutdown(wait=False)
+        device.iperf_pool.stop()
         print("🛑 MQTT client disconnected")
     except Exception as e:
         print(f"❗ An error occurred: {e}")
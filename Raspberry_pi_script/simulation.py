@@ -0,0 +1,442 @@
+"""
+Simulated Pi fleet: run many real MqttDevice instances in one process, without hardware.
+
+Each device gets a SimulatedExecutor instead of the shell. It keeps the state the real
+commands would change (regulatory region, channel, routes, ip_forward, iperf3 server ports) and
+answers `iperf3 -c ... --json` with synthetic JSON shaped like result.json (or streams it
+interval by interval for `--json-stream`), honouring -t, -P, -R, --bidir, -u and -b, but only when the simulated network can actually carry the traffic: a route chain from client to server
+and back, forwarding enabled on every forwarder, every node on the same channel and an
+iperf3 server listening on the port the client connects to. Everything else in MqttDevice (MQTT, acks, retries, telemetry,
+span timings) runs unchanged.
+
+    python simulation.py --devices 30 --broker-host 127.0.0.1 --broker-port 1883
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+
+from pi_script import MqttDevice
+
+
+logger = logging.getLogger(__name__)
+
+IPERF_PORT = 5201
+IPERF_DURATION = 10
+MAX_HOPS = 16
+
+
+def channel_frequency_mhz(channel):
+    if channel == 14:
+        return 2484
+    return 2407 + 5 * channel if channel <= 13 else 5000 + 5 * channel
+
+
+def iperf_options(args):
+    """The iperf3 client options the simulation understands, with iperf3's defaults."""
+    def value(flag, default=None):
+        return args[args.index(flag) + 1] if flag in args else default
+    bitrate = value("-b")
+    return {
+        "seconds": int(value("-t", IPERF_DURATION)),
+        "parallel": int(value("-P", 1)),
+        "reverse": "-R" in args,
+        "bidir": "--bidir" in args,
+        "udp": "-u" in args,
+        # iperf3 sends UDP at 1 Mbit/s unless told otherwise
+        "bitrate_mbps": float(bitrate.rstrip("M")) if bitrate else (1.0 if "-u" in args else None)
+    }
+
+
+def _synthetic_stream(capacity_mbps, seconds, parallel, udp, bitrate_mbps):
+    """(intervals, sent summary, received summary) of one direction of a test."""
+    offered_mbps = capacity_mbps if bitrate_mbps is None else bitrate_mbps
+    sent_mbps = offered_mbps if udp else min(offered_mbps, capacity_mbps)
+    delivered = min(1.0, capacity_mbps / sent_mbps) if sent_mbps else 1.0
+
+    intervals = []
+    sent_bytes = 0
+    for second in range(max(1, int(round(seconds)))):
+        bits_per_second = sent_mbps * 1e6 * random.uniform(0.9, 1.1)
+        interval_bytes = int(bits_per_second / 8)
+        sent_bytes += interval_bytes
+        summary = {"start": float(second), "end": float(second + 1), "seconds": 1.0,
+                   "bytes": interval_bytes, "bits_per_second": bits_per_second, "omitted": False}
+        if not udp:
+            summary["retransmits"] = 0
+        streams = [dict(summary, socket=5 + idx, bytes=interval_bytes // parallel,
+                        bits_per_second=bits_per_second / parallel) for idx in range(parallel)]
+        intervals.append((streams, summary))
+
+    duration = float(len(intervals))
+    if udp:
+        lost_percent = (1 - delivered) * 100 * random.uniform(0.95, 1.05) if delivered < 1 else random.uniform(0, 0.5)
+        packets = sent_bytes // 1448
+        sent = {"start": 0, "end": duration, "seconds": duration, "bytes": sent_bytes,
+                "bits_per_second": sent_bytes * 8 / duration, "jitter_ms": random.uniform(0.1, 3.0),
+                "lost_packets": int(packets * lost_percent / 100), "packets": packets, "lost_percent": lost_percent}
+        return intervals, sent, None
+    received_bytes = int(sent_bytes * random.uniform(0.97, 1.0))
+    sent = {"start": 0, "end": duration, "seconds": duration, "bytes": sent_bytes,
+            "bits_per_second": sent_bytes * 8 / duration, "retransmits": 0}
+    received = {"start": 0, "end": duration, "seconds": duration, "bytes": received_bytes,
+                "bits_per_second": received_bytes * 8 / duration}
+    return intervals, sent, received
+
+
+def synthetic_iperf_result(ip_client, ip_server, rate_mbps, seconds, port=IPERF_PORT, version="3.17.1",
+                           parallel=1, reverse=False, bidir=False, udp=False, bitrate_mbps=None):
+    """
+    iperf3 --json output for a test over a path of rate_mbps, with the fields extractMeasurement
+    reads. UDP ends with the sender's `sum` only, like older iperf3; a bidirectional test splits
+    the half-duplex path between both directions.
+    """
+    now = time.time()
+    capacity_mbps = rate_mbps / 2 if bidir else rate_mbps
+    intervals, sent, received = _synthetic_stream(capacity_mbps, seconds, parallel, udp, bitrate_mbps)
+    end = {"sum": sent} if udp else {"sum_sent": sent, "sum_received": received}
+    result_intervals = [{"streams": streams, "sum": summary} for streams, summary in intervals]
+    if bidir:
+        reverse_intervals, reverse_sent, reverse_received = _synthetic_stream(
+            capacity_mbps, seconds, parallel, udp, bitrate_mbps)
+        for interval, (streams, summary) in zip(result_intervals, reverse_intervals):
+            interval["streams"] += streams
+            interval["sum_bidir_reverse"] = summary
+        if udp:
+            end["sum_bidir_reverse"] = reverse_sent
+        else:
+            end.update(sum_sent_bidir_reverse=reverse_sent, sum_received_bidir_reverse=reverse_received)
+
+    return {
+        "start": {
+            "connected": [{"socket": 5 + idx, "local_host": ip_client, "local_port": random.randint(40000, 60000),
+                           "remote_host": ip_server, "remote_port": port} for idx in range(parallel)],
+            "version": f"iperf {version} (simulated)",
+            "timestamp": {"time": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(now)), "timesecs": int(now)},
+            "connecting_to": {"host": ip_server, "port": port},
+            "test_start": {"protocol": "UDP" if udp else "TCP", "num_streams": parallel, "blksize": 131072,
+                           "omit": 0, "duration": int(seconds), "bytes": 0, "blocks": 0,
+                           "reverse": int(reverse), "bidir": int(bidir)}
+        },
+        "intervals": result_intervals,
+        "end": end
+    }
+
+
+class SimulatedProcess:
+    """Stand-in for the Popen handle of `iperf3 -s -p <port>`."""
+
+    def __init__(self, executor, port):
+        self.executor = executor
+        self.port = port
+        self.returncode = None
+
+    def poll(self):
+        return None if self.port in self.executor.iperf_server_ports else 0
+
+    def terminate(self):
+        self.executor.iperf_server_ports.discard(self.port)
+        self.returncode = 0
+
+    kill = terminate
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+
+class SimulatedClientProcess:
+    """
+    Stand-in for the Popen handle of an `iperf3 -c ... --json-stream` client. stdout yields one
+    event line per interval, interval_seconds apart, until the test ends or is terminated.
+    """
+
+    def __init__(self, result, interval_seconds, error=None):
+        self.returncode = None
+        self.stopped = threading.Event()
+        self.stdout = self._events(result, interval_seconds, error)
+
+    def _events(self, result, interval_seconds, error):
+        if error is not None:
+            self.returncode = 1
+            yield json.dumps({"event": "error", "data": error}) + "\n"
+            return
+        yield json.dumps({"event": "start", "data": result["start"]}) + "\n"
+        for interval in result["intervals"]:
+            if self.stopped.wait(interval_seconds):
+                return
+            yield json.dumps({"event": "interval", "data": interval}) + "\n"
+        self.returncode = 0
+        yield json.dumps({"event": "end", "data": result["end"]}) + "\n"
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.stopped.set()
+        if self.returncode is None:
+            self.returncode = -15
+
+    kill = terminate
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            self.terminate()
+        return self.returncode
+
+
+class SimulatedNetwork:
+    """Shared medium of the simulated Pis: finds the path a packet would take between two IPs."""
+
+    def __init__(self, base_rate_mbps=60.0):
+        self.base_rate_mbps = base_rate_mbps
+        self.nodes = {}
+        self.lock = threading.Lock()
+
+    def add(self, executor):
+        self.nodes[executor.ip] = executor
+
+    def trace(self, source_ip, destination_ip):
+        """IPs from source to destination following each node's routes (direct when it has none), or None."""
+        hops = [source_ip]
+        current = source_ip
+        while current != destination_ip:
+            node = self.nodes.get(current)
+            if node is None or (current != source_ip and not node.ip_forward):
+                return None
+            next_ip = node.routes.get(destination_ip, destination_ip)
+            if next_ip in hops or next_ip not in self.nodes or len(hops) > MAX_HOPS:
+                return None
+            hops.append(next_ip)
+            current = next_ip
+        return hops
+
+    def iperf(self, ip_client, ip_server, port=IPERF_PORT):
+        """Achievable rate in Mbit/s from client to server, or an error message explaining why not."""
+        with self.lock:
+            server = self.nodes.get(ip_server)
+            if server is None or port not in server.iperf_server_ports:
+                return None, "unable to connect to server: Connection refused"
+            forward = self.trace(ip_client, ip_server)
+            backward = self.trace(ip_server, ip_client)
+            if forward is None or backward is None:
+                return None, "unable to connect to server: No route to host"
+            channels = {self.nodes[ip].channel for ip in forward + backward}
+            if len(channels) != 1 or None in channels:
+                return None, "unable to connect to server: Connection timed out"
+
+        hops = len(forward) - 1
+        channel = channels.pop()
+        # 5 GHz is faster; every extra hop shares the same half-duplex channel
+        rate = self.base_rate_mbps * (1.5 if channel > 14 else 1.0) / hops
+        return rate * random.uniform(0.85, 1.0), None
+
+
+class SimulatedExecutor:
+    """
+    Executor for a simulated Pi: interprets the commands MqttDevice issues against in-memory
+    node state instead of running them. Same run()/popen() interface as SubprocessExecutor.
+    """
+
+    def __init__(self, ip, network, step_delay=0.0, iperf_seconds=1.0, iperf_version="3.17.1"):
+        self.ip = ip
+        self.network = network
+        self.step_delay = step_delay
+        # Wall-clock length of a full simulated test, whatever its -t
+        self.iperf_seconds = iperf_seconds
+        self.iperf_version = iperf_version
+        self.region = None
+        self.channel = None
+        self.routes = {}
+        self.ip_forward = False
+        self.iperf_server_ports = set()
+        self.commands = deque(maxlen=1000)  # most recent commands, for inspection
+        network.add(self)
+
+    def popen(self, cmd, **kwargs):
+        self.commands.append(list(cmd))
+        port = int(cmd[cmd.index("-p") + 1]) if "-p" in cmd else IPERF_PORT
+        if cmd[:2] == ["iperf3", "-c"]:
+            return self._iperf_client_process(list(cmd), port)
+        if cmd[:2] == ["iperf3", "-s"]:
+            self.iperf_server_ports.add(port)
+        return SimulatedProcess(self, port)
+
+    def run(self, cmd, check=False, capture_output=False, text=False, stdout=None, shell=False, **kwargs):
+        args = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+        if args and args[0] == "sudo":
+            args = args[1:]
+        self.commands.append(args)
+        if self.step_delay:
+            time.sleep(self.step_delay)
+
+        returncode, output, error = self._execute(args)
+
+        if stdout is not None and hasattr(stdout, "write"):
+            stdout.write(output)
+            output = None
+        elif not capture_output:
+            output = None
+        if not capture_output:
+            error = None
+        elif not text:
+            output = output.encode() if output is not None else None
+            error = error.encode()
+
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, output, error)
+        return subprocess.CompletedProcess(cmd, returncode, output, error)
+
+    def _execute(self, args):
+        """(returncode, stdout, stderr) of one command."""
+        if args[:4] == ["ip", "-4", "-o", "addr"]:
+            interface = args[-1]
+            return 0, f"3: {interface}    inet {self.ip}/24 scope global {interface}\\       valid_lft forever preferred_lft forever\n", ""
+        if args[:3] == ["iw", "reg", "set"]:
+            self.region = args[3]
+            return 0, "", ""
+        if args[:1] == ["iwconfig"]:
+            if len(args) >= 4 and args[2] == "channel":
+                self.channel = int(args[3])
+                return 0, "", ""
+            frequency = channel_frequency_mhz(self.channel) / 1000 if self.channel else 0
+            return 0, f'wlan0     IEEE 802.11  ESSID:"simulated"  Mode:Ad-Hoc  Frequency:{frequency:.3f} GHz\n', ""
+        if args[:2] == ["sysctl", "-w"]:
+            key, _, value = args[2].partition("=")
+            if key == "net.ipv4.ip_forward":
+                self.ip_forward = value == "1"
+            return 0, f"{key} = {value}\n", ""
+        if args[:2] == ["ip", "route"]:
+            return self._route(args[2:])
+        if args[:1] == ["pkill"]:
+            was_running = bool(self.iperf_server_ports)
+            self.iperf_server_ports.clear()
+            return (0 if was_running else 1), "", ""
+        if args[:2] == ["iperf3", "--version"]:
+            return 0, f"iperf {self.iperf_version} (simulated)\n", ""
+        if args[:2] == ["iperf3", "-c"]:
+            port = int(args[args.index("-p") + 1]) if "-p" in args else IPERF_PORT
+            return self._iperf_client(args, port)
+        logger.debug(f"[SimulatedExecutor {self.ip}] Ignoring {args}")
+        return 0, "", ""
+
+    def _route(self, args):
+        if not args or args[0] == "show":
+            return 0, "".join(f"{destination} via {gateway} dev wlan0\n"
+                              for destination, gateway in self.routes.items()), ""
+        # `ip route del "<dst> via <gw>"` passes the whole route as one argument
+        action, rest = args[0], " ".join(args[1:]).split()
+        destination = rest[0] if rest else None
+        gateway = rest[rest.index("via") + 1] if "via" in rest else None
+        with self.network.lock:
+            if action == "add":
+                if destination in self.routes:
+                    return 2, "", "RTNETLINK answers: File exists"
+                self.routes[destination] = gateway
+                return 0, "", ""
+            if action == "del":
+                if destination not in self.routes:
+                    return 2, "", "RTNETLINK answers: No such process"
+                del self.routes[destination]
+                return 0, "", ""
+        return 0, "", ""
+
+    def _iperf_client(self, args, port=IPERF_PORT):
+        ip_server = args[2]
+        rate_mbps, error = self.network.iperf(self.ip, ip_server, port)
+        if error is not None:
+            return 1, json.dumps({"start": {}, "intervals": [], "end": {}, "error": error}), ""
+        time.sleep(self.iperf_seconds)
+        result = synthetic_iperf_result(self.ip, ip_server, rate_mbps, port=port, version=self.iperf_version,
+                                        **iperf_options(args))
+        return 0, json.dumps(result), ""
+
+    def _iperf_client_process(self, args, port=IPERF_PORT):
+        ip_server = args[2]
+        rate_mbps, error = self.network.iperf(self.ip, ip_server, port)
+        options = iperf_options(args)
+        result = None
+        if error is None:
+            result = synthetic_iperf_result(self.ip, ip_server, rate_mbps, port=port, version=self.iperf_version,
+                                            **options)
+        return SimulatedClientProcess(result, self.iperf_seconds / options["seconds"], error)
+
+
+def create_fleet(size, broker_host, broker_port, id_prefix="sim-", ip_prefix="10.78.0.",
+                 step_delay=0.0, iperf_seconds=1.0, base_rate_mbps=60.0, retry_delay=1.0, iperf_version="3.17.1"):
+    """size MqttDevices sharing one SimulatedNetwork; device i is <id_prefix>i at <ip_prefix>i."""
+    network = SimulatedNetwork(base_rate_mbps)
+    result_dir = tempfile.mkdtemp(prefix="pi-sim-")
+    devices = []
+    for idx in range(1, size + 1):
+        device_id = f"{id_prefix}{idx}"
+        device = MqttDevice(
+            logger=logging.getLogger(device_id),
+            executor=SimulatedExecutor(f"{ip_prefix}{idx}", network, step_delay, iperf_seconds, iperf_version),
+            device_id=device_id,
+            broker_host=broker_host,
+            broker_port=broker_port,
+            username="simulated",
+            password="simulated",
+            result_file=os.path.join(result_dir, f"result-{device_id}.json"),
+            # Routes live in the SimulatedNetwork, never in the host's kernel
+            network_backend="subprocess"
+        )
+        device.IPERF_RETRY_DELAY = retry_delay
+        device.ROUTE_SUBNET_PREFIX = ip_prefix
+        devices.append(device)
+    return network, devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a simulated fleet of Pis against an MQTT broker")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--broker-host", default=os.getenv("MQTT_BROKER_HOST", "127.0.0.1"))
+    parser.add_argument("--broker-port", type=int, default=int(os.getenv("MQTT_BROKER_PORT", 1883)))
+    parser.add_argument("--id-prefix", default="sim-")
+    parser.add_argument("--ip-prefix", default="10.78.0.")
+    parser.add_argument("--step-delay", type=float, default=0.0, help="Seconds each system command takes")
+    parser.add_argument("--iperf-seconds", type=float, default=1.0, help="Length of a simulated iperf3 test")
+    parser.add_argument("--rate-mbps", type=float, default=60.0, help="Single-hop 2.4 GHz rate")
+    parser.add_argument("--retry-delay", type=float, default=1.0, help="Seconds between iperf3 client retries")
+    parser.add_argument("--iperf-version", default="3.17.1",
+                        help="Reported iperf3 version; below 3.17 the clients fall back to --json")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+    logging.getLogger().setLevel(args.log_level)
+
+    _, devices = create_fleet(args.devices, args.broker_host, args.broker_port, args.id_prefix, args.ip_prefix,
+                              args.step_delay, args.iperf_seconds, args.rate_mbps, args.retry_delay,
+                              args.iperf_version)
+    for device in devices:
+        device.connect()
+    print(f"Simulating {len(devices)} Pis ({args.id_prefix}1..{args.id_prefix}{len(devices)}) "
+          f"against {args.broker_host}:{args.broker_port}")
+
+    try:
+        while True:
+            for device in devices:
+                device.run()
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for device in devices:
+            device.client.publish(
+                f"devices/{device.DEVICE_ID}/status",
+                json.dumps({"device_id": device.DEVICE_ID, "status": "offline"}),
+                qos=1,
+                retain=True
+            ).wait_for_publish(2)
+            device.client.loop_stop()
+            device.client.disconnect()
+            device.command_worker.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Run from Raspberry_pi_script/: `python -m pytest tests`. The script's modules are top-level imports.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
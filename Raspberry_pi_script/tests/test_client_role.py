@@ -0,0 +1,68 @@
+import json
+import logging
+
+import pytest
+
+from pi_script import MqttDevice
+from simulation import SimulatedExecutor, SimulatedNetwork
+
+
+class RecordingClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, json.loads(payload)))
+
+
+@pytest.fixture
+def network():
+    return SimulatedNetwork()
+
+
+def make_device(network, ip, tmp_path):
+    executor = SimulatedExecutor(ip, network, iperf_seconds=0.05)
+    device = MqttDevice(logger=logging.getLogger(f"test-{ip}"), executor=executor, device_id=ip,
+                        broker_host="127.0.0.1", broker_port=1883, username="test", password="test",
+                        result_file=str(tmp_path / f"{ip}.json"), network_backend="subprocess")
+    device.ROUTE_SUBNET_PREFIX = "10.0.0."
+    device.IPERF_RETRY_DELAY = 0
+    device.client = RecordingClient()
+    return device
+
+
+def client_command(request_id):
+    return {"role": "client", "region": "DE", "wireless_channel": 6, "ip_server": "10.0.0.2",
+            "ip_routing": "10.0.0.2", "request_id": request_id}
+
+
+def telemetry(device):
+    [(topic, payload)] = [(t, p) for t, p in device.client.published if not t.endswith("/interval")]
+    device.client.published.clear()
+    return topic, payload
+
+
+def test_successful_test_reports_its_rate(network, tmp_path):
+    client, server = make_device(network, "10.0.0.1", tmp_path), make_device(network, "10.0.0.2", tmp_path)
+    server.iperf_pool.start()
+    server.handle_command({"role": "server", "region": "DE", "wireless_channel": 6, "ip_client": "10.0.0.1",
+                           "previous_ip": "10.0.0.1", "request_id": "req-1"})
+
+    client.handle_command(client_command("req-1"))
+    topic, payload = telemetry(client)
+    assert topic == "telemetry/req-1"
+    assert payload["sent_rate_mbps"] > 0 and "error" not in payload
+
+
+def test_failed_test_reports_an_error_not_the_previous_result(network, tmp_path):
+    client = make_device(network, "10.0.0.1", tmp_path)
+    # A result left over from an earlier test must not be reported for this one
+    with open(client.result_file, "w") as file:
+        json.dump({"end": {"sum_sent": {"bits_per_second": 5e7}, "sum_received": {"bits_per_second": 5e7}}}, file)
+
+    # Nobody listens on 10.0.0.2, so every attempt fails
+    client.handle_command(client_command("req-2"))
+    topic, payload = telemetry(client)
+    assert topic == "telemetry/req-2"
+    assert payload["error"] == "iPerf3 test failed"
+    assert payload["sent_rate_mbps"] == 0 and "directions" not in payload
@@ -0,0 +1,65 @@
+import statistics
+
+import pytest
+
+from convergence import RateConvergence, interval_rate_mbps
+
+
+def test_running_statistics_match_the_sample():
+    rates = [48.0, 52.0, 50.0, 49.0, 51.0]
+    convergence = RateConvergence()
+    for rate in rates:
+        convergence.add(rate)
+
+    assert convergence.count == 5
+    assert convergence.mean == pytest.approx(statistics.mean(rates))
+    # t(0.975, 4 df) = 2.776
+    expected = 2 * 2.776 * statistics.stdev(rates) / len(rates) ** 0.5
+    assert convergence.width == pytest.approx(expected)
+
+
+def test_width_needs_two_intervals():
+    convergence = RateConvergence()
+    assert convergence.width is None
+    convergence.add(50.0)
+    assert convergence.width is None
+    assert convergence.summary() == {"intervals": 1, "ci_width_mbps": None, "stopped_early": False}
+
+
+def test_stable_rate_converges_after_min_intervals():
+    convergence = RateConvergence(ci_width_mbps=2.0, min_intervals=3)
+    convergence.add(50.0)
+    convergence.add(50.1)
+    assert not convergence.converged()
+    convergence.add(49.9)
+    assert convergence.converged()
+
+
+def test_noisy_rate_does_not_converge():
+    convergence = RateConvergence(ci_width_mbps=2.0, min_intervals=3)
+    for rate in [20.0, 60.0, 35.0, 55.0]:
+        convergence.add(rate)
+    assert not convergence.converged()
+
+
+def test_without_target_never_converges():
+    convergence = RateConvergence()
+    for _ in range(10):
+        convergence.add(50.0)
+    assert convergence.width == 0
+    assert not convergence.converged()
+
+
+def test_large_samples_fall_back_to_the_normal_quantile():
+    convergence = RateConvergence()
+    for idx in range(40):
+        convergence.add(50.0 + idx % 2)
+    expected = 2 * 1.960 * statistics.stdev([50.0 + idx % 2 for idx in range(40)]) / 40 ** 0.5
+    assert convergence.width == pytest.approx(expected)
+
+
+def test_interval_rate_skips_omitted_intervals():
+    assert interval_rate_mbps({"sum": {"bits_per_second": 50e6}}) == 50.0
+    assert interval_rate_mbps({"sum": {"bits_per_second": 50e6, "omitted": True}}) is None
+    assert interval_rate_mbps({}) is None
+    assert interval_rate_mbps({"sum_bidir_reverse": {"bits_per_second": 20e6}}, "sum_bidir_reverse") == 20.0
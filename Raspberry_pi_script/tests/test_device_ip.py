@@ -0,0 +1,50 @@
+import logging
+import subprocess
+
+from pi_script import MqttDevice
+from simulation import SimulatedExecutor, SimulatedNetwork
+
+
+class InterfaceExecutor:
+    """Answers `ip -4 -o addr show dev <interface>` like a Pi with a wired uplink and an ad hoc radio."""
+
+    addresses = {
+        "eth0": "2: eth0    inet 10.10.0.57/16 brd 10.10.255.255 scope global dynamic eth0\\       valid_lft 86000sec",
+        "wlan0": "3: wlan0    inet 192.168.2.1/24 brd 192.168.2.255 scope global wlan0\\       valid_lft forever",
+    }
+
+    def __init__(self):
+        self.commands = []
+
+    def run(self, cmd, **kwargs):
+        self.commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, self.addresses.get(cmd[-1], "") + "\n", "")
+
+
+def make_device(executor):
+    return MqttDevice(logger=logging.getLogger("test-device"), executor=executor, device_id="test",
+                      broker_host="127.0.0.1", broker_port=1883, username="test", password="test",
+                      network_backend="subprocess")
+
+
+def test_device_ip_is_the_testbed_interface_address():
+    device = make_device(InterfaceExecutor())
+    assert device.get_device_ip() == "192.168.2.1"
+    assert device.executor.commands == [["ip", "-4", "-o", "addr", "show", "dev", "wlan0"]]
+
+
+def test_testbed_interface_is_configurable():
+    device = make_device(InterfaceExecutor())
+    device.TESTBED_INTERFACE = "eth0"
+    assert device.get_device_ip() == "10.10.0.57"
+
+
+def test_interface_without_an_address_reports_none():
+    device = make_device(InterfaceExecutor())
+    device.TESTBED_INTERFACE = "wlan1"
+    assert device.get_device_ip() == "0.0.0.0"
+
+
+def test_simulated_device_announces_its_testbed_ip():
+    device = make_device(SimulatedExecutor("192.168.2.7", SimulatedNetwork()))
+    assert device.get_device_ip() == "192.168.2.7"
@@ -0,0 +1,117 @@
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from iperf_server import IperfServerPool, NoFreePortError
+from pi_script import MqttDevice
+from simulation import SimulatedExecutor, SimulatedNetwork
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def pool(clock):
+    pool = IperfServerPool(SimulatedExecutor("10.0.0.3", SimulatedNetwork()), base_port=5201, size=2,
+                           lease_timeout=60, clock=clock)
+    pool.start()
+    return pool
+
+
+def test_start_listens_on_every_port(pool):
+    assert pool.executor.iperf_server_ports == {5201, 5202}
+
+
+def test_leases_take_the_lowest_free_port(pool):
+    first, second = pool.lease("req-1"), pool.lease("req-2")
+    assert (first.port, second.port) == (5201, 5202)
+    assert first.lease_id != second.lease_id
+    # A redelivered command keeps its lease
+    assert pool.lease("req-1") is first
+
+
+def test_exhausted_pool_refuses_until_a_lease_is_released(pool):
+    pool.lease("req-1")
+    pool.lease("req-2")
+    with pytest.raises(NoFreePortError):
+        pool.lease("req-3")
+
+    assert pool.release("req-1").port == 5201
+    assert pool.lease("req-3").port == 5201
+    assert pool.release("req-unknown") is None
+
+
+def test_lease_without_telemetry_expires(pool, clock):
+    pool.lease("req-1")
+    pool.lease("req-2")
+    clock.now += 61
+    assert pool.lease("req-3").port == 5201
+    assert set(pool.leases) == {"req-3"}
+
+
+def test_dead_server_is_restarted(pool):
+    pool.executor.iperf_server_ports.discard(5202)
+    assert pool.ensure_running(5202)
+    assert not pool.ensure_running(5201)
+    assert 5202 in pool.executor.iperf_server_ports
+
+
+class RecordingClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, json.loads(payload)))
+
+
+@pytest.fixture
+def device():
+    executor = SimulatedExecutor("10.0.0.3", SimulatedNetwork())
+    device = MqttDevice(logger=logging.getLogger("test-device"), executor=executor, device_id="test",
+                        broker_host="127.0.0.1", broker_port=1883, username="test", password="test",
+                        network_backend="subprocess")
+    device.ROUTE_SUBNET_PREFIX = "10.0.0."
+    device.iperf_pool = IperfServerPool(executor, base_port=5201, size=1, logger=device.logger)
+    device.iperf_pool.start()
+    device.client = RecordingClient()
+    return device
+
+
+def server_command(request_id):
+    return {"role": "server", "region": "DE", "wireless_channel": 6, "ip_client": "10.0.0.1",
+            "previous_ip": "10.0.0.2", "request_id": request_id}
+
+
+def test_server_ack_names_the_leased_port_until_telemetry_arrives(device):
+    device.handle_command(server_command("req-1"))
+    topic, ack = device.client.published[-1]
+    assert topic == "command/test/res/req-1"
+    assert ack["status"] == "configured"
+    assert ack["iperf_port"] == 5201 and ack["lease_id"]
+
+    # The only port is leased, so a second measurement is refused
+    device.handle_command(server_command("req-2"))
+    _, refused = device.client.published[-1]
+    assert refused["status"] == "failed" and "iperf_port" not in refused
+    assert "leased" in refused["error"]
+
+    # Intervals are not results; the measurement's own telemetry frees the port
+    device._on_message(None, None, SimpleNamespace(topic="telemetry/req-1/interval", payload=b"{}"))
+    assert "req-1" in device.iperf_pool.leases
+    device._on_message(None, None, SimpleNamespace(topic="telemetry/req-1", payload=b"{}"))
+    assert device.iperf_pool.leases == {}
+
+    device.handle_command(server_command("req-2"))
+    assert device.client.published[-1][1]["iperf_port"] == 5201
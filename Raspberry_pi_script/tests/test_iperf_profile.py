@@ -0,0 +1,83 @@
+import pytest
+
+from iperf_profile import IperfProfile
+
+
+def total(mbps, **extra):
+    return {"bits_per_second": mbps * 1e6, **extra}
+
+
+def test_defaults_are_iperf3_defaults():
+    profile = IperfProfile.from_message(None)
+    assert profile.client_args() == ["-t", "10"]
+    assert profile.primary == "uplink"
+
+
+def test_client_args_follow_the_profile():
+    profile = IperfProfile.from_message({"duration": 5, "parallel": 4, "direction": "bidirectional",
+                                         "protocol": "udp", "bitrate_mbps": 20, "unused": None})
+    assert profile.client_args() == ["-t", "5", "-P", "4", "--bidir", "-u", "-b", "20M"]
+    assert IperfProfile(direction="reverse").client_args() == ["-t", "10", "-R"]
+
+
+def test_unknown_direction_or_protocol_is_rejected():
+    with pytest.raises(ValueError):
+        IperfProfile(direction="sideways")
+    with pytest.raises(ValueError):
+        IperfProfile(protocol="sctp")
+
+
+def test_forward_tcp_reports_the_uplink():
+    result = {"end": {"sum_sent": total(52.0, retransmits=3), "sum_received": total(50.0)}}
+    assert IperfProfile().direction_rates(result) == {
+        "uplink": {"sent_mbps": 52.0, "received_mbps": 50.0, "retransmits": 3}
+    }
+
+
+def test_reverse_tcp_reports_the_downlink():
+    profile = IperfProfile(direction="reverse")
+    result = {"end": {"sum_sent": total(41.0, retransmits=0), "sum_received": total(40.0)}}
+    assert profile.primary == "downlink"
+    assert profile.direction_rates(result) == {
+        "downlink": {"sent_mbps": 41.0, "received_mbps": 40.0, "retransmits": 0}
+    }
+
+
+def test_bidirectional_tcp_reports_both_directions():
+    profile = IperfProfile(direction="bidirectional")
+    result = {"end": {
+        "sum_sent": total(30.0, retransmits=1), "sum_received": total(29.0),
+        "sum_sent_bidir_reverse": total(20.0, retransmits=2), "sum_received_bidir_reverse": total(19.0),
+    }}
+    assert profile.direction_rates(result) == {
+        "uplink": {"sent_mbps": 30.0, "received_mbps": 29.0, "retransmits": 1},
+        "downlink": {"sent_mbps": 20.0, "received_mbps": 19.0, "retransmits": 2},
+    }
+
+
+def test_udp_reports_jitter_and_loss():
+    profile = IperfProfile(protocol="udp", bitrate_mbps=20)
+    result = {"end": {"sum": total(20.0, jitter_ms=0.5, lost_percent=10.0),
+                      "sum_sent": total(20.0), "sum_received": total(18.0)}}
+    assert profile.direction_rates(result) == {
+        "uplink": {"sent_mbps": 20.0, "received_mbps": 18.0, "jitter_ms": 0.5, "lost_percent": 10.0}
+    }
+
+
+def test_udp_without_receiver_sum_derives_it_from_the_loss():
+    profile = IperfProfile(protocol="udp", bitrate_mbps=20)
+    result = {"end": {"sum": total(20.0, jitter_ms=0.5, lost_percent=25.0)}}
+    assert profile.direction_rates(result)["uplink"]["received_mbps"] == 15.0
+
+
+def test_test_stopped_early_falls_back_to_interval_means():
+    profile = IperfProfile(direction="bidirectional")
+    result = {"intervals": [
+        {"sum": total(30.0), "sum_bidir_reverse": total(10.0)},
+        {"sum": total(40.0), "sum_bidir_reverse": total(20.0)},
+        {"sum": total(99.0, omitted=True), "sum_bidir_reverse": total(99.0, omitted=True)},
+    ]}
+    assert profile.direction_rates(result) == {
+        "uplink": {"sent_mbps": 35.0, "received_mbps": 35.0},
+        "downlink": {"sent_mbps": 15.0, "received_mbps": 15.0},
+    }
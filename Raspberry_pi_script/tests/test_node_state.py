@@ -0,0 +1,77 @@
+import logging
+
+import pytest
+
+from node_state import NodeState
+from pi_script import MqttDevice
+from simulation import SimulatedExecutor, SimulatedNetwork
+
+
+def test_route_changes_diff_against_known_routes():
+    state = NodeState()
+    state.routes = {"10.0.0.3": "10.0.0.2", "10.0.0.4": "10.0.0.2"}
+
+    stale, missing = state.route_changes({"10.0.0.3": "10.0.0.2", "10.0.0.4": "10.0.0.5", "10.0.0.6": "10.0.0.5"})
+    assert stale == {"10.0.0.4": "10.0.0.2"}
+    assert missing == {"10.0.0.4": "10.0.0.5", "10.0.0.6": "10.0.0.5"}
+
+
+def test_invalidate_forgets_everything():
+    state = NodeState()
+    state.region, state.channel, state.ip_forward, state.routes = "US", 6, True, {}
+    state.invalidate()
+    assert (state.region, state.channel, state.ip_forward, state.routes) == (None, None, None, None)
+
+
+@pytest.fixture
+def device():
+    executor = SimulatedExecutor("10.0.0.1", SimulatedNetwork())
+    device = MqttDevice(logger=logging.getLogger("test-device"), executor=executor, device_id="test",
+                        broker_host="127.0.0.1", broker_port=1883, username="test", password="test",
+                        network_backend="subprocess")
+    device.ROUTE_SUBNET_PREFIX = "10.0.0."
+    return device
+
+
+def configure(device, *args, **kwargs):
+    device.spans = []
+    device.executor.commands.clear()
+    device.configure(*args, **kwargs)
+    return [span["name"] for span in device.spans if span.get("skipped")]
+
+
+def test_first_command_applies_everything(device):
+    assert configure(device, "US", 6, {"10.0.0.3": "10.0.0.2"}, ip_forward=True) == []
+    executor = device.executor
+    assert (executor.region, executor.channel, executor.routes, executor.ip_forward) == (
+        "US", 6, {"10.0.0.3": "10.0.0.2"}, True)
+
+
+def test_repeated_command_skips_every_step(device):
+    configure(device, "US", 6, {"10.0.0.3": "10.0.0.2"}, ip_forward=True)
+    skipped = configure(device, "US", 6, {"10.0.0.3": "10.0.0.2"}, ip_forward=True)
+
+    assert skipped == ["iw reg set", "iwconfig channel", "sysctl ip_forward", "ip route"]
+    assert not device.executor.commands
+
+
+def test_only_changed_steps_run(device):
+    configure(device, "US", 6, {"10.0.0.3": "10.0.0.2"})
+    skipped = configure(device, "US", 11, {"10.0.0.3": "10.0.0.4"})
+
+    assert skipped == ["iw reg set"]
+    assert device.executor.channel == 11
+    assert device.executor.routes == {"10.0.0.3": "10.0.0.4"}
+
+
+def test_failed_step_resets_the_known_state(device):
+    configure(device, "US", 6, {})
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("iw failed")
+
+    device.executor.run = fail
+
+    with pytest.raises(RuntimeError):
+        configure(device, "JP", 6, {})
+    assert device.node_state.region is None and device.node_state.routes is None